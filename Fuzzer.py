@@ -1,29 +1,73 @@
+import contextlib
+import multiprocessing
 import os
+import queue
 import random
 import shlex
 import shutil
-import subprocess
+import threading
 import time
 
+import spawner
+
+from build_cache import report_caches
+from backends import FAIL, KILLED, MISMATCH, TIMEOUT, describe, rvDiffRunner
 from config import (
+    BACKENDS,
     CC,
+    CORPUS_SYNC_INTERVAL,
+    COVERAGE,
+    COVERAGE_MAP_SIZE,
+    DATA_MUTATION_ROUNDS,
     DIFF_SO_PATH,
+    DISTILL_INTERVAL,
     ELF2HEX,
     EMU_BINARY,
+    EMU_COVERAGE_ARG,
     FUZZ_EMU,
-    NEMU_BINARY,
+    MINIMIZE,
     OBJCOPY,
-    NEMU_TIMEOUT,
+    OPERATOR_SCHEDULE,
+    OPERATOR_STATE,
     NUM_ITER,
+    NUM_WORKERS,
+    PIPELINE,
+    PIPELINE_DEPTH,
+    PIPELINE_REPORT_INTERVAL,
+    RTL_COVERAGE,
+    SPAWNER,
+    TRIAGE,
+    TRIAGE_EXEMPLARS,
+    TRIAGE_MIN_EMU_RATE,
 )
+from coverage_map import environ_without_map, rvCoverageMap
+from distill import write_meta
+from minimize import rvMinimizer
 from mutator import rvMutator, simInput
+from pipeline import STOP, rvPipeline
 from preprocessor import rvPreProcessor
+from rtl_coverage import rvRtlCoverage
+from triage import rvTriage, signature
+
+# RTL cover points sit above the reference model's map in a seed's bits
+RTL_SHIFT = COVERAGE_MAP_SIZE * 8
 
 
 def save_mismatch(
-    base, proc_num, out, sim_input: simInput, data: list, num, generator_name="id_"
+    base,
+    proc_num,
+    out,
+    sim_input: simInput,
+    data: list,
+    num,
+    generator_name="id_",
+    report=None,
 ):  # , elf, asm, hexfile, mNum):
     sim_input.save(out + "/sim_input/{}_{}.si".format(generator_name, num), data)
+    if report is not None:
+        fd = open(out + "/report/{}_{}.txt".format(generator_name, num), "w")
+        fd.write(report)
+        fd.close()
 
     elf = base + "/.input_{}.elf".format(proc_num)
     asm = base + "/.input_{}.S".format(proc_num)
@@ -38,91 +82,572 @@ def save_mismatch(
         pass
 
 
-def run_nemu_test(proc_num: int, output_dir: str) -> int:
-    """执行NEMU测试并返回状态码"""
-    input_file = f"{output_dir}/.input_{proc_num}.bin"
-    cmd = shlex.split(f"{NEMU_BINARY} -b {input_file}")
+def run_backends(runner, proc_num, out, sim_input, data, counter, generator_name):
+    """在所有模拟器上运行用例, 返回第一个模拟器的状态码(超时为 -1), 运行时间和是否mismatch"""
+    status, results, divergence = runner.run(proc_num, out, sim_input)
+    ref = results[0]
+    if ref.status == TIMEOUT:
+        print(f"{ref.backend.upper()} timeout")
+    elif ref.status == KILLED:
+        print(f"{ref.backend.upper()} stopped at lock-step divergence")
+    elif ref.status == FAIL:
+        print(f"{ref.backend.upper()} fail returncode: {ref.returncode}")
 
-    try:
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=NEMU_TIMEOUT,
-            check=True,
+    if status == MISMATCH:
+        test_id = next_test_id(counter)
+        summary = ", ".join(f"{r.backend} {r.status}" for r in results)
+        print(f"[DifuzzDiff] worker [{proc_num}] iter [{test_id}] MISMATCH {summary}")
+        save_mismatch(
+            out,
+            proc_num,
+            f"{out}/diff_mismatch",
+            sim_input,
+            data,
+            test_id,
+            generator_name,
+            describe(results, divergence),
         )
-        return result.returncode
-    except subprocess.TimeoutExpired:
-        print("NEMU timeout")
-        return -1  # 超时状态码
-    except subprocess.CalledProcessError as e:
-        print(f"NEMU fail returncode: {e.returncode}")
-        return e.returncode
+    ret = -1 if ref.status == TIMEOUT else ref.returncode
+    return ret, ref.elapsed, status == MISMATCH
 
 
-# TODO
-# spike 和 nemu 软件覆盖引导
-def main():
-    num_iter = NUM_ITER
-    out = "output"
-    template = "Template"
-    if not os.path.isdir(out):
-        os.makedirs(out)
-    if not os.path.isdir(out + "/corpus"):
-        os.makedirs(out + "/corpus")
-        os.makedirs(out + "/corpus/sim_input")
-        os.makedirs(out + "/corpus/elf")
-        os.makedirs(out + "/corpus/asm")
-        os.makedirs(out + "/corpus/hex")
-        os.makedirs(out + "/corpus/bin")
-    if (FUZZ_EMU == 1) and (not os.path.isdir(out + "/emu_mismatch")):
-        os.makedirs(out + "/emu_mismatch")
-        os.makedirs(out + "/emu_mismatch/sim_input")
-        os.makedirs(out + "/emu_mismatch/elf")
-        os.makedirs(out + "/emu_mismatch/asm")
-        os.makedirs(out + "/emu_mismatch/hex")
-        os.makedirs(out + "/emu_mismatch/bin")
-    random.seed(time.time())
+def make_output_dirs(out):
+    for sub, enabled in [
+        ("corpus", True),
+        ("emu_mismatch", FUZZ_EMU == 1),
+        ("diff_mismatch", len(BACKENDS) > 1),
+    ]:
+        if enabled:
+            for kind in ["sim_input", "elf", "asm", "hex", "bin", "report"]:
+                os.makedirs(f"{out}/{sub}/{kind}", exist_ok=True)
+    # Coverage and cost of each seed, read by distill.py
+    os.makedirs(f"{out}/corpus/coverage", exist_ok=True)
+
+
+def next_test_id(counter):
+    with counter.get_lock():
+        num = counter.value
+        counter.value += 1
+    return num
+
+
+def claim_test_id(remaining, counter):
+    """通过参考模型的用例从共享预算中领取一个测试编号, 与是否加入corpus无关; 预算耗尽时返回 None"""
+    with remaining.get_lock():
+        if remaining.value <= 0:
+            return None
+        remaining.value -= 1
+    return next_test_id(counter)
+
+
+def run_emu_test(proc_num, output_dir: str, cov_name=None, capture=False):
+    """EMU状态码和输出(capture 时才收集)"""
+    input_bin = f"{output_dir}/.input_{proc_num}.bin"
+    cov_args = []
+    if cov_name is not None:
+        cov_args = shlex.split(EMU_COVERAGE_ARG.format(cov_name))
+    args = [EMU_BINARY, "--diff", DIFF_SO_PATH, "-i", input_bin] + cov_args
+    # The difftest reference must not report into the map of the NEMU runs
+    env = environ_without_map()
+    if not capture:
+        return spawner.call(args, stderr=spawner.DEVNULL, env=env), b""
+    result = spawner.run(args, stdout=spawner.PIPE, stderr=spawner.PIPE, env=env)
+    return result.returncode, result.stdout + result.stderr
+
+
+def check_emu(
+    proc_num,
+    out,
+    sim_input,
+    data,
+    test_id,
+    generator_name,
+    rtl=None,
+    triage=None,
+    lock=None,
+):
+    """运行EMU, 返回EMU状态码(已知bucket的重复失败记为 0), 本次新覆盖的RTL覆盖点数和覆盖位"""
+    key = (generator_name, sim_input.template)
+    if triage is not None and not triage.should_run(key):
+        return 0, 0, 0
+    cov_name = None
+    if rtl is not None:
+        cov_name = f"{out}/.input_{proc_num}.cov"
+        rtl.reset(cov_name)
+    emu_ret, output = run_emu_test(proc_num, out, cov_name, triage is not None)
+    if emu_ret != 0:
+        keep = True
+        report = None
+        if triage is not None:
+            sig = signature(output, f"{out}/.input_{proc_num}.elf", emu_ret)
+            keep = triage.record(sig, f"{generator_name}_{test_id}")
+            triage.ran(key, not keep)
+            report = describe_emu(sig, emu_ret, output)
+        if keep:
+            print(f"[DifuzzEMU] iter [{test_id}] FAIL")
+            save_mismatch(
+                out,
+                proc_num,
+                f"{out}/emu_mismatch",
+                sim_input,
+                data,
+                test_id,
+                generator_name,
+                report,
+            )
+        else:
+            print(f"[DifuzzEMU] iter [{test_id}] FAIL, known bucket: {sig}")
+            emu_ret = 0
+    else:
+        print(f"[DifuzzEMU] iter [{test_id}] PASS")
+        if triage is not None:
+            triage.ran(key, False)
+    rtl_new, rtl_bits = 0, 0
+    if rtl is not None:
+        # The gen stage merges imported seeds into the same map
+        with lock or contextlib.nullcontext():
+            rtl_new, rtl_bits = rtl.collect(cov_name)
+    return emu_ret, rtl_new, rtl_bits
+
+
+def describe_emu(sig, emu_ret, output):
+    # Text of the report saved with an EMU mismatch
+    tail = output.decode(errors="replace").splitlines()[-40:]
+    lines = [f"signature: {sig}\n", f"returncode {emu_ret}\n", "\n--- emu output ---\n"]
+    return "".join(lines + [line + "\n" for line in tail])
+
+
+def nemu_feedback(coverage, exec_time):
+    """覆盖引导: 命中新覆盖位的用例才是新用例, 模拟器没有写覆盖位图时都算新用例"""
+    feedback = {"novel": True, "found": 0, "bits": None, "exec_time": exec_time}
+    if coverage is not None:
+        bits = coverage.collect()
+        feedback["found"] = coverage.merge(bits)
+        feedback["novel"] = feedback["found"] > 0 or bits == 0
+        feedback["bits"] = bits
+    return feedback
+
+
+def admit_test(
+    mutator,
+    proc_num,
+    out,
+    sim_input,
+    data,
+    test_id,
+    generator_name,
+    feedback=None,
+):
+    print(f"[DifuzzNEMU] worker [{proc_num}] iter [{test_id}] PASS")
+    save_mismatch(
+        out,
+        proc_num,
+        f"{out}/corpus",
+        sim_input,
+        data,
+        test_id,
+        generator_name,
+    )
+    mutator.synced.add(f"{generator_name}_{test_id}.si")
+
+    if feedback is None:
+        mutator.add_corpus(sim_input)
+        return
+    # Coverage and cost of the seed, for distillation
+    if feedback["bits"] is not None:
+        write_meta(
+            f"{out}/corpus/coverage/{generator_name}_{test_id}.cov",
+            feedback["exec_time"],
+            sim_input.num_words,
+            feedback["bits"],
+        )
+    mutator.add_corpus(
+        sim_input, feedback["found"], feedback["exec_time"], feedback["bits"]
+    )
+
+
+def finish_test(
+    mutator,
+    proc_num,
+    out,
+    sim_input,
+    data,
+    test_id,
+    generator_name,
+    feedback,
+    rtl,
+    triage=None,
+    lock=None,
+):
+    """EMU检查每个通过参考模型的用例, 命中新的参考模型覆盖或RTL覆盖的用例加入corpus, 返回用例的奖励数"""
+    emu_ret, rtl_new, rtl_bits = 0, 0, 0
+    if FUZZ_EMU == 1:
+        emu_ret, rtl_new, rtl_bits = check_emu(
+            proc_num, out, sim_input, data, test_id, generator_name, rtl, triage, lock
+        )
+    if rtl is not None:
+        feedback["found"] += rtl_new
+        feedback["bits"] = (feedback["bits"] or 0) | rtl_bits << RTL_SHIFT
+    if feedback["novel"] or rtl_new:
+        with lock or contextlib.nullcontext():
+            admit_test(
+                mutator,
+                proc_num,
+                out,
+                sim_input,
+                data,
+                test_id,
+                generator_name,
+                feedback,
+            )
+    return test_rewards(feedback, emu_ret)
+
+
+def test_rewards(feedback, emu_ret):
+    # What a generator is credited with: new coverage and EMU mismatches
+    return int(feedback["found"] > 0) + int(emu_ret != 0)
+
+
+def make_triage(out):
+    if TRIAGE != 1 or FUZZ_EMU != 1:
+        return None
+    return rvTriage(f"{out}/emu_mismatch", TRIAGE_EXEMPLARS, TRIAGE_MIN_EMU_RATE)
+
+
+def sync_corpus(mutator, corpus_si, coverage=None, rtl=None):
+    """导入其他worker加入corpus的种子, 它们的覆盖位也算作本worker已覆盖"""
+    bits = mutator.sync_corpus(corpus_si)
+    if coverage is not None:
+        coverage.absorb(bits & ((1 << RTL_SHIFT) - 1))
+    if rtl is not None:
+        rtl.absorb(bits >> RTL_SHIFT)
+
+
+def report_distill(proc_num, mutator):
+    before = len(mutator.corpus)
+    evicted = mutator.distill()
+    print(
+        f"[DifuzzWorker] worker [{proc_num}] distilled corpus {before} -> "
+        f"{before - evicted} seeds"
+    )
+
+
+def report_worker(proc_num, preprocessors, runner, mutator, rtl, triage):
+    """worker结束时打印各部分的统计, 流水线模式下汇总所有槽位的preprocessor"""
+
+    def report(line):
+        print(f"[DifuzzWorker] worker [{proc_num}] {line}")
+
+    if any(p.fast_encode or p.num_fast for p in preprocessors):
+        fast = sum(p.num_fast for p in preprocessors)
+        fallback = sum(p.num_fallback for p in preprocessors)
+        report(f"{fast} fast builds, {fallback} fell back to gcc")
+    if any(p.template_objects for p in preprocessors):
+        built = sum(p.num_objects for p in preprocessors)
+        fallback = sum(p.num_object_fallback for p in preprocessors)
+        report(f"{built} object builds, {fallback} fell back to gcc")
+    caches = [p.cache for p in preprocessors if p.cache is not None]
+    if caches:
+        report(f"build cache {report_caches(caches)}")
+    for line in runner.report():
+        report(line)
+    if rtl is not None:
+        report(rtl.report())
+    if triage is not None:
+        report(triage.report())
+    report(mutator.schedule.report())
+    if mutator.bandit is not None:
+        report(f"generators {mutator.report_bandit()}")
+    if OPERATOR_SCHEDULE == 1:
+        report(mutator.operators.report())
+    if mutator.governor is not None:
+        report(mutator.governor.report())
+
+
+def fuzz_worker(proc_num, remaining, counter, out="output", template="Template"):
+    random.seed(time.time() + proc_num)
+    # Sets the map path in the environment, before the spawner copies it
+    coverage = rvCoverageMap(COVERAGE_MAP_SIZE) if COVERAGE == 1 else None
+    if SPAWNER == 1:
+        # Forked before the worker grows and before the pipeline starts threads
+        spawner.start()
+    if PIPELINE == 1:
+        fuzz_pipeline_worker(proc_num, remaining, counter, out, template, coverage)
+        return
+
     mutator = rvMutator(no_guide=0)
-    preprocessor = rvPreProcessor(CC, ELF2HEX, OBJCOPY, template, out, 0)
-    coverage_count = 0
-    while num_iter > 0:
+    if OPERATOR_SCHEDULE == 1:
+        mutator.operators.load(f"{out}/{OPERATOR_STATE}")
+    preprocessor = rvPreProcessor(CC, ELF2HEX, OBJCOPY, template, out, proc_num)
+    corpus_si = f"{out}/corpus/sim_input"
+    runner = rvDiffRunner(BACKENDS, coverage)
+    rtl = rvRtlCoverage() if RTL_COVERAGE == 1 and FUZZ_EMU == 1 else None
+    triage = make_triage(out)
+
+    it = 0
+    execs = 0
+    data_execs = 0
+    start = time.time()
+    while remaining.value > 0:
+        if it % CORPUS_SYNC_INTERVAL == 0:
+            sync_corpus(mutator, corpus_si, coverage, rtl)
+        if DISTILL_INTERVAL > 0 and it > 0 and it % DISTILL_INTERVAL == 0:
+            report_distill(proc_num, mutator)
+        it += 1
+
+        mutator.update_phase(it)
         sim_input, data, generator_name = mutator.get()
-        symbols, version = preprocessor.process(sim_input, data, False)
-        nemu_ret = run_nemu_test(0, out)
-        if nemu_ret == 0:
-            print(f"[DifuzzNEMU] iter [{coverage_count}] PASS")
-            save_mismatch(
+        test_start = time.time()
+        rewards = 0
+        try:
+            symbols, version = preprocessor.process(sim_input, data, False)
+            nemu_ret, exec_time, mismatch = run_backends(
+                runner, proc_num, out, sim_input, data, counter, generator_name
+            )
+            execs += 1
+            rewards += mismatch
+            if nemu_ret != 0:
+                continue
+            feedback = nemu_feedback(coverage, exec_time)
+
+            test_id = claim_test_id(remaining, counter)
+            if test_id is None:
+                break
+            rewards += finish_test(
+                mutator,
+                proc_num,
                 out,
-                0,
-                f"{out}/corpus",
                 sim_input,
                 data,
-                coverage_count,
+                test_id,
                 generator_name,
+                feedback,
+                rtl,
+                triage,
             )
-            mutator.add_corpus(sim_input)
-            coverage_count += 1
-            num_iter -= 1
-            if FUZZ_EMU == 1:
-                input_bin = f"{out}/.input_0.bin"
-                emu_ret = subprocess.call(
-                    [EMU_BINARY, "--diff", DIFF_SO_PATH, "-i", input_bin],
-                    stderr=subprocess.DEVNULL,
+
+            # Data only variants of a passing test, patched into the built image
+            for _ in range(DATA_MUTATION_ROUNDS):
+                variant, variant_data = mutator.mutate_data(sim_input, data)
+                if not preprocessor.patch_data(symbols, variant_data):
+                    break
+                nemu_ret, exec_time, mismatch = run_backends(
+                    runner,
+                    proc_num,
+                    out,
+                    variant,
+                    variant_data,
+                    counter,
+                    generator_name,
+                )
+                execs += 1
+                data_execs += 1
+                rewards += mismatch
+                if nemu_ret != 0:
+                    continue
+                feedback = nemu_feedback(coverage, exec_time)
+
+                test_id = claim_test_id(remaining, counter)
+                if test_id is None:
+                    break
+                rewards += finish_test(
+                    mutator,
+                    proc_num,
+                    out,
+                    variant,
+                    variant_data,
+                    test_id,
+                    generator_name,
+                    feedback,
+                    rtl,
+                    triage,
                 )
-                if emu_ret != 0:
-                    print(f"[DifuzzEMU] iter [{coverage_count}] FAIL")
-                    save_mismatch(
-                        out,
-                        0,
-                        f"{out}/emu_mismatch",
-                        sim_input,
-                        data,
-                        coverage_count,
-                        generator_name,
-                    )
-                else:
-                    print(f"[DifuzzEMU] iter [{coverage_count}] PASS")
+        finally:
+            # Build and run time of the test and its variants
+            mutator.credit(generator_name, sim_input, time.time() - test_start, rewards)
+
+    elapsed = max(time.time() - start, 1e-9)
+    print(
+        f"[DifuzzWorker] worker [{proc_num}] {execs} execs, "
+        f"{execs / elapsed:.2f} execs/s ({data_execs} data only)"
+    )
+    report_worker(proc_num, [preprocessor], runner, mutator, rtl, triage)
+    if OPERATOR_SCHEDULE == 1:
+        mutator.operators.save(f"{out}/{OPERATOR_STATE}")
+    runner.stop()
+    if coverage is not None:
+        coverage.close()
+
+
+def fuzz_pipeline_worker(proc_num, remaining, counter, out, template, coverage=None):
+    """gen -> build -> nemu -> emu 四级流水, 各级之间为有界队列"""
+    mutator = rvMutator(no_guide=0)
+    if OPERATOR_SCHEDULE == 1:
+        mutator.operators.load(f"{out}/{OPERATOR_STATE}")
+    mutator_lock = threading.Lock()
+    corpus_si = f"{out}/corpus/sim_input"
+
+    pipeline = rvPipeline(PIPELINE_DEPTH, PIPELINE_REPORT_INTERVAL)
+
+    # Every in-flight test owns a scratch slot .input_{proc_num}_{k}.*, which
+    # is only handed out again after the test left the last stage using it
+    free_slots = queue.Queue()
+    preprocessors = {}
+    # Only the nemu stage runs the backends
+    runner = rvDiffRunner(BACKENDS, coverage)
+    # With EMU, admission waits for the emu stage and its RTL coverage
+    rtl = rvRtlCoverage() if RTL_COVERAGE == 1 and FUZZ_EMU == 1 else None
+    triage = make_triage(out)
+    it = 0
+
+    def gen():
+        nonlocal it
+        if remaining.value <= 0:
+            return STOP
+        slot = free_slots.get()
+        with mutator_lock:
+            if it % CORPUS_SYNC_INTERVAL == 0:
+                sync_corpus(mutator, corpus_si, coverage, rtl)
+            if DISTILL_INTERVAL > 0 and it > 0 and it % DISTILL_INTERVAL == 0:
+                report_distill(proc_num, mutator)
+            it += 1
+            mutator.update_phase(it)
+            sim_input, data, generator_name = mutator.get()
+        return {
+            "slot": slot,
+            "sim_input": sim_input,
+            "data": data,
+            "generator_name": generator_name,
+            # Time spent in the build/nemu/emu stages and rewards, for the bandit
+            "cost": 0.0,
+            "rewards": 0,
+        }
+
+    def release(item):
+        with mutator_lock:
+            mutator.credit(
+                item["generator_name"],
+                item["sim_input"],
+                item["cost"],
+                item["rewards"],
+            )
+        free_slots.put(item["slot"])
+
+    def build(item):
+        start = time.time()
+        preprocessors[item["slot"]].process(item["sim_input"], item["data"], False)
+        item["cost"] += time.time() - start
+        return item
+
+    def nemu(item):
+        slot = item["slot"]
+        start = time.time()
+        nemu_ret, exec_time, mismatch = run_backends(
+            runner,
+            slot,
+            out,
+            item["sim_input"],
+            item["data"],
+            counter,
+            item["generator_name"],
+        )
+        item["rewards"] += mismatch
+        test_id = None
+        if nemu_ret == 0:
+            with mutator_lock:
+                item["feedback"] = nemu_feedback(coverage, exec_time)
+            test_id = claim_test_id(remaining, counter)
+        item["cost"] += time.time() - start
+        if test_id is None:
+            release(item)
+            return None
+
+        item["test_id"] = test_id
+        if FUZZ_EMU == 1:
+            return item
+        # Without EMU the test is done here
+        return emu(item)
+
+    def emu(item):
+        start = time.time()
+        item["rewards"] += finish_test(
+            mutator,
+            item["slot"],
+            out,
+            item["sim_input"],
+            item["data"],
+            item["test_id"],
+            item["generator_name"],
+            item["feedback"],
+            rtl,
+            triage,
+            mutator_lock,
+        )
+        item["cost"] += time.time() - start
+        release(item)
+        return None
+
+    pipeline.add_stage("gen", gen)
+    pipeline.add_stage("build", build)
+    pipeline.add_stage("nemu", nemu)
+    if FUZZ_EMU == 1:
+        pipeline.add_stage("emu", emu)
+
+    for k in range(pipeline.in_flight()):
+        slot = f"{proc_num}_{k}"
+        preprocessors[slot] = rvPreProcessor(CC, ELF2HEX, OBJCOPY, template, out, slot)
+        free_slots.put(slot)
+    pipeline.run()
+
+    report_worker(proc_num, list(preprocessors.values()), runner, mutator, rtl, triage)
+    if OPERATOR_SCHEDULE == 1:
+        mutator.operators.save(f"{out}/{OPERATOR_STATE}")
+    runner.stop()
+    if coverage is not None:
+        coverage.close()
+
+
+def main():
+    out = "output"
+    template = "Template"
+    num_workers = NUM_WORKERS if NUM_WORKERS > 0 else os.cpu_count()
+    make_output_dirs(out)
+
+    # 所有worker共享迭代预算与测试编号, 保证corpus/mismatch文件名不冲突
+    remaining = multiprocessing.Value("i", NUM_ITER)
+    counter = multiprocessing.Value("i", 0)
+    if num_workers == 1:
+        fuzz_worker(0, remaining, counter, out, template)
+    else:
+        workers = [
+            multiprocessing.Process(
+                target=fuzz_worker, args=(n, remaining, counter, out, template)
+            )
+            for n in range(num_workers)
+        ]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = max(time.time() - start, 1e-9)
+        print(
+            f"[DifuzzFuzzer] {num_workers} workers, {counter.value} tests "
+            f"in {elapsed:.1f}s"
+        )
+
+    if MINIMIZE == 1:
+        minimize_mismatches(out, template)
+
+
+def minimize_mismatches(out, template):
+    """把还没有最小化的mismatch逐个做ddmin"""
+    for kind, enabled in [("emu", FUZZ_EMU == 1), ("diff", len(BACKENDS) > 1)]:
+        if not enabled:
+            continue
+        minimizer = rvMinimizer(kind, out, template)
+        minimizer.minimize_dir(f"{out}/{kind}_mismatch")
+        minimizer.stop()
 
 
 if __name__ == "__main__":
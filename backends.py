@@ -0,0 +1,313 @@
+import shlex
+import threading
+import time
+from collections import namedtuple
+
+import spawner
+
+from config import (
+    DIFF_SO_PATH,
+    EMU_BINARY,
+    LOCKSTEP,
+    LOCKSTEP_START,
+    NEMU_BINARY,
+    NEMU_MAX_INSTR,
+    NEMU_MAX_INSTR_ARG,
+    NEMU_SERVER,
+    NEMU_SERVER_CMD,
+    NEMU_TIMEOUT,
+    NEMU_TRACE_ARG,
+    SPIKE,
+    SPIKE_ISA_ARG,
+    SPIKE_TIMEOUT,
+    SPIKE_TRACE_ARG,
+)
+from coverage_map import environ_without_map
+from lockstep import rvLockstep
+from nemu_server import rvNemuServer
+from timeouts import rvTimeouts, size_class
+
+""" Simulator backends
+
+A backend knows which image of a test it runs (.bin or .elf), the command
+line, its timeout and how to turn the outcome into a status.  rvDiffRunner
+runs the backends selected by BACKENDS on the same image at the same time;
+the first one is the reference that decides whether a test enters the
+corpus, and a pass/fail disagreement between any two of them is a mismatch.
+With LOCKSTEP the first two instead stream their commit logs into
+lockstep.rvLockstep and any divergence of the traces is a mismatch.
+"""
+
+PASS = "pass"
+FAIL = "fail"
+TIMEOUT = "timeout"
+KILLED = "killed"
+MISMATCH = "mismatch"
+
+BackendResult = namedtuple("BackendResult", "backend status returncode elapsed output")
+
+
+class rvBackend:
+    name = None
+    artifact = "bin"
+    stdout = spawner.PIPE
+    stderr = spawner.PIPE
+    # Arguments that print a Spike style commit log, None if not supported
+    trace_args = None
+    trace_stream = "stdout"
+
+    def __init__(self, timeout=None):
+        # Backends with a timeout learn per test class how long a run takes
+        self.max_timeout = timeout
+        self.timeouts = rvTimeouts(timeout) if timeout else None
+
+    def image(self, proc_num, out):
+        return f"{out}/.input_{proc_num}.{self.artifact}"
+
+    def command(self, image, trace=False):
+        raise NotImplementedError
+
+    def env(self):
+        # Environment of the run, None for the fuzzer's own
+        return None
+
+    def execute(self, image, timeout):
+        result = spawner.run(
+            self.command(image),
+            timeout=timeout,
+            stdout=self.stdout,
+            stderr=self.stderr,
+            env=self.env(),
+        )
+        return result.returncode, result.timed_out, result.stdout + result.stderr
+
+    def trace(self, proc_num, out, sim_input=None):
+        """(command, stream) that streams the commit log of the test"""
+        return self.command(self.image(proc_num, out), True), self.trace_stream
+
+    def parse(self, returncode, timed_out, output):
+        if timed_out:
+            return TIMEOUT
+        return PASS if returncode == 0 else FAIL
+
+    def run(self, proc_num, out, sim_input=None):
+        key = size_class(sim_input) if sim_input is not None else None
+        timeout = None
+        if self.timeouts is not None:
+            timeout = self.timeouts.timeout(key)
+
+        start = time.time()
+        returncode, timed_out, output = self.execute(self.image(proc_num, out), timeout)
+        elapsed = time.time() - start
+        if self.timeouts is not None and key is not None:
+            self.timeouts.record(key, elapsed, timed_out)
+
+        status = self.parse(returncode, timed_out, output)
+        return BackendResult(self.name, status, returncode, elapsed, output)
+
+    def report(self):
+        if self.timeouts is None:
+            return ""
+        return self.timeouts.report()
+
+    def stop(self):
+        pass
+
+
+class rvNemuBackend(rvBackend):
+    name = "nemu"
+    trace_args = NEMU_TRACE_ARG
+
+    def __init__(self, timeout=NEMU_TIMEOUT):
+        super().__init__(timeout)
+        self.server = None
+        if NEMU_SERVER == 1:
+            self.server = rvNemuServer(NEMU_SERVER_CMD + self.limit_args())
+
+    def limit_args(self):
+        if NEMU_MAX_INSTR > 0 and NEMU_MAX_INSTR_ARG:
+            return " " + NEMU_MAX_INSTR_ARG.format(NEMU_MAX_INSTR)
+        return ""
+
+    def command(self, image, trace=False):
+        args = shlex.split(f"{NEMU_BINARY}{self.limit_args()}")
+        if trace:
+            args += shlex.split(self.trace_args)
+        return args + ["-b", image]
+
+    def execute(self, image, timeout):
+        if self.server is not None:
+            ret = self.server.run(image, timeout or NEMU_TIMEOUT)
+            if ret is not None:
+                return ret, ret == -1, b""
+        return super().execute(image, timeout)
+
+    def report(self):
+        if self.server is None:
+            return super().report()
+        return "{}, server {}".format(super().report(), self.server.report())
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+
+
+class rvSpikeBackend(rvBackend):
+    # Spike loads the ELF and stops on the template's tohost write
+    name = "spike"
+    artifact = "elf"
+    trace_args = SPIKE_TRACE_ARG
+    trace_stream = "stderr"
+
+    def __init__(self, timeout=SPIKE_TIMEOUT):
+        super().__init__(timeout)
+
+    def command(self, image, trace=False):
+        args = [SPIKE] + shlex.split(SPIKE_ISA_ARG)
+        if trace:
+            args += shlex.split(self.trace_args)
+        return args + [image]
+
+
+class rvEmuBackend(rvBackend):
+    # XiangShan emu with NEMU as difftest reference
+    name = "emu"
+    stderr = spawner.DEVNULL
+
+    def command(self, image, trace=False):
+        return [EMU_BINARY, "--diff", DIFF_SO_PATH, "-i", image]
+
+    def env(self):
+        # The difftest NEMU .so must not report into the reference model's map
+        return environ_without_map()
+
+
+BACKEND_CLASSES = {
+    "nemu": rvNemuBackend,
+    "spike": rvSpikeBackend,
+    "emu": rvEmuBackend,
+}
+
+
+def verdict(results):
+    # Timeouts say nothing about the test, only completed runs are compared
+    done = {result.status for result in results if result.status != TIMEOUT}
+    if PASS in done and FAIL in done:
+        return MISMATCH
+    return results[0].status
+
+
+class rvDiffRunner:
+    def __init__(self, names, coverage=None):
+        for name in names:
+            assert name in BACKEND_CLASSES, "Unknown backend {}".format(name)
+        assert names, "At least one backend is required"
+        self.backends = [BACKEND_CLASSES[name]() for name in names]
+        self.mismatches = 0
+        # coverage.rvCoverageMap the backends report into, cleared before each run
+        self.coverage = coverage
+
+        self.lockstep = None
+        if LOCKSTEP == 1:
+            assert len(self.backends) >= 2, "Lock-step needs two backends"
+            for backend in self.backends[:2]:
+                assert backend.trace_args is not None, "{} can't trace".format(
+                    backend.name
+                )
+            self.lockstep = rvLockstep(LOCKSTEP_START)
+
+    def run_lockstep(self, proc_num, out, sim_input):
+        pair = self.backends[:2]
+        commands, streams = zip(*[b.trace(proc_num, out, sim_input) for b in pair])
+        timeout = max(backend.max_timeout or 0 for backend in pair) or None
+        divergence, streamed = self.lockstep.run(
+            [backend.name for backend in pair], commands, streams, timeout
+        )
+
+        results = []
+        for backend, result in zip(pair, streamed):
+            if result.killed:
+                status = KILLED
+            else:
+                status = backend.parse(result.returncode, result.timed_out, b"")
+            results.append(
+                BackendResult(
+                    backend.name, status, result.returncode, result.elapsed, b""
+                )
+            )
+        return results, divergence
+
+    def run(self, proc_num, out, sim_input=None):
+        """(verdict, results in backend order, lock-step divergence or None)"""
+        results = [None] * len(self.backends)
+        divergence = []
+        errors = []
+        if self.coverage is not None:
+            self.coverage.reset()
+
+        def run_one(i):
+            try:
+                results[i] = self.backends[i].run(proc_num, out, sim_input)
+            except BaseException as e:
+                errors.append(e)
+
+        def run_pair():
+            try:
+                results[:2], found = self.run_lockstep(proc_num, out, sim_input)
+                if found is not None:
+                    divergence.append(found)
+            except BaseException as e:
+                errors.append(e)
+
+        jobs = [(run_one, (i,)) for i in range(len(self.backends))]
+        if self.lockstep is not None:
+            jobs = [(run_pair, ())] + jobs[2:]
+
+        if len(jobs) == 1:
+            jobs[0][0](*jobs[0][1])
+        else:
+            threads = [threading.Thread(target=job, args=args) for job, args in jobs]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+        status = MISMATCH if divergence else verdict(results)
+        if status == MISMATCH:
+            self.mismatches += 1
+        return status, results, divergence[0] if divergence else None
+
+    def report(self):
+        lines = [
+            "{} {}".format(backend.name, backend.report()) for backend in self.backends
+        ]
+        if self.lockstep is not None:
+            lines.append(self.lockstep.report())
+        if len(self.backends) > 1:
+            lines.append("{} mismatches".format(self.mismatches))
+        if self.coverage is not None:
+            lines.append(self.coverage.report())
+        return lines
+
+    def stop(self):
+        for backend in self.backends:
+            backend.stop()
+
+
+def describe(results, divergence=None):
+    # Text of the report saved with a mismatch
+    lines = [divergence + "\n"] if divergence is not None else []
+    for result in results:
+        lines.append(
+            "{:<6} {:<8} returncode {:<4} {:.3f}s\n".format(
+                result.backend, result.status, result.returncode, result.elapsed
+            )
+        )
+    for result in results:
+        tail = result.output.decode(errors="replace").splitlines()[-20:]
+        if tail:
+            lines.append("\n--- {} output ---\n".format(result.backend))
+            lines += [line + "\n" for line in tail]
+    return "".join(lines)
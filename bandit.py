@@ -0,0 +1,61 @@
+import random
+
+""" Generator selection as a multi-armed bandit
+
+Every generator is an arm whose payoff is a rate: rewards (tests that hit
+new coverage, mismatches) per CPU-second spent on its tests.  The rate
+of an arm gets a Gamma posterior, the conjugate prior of a Poisson rate,
+and each pick is a Thompson draw: sample a rate per arm, take the best.
+
+The static GENERATOR_SELECTOR weights are the prior: an arm with weight
+0 is never picked, the others start with pseudo-rewards in proportion
+to their weight, spread over `prior_seconds`.  Old evidence decays by
+DISCOUNT per credit, since a generator's payoff drops as the coverage it
+can reach gets saturated.
+"""
+
+DISCOUNT = 0.999
+
+
+class rvBandit:
+    def __init__(self, priors, prior_seconds):
+        self.arms = [i for i, weight in enumerate(priors) if weight > 0]
+        assert self.arms, "No generator enabled"
+        total = sum(priors[i] for i in self.arms)
+        # Mean weight of the enabled arms is one pseudo-reward
+        self.prior_rewards = [
+            weight * len(self.arms) / total if weight > 0 else 0 for weight in priors
+        ]
+        self.prior_seconds = prior_seconds
+
+        self.rewards = [0.0] * len(priors)
+        self.seconds = [0.0] * len(priors)
+        self.pulls = [0] * len(priors)
+
+    def sample(self, arm):
+        shape = self.prior_rewards[arm] + self.rewards[arm]
+        rate = self.prior_seconds + self.seconds[arm]
+        return random.gammavariate(shape, 1 / rate)
+
+    def pick(self, arms=None):
+        """Thompson draw among `arms` (default: all enabled arms)"""
+        return max(arms or self.arms, key=self.sample)
+
+    def credit(self, arm, seconds, rewards):
+        for i in self.arms:
+            self.rewards[i] *= DISCOUNT
+            self.seconds[i] *= DISCOUNT
+        self.rewards[arm] += rewards
+        self.seconds[arm] += seconds
+        self.pulls[arm] += 1
+
+    def report(self, names):
+        return ", ".join(
+            "{} {} tests {:.2f}/s".format(
+                names[i],
+                self.pulls[i],
+                (self.prior_rewards[i] + self.rewards[i])
+                / (self.prior_seconds + self.seconds[i]),
+            )
+            for i in self.arms
+        )
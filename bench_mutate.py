@@ -0,0 +1,83 @@
+import argparse
+import random
+import time
+
+from mutator import CLEAR, INSERT, KEEP_WORD, MAIN, REPLACE, SHUFFLE, rvMutator
+from operators import OPERATORS
+
+""" mutate_words benchmark
+
+Times rvMutator.mutate_words against the list-based version it replaced,
+which appended/inserted into a Python list word by word (insert and
+shuffle are O(n), so a mutation was O(n^2)), on seeds of growing length.
+
+    python bench_mutate.py
+    python bench_mutate.py --sizes 100 1000 20000 --iters 20
+"""
+
+
+def mutate_words_list(mutator, seed_words, part, max_num):
+    words = []
+
+    for word in seed_words:
+        if random.random() < KEEP_WORD:
+            words.append(word)
+            continue
+
+        op = mutator.operators.pick()
+        mutator.ops[op] += 1
+        if op == INSERT:
+            words.append(word)
+            k = random.randint(0, 10)
+            while k > 0:
+                new_word = mutator.inst_generator().get_word(part)
+                words.append(new_word)
+                k -= 1
+        elif op == REPLACE:
+            new_word = mutator.inst_generator().get_word(part)
+            words.append(new_word)
+        elif op == CLEAR:
+            words.clear()
+            words.append(word)
+        elif op == SHUFFLE:
+            words.append(word)
+            random.shuffle(words)
+        else:
+            words.insert(random.randint(0, len(words)), word)
+    words = words[0:max_num]
+    words = mutator.reset_labels(words, part)
+
+    return words
+
+
+def seed_words(mutator, num_words):
+    mutator.num_words = num_words
+    sim_input, _, _ = mutator.get()
+    return sim_input.words
+
+
+def bench(mutate, mutator, words, iters):
+    start = time.perf_counter()
+    for _ in range(iters):
+        mutator.ops = [0] * len(OPERATORS)
+        mutate(mutator, words, MAIN, len(words))
+    return (time.perf_counter() - start) / iters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 20000])
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    opts = parser.parse_args()
+
+    random.seed(opts.seed)
+    mutator = rvMutator()
+    for size in opts.sizes:
+        words = seed_words(mutator, size)
+        old = bench(mutate_words_list, mutator, words, opts.iters)
+        new = bench(rvMutator.mutate_words, mutator, words, opts.iters)
+        print(
+            f"[DifuzzBench] {size:6d} words: list {old * 1e3:9.2f} ms, "
+            f"linear {new * 1e3:9.2f} ms ({old / new:.1f}x)"
+        )
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import shutil
+
+""" Content-addressed cache of built test images
+
+Mutation and crossover often regenerate a program that was already built.
+Entries are keyed by a hash of everything the build depends on (assembly,
+template sources, toolchain binaries and flags) and hold the ELF, bin, hex
+and symbol table, so a hit skips every toolchain process.
+
+The cache lives in a directory that is shared by all workers and survives
+campaigns.  Recently used entries are kept: a hit touches the entry, and
+when the cache grows over its size cap the least recently used entries are
+removed.
+"""
+
+KINDS = ["elf", "bin", "hex", "symbols"]
+
+
+def file_digest(path):
+    # Identify a file by its contents, fall back to the name if it is missing
+    if not os.path.isfile(path):
+        return path.encode()
+
+    h = hashlib.sha256()
+    fd = open(path, "rb")
+    for chunk in iter(lambda: fd.read(1 << 20), b""):
+        h.update(chunk)
+    fd.close()
+    return h.digest()
+
+
+def dir_digest(path):
+    h = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(path)):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            h.update(os.path.relpath(full, path).encode())
+            h.update(file_digest(full))
+    return h.digest()
+
+
+class rvBuildCache:
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = self.scan()[1]
+
+    def key(self, *parts):
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        return h.hexdigest()
+
+    def entry(self, key, kind):
+        return os.path.join(self.path, "{}.{}".format(key, kind))
+
+    def lookup(self, key, files):
+        """Copy the entry to files = {kind: path}, False on a miss"""
+        elf = self.entry(key, "elf")
+        try:
+            for kind, dest in files.items():
+                shutil.copyfile(self.entry(key, kind), dest)
+            os.utime(elf)
+        except FileNotFoundError:
+            # Not built yet, or (partly) evicted by another worker
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def store(self, key, files):
+        # Only complete builds are cached, a lookup needs every kind
+        if not all(os.path.isfile(src) for src in files.values()):
+            return
+
+        # The elf is written last, it marks the entry as complete
+        for kind in sorted(files, key=lambda kind: kind == "elf"):
+            src = files[kind]
+            dest = self.entry(key, kind)
+            tmp = "{}.{}.tmp".format(dest, os.getpid())
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dest)
+            self.size += os.path.getsize(dest)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def scan(self):
+        entries = {}
+        size = 0
+        for name in os.listdir(self.path):
+            key, _, kind = name.partition(".")
+            if kind not in KINDS:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            mtime, total = entries.get(key, (0, 0))
+            if kind == "elf":
+                mtime = stat.st_mtime
+            entries[key] = (mtime, total + stat.st_size)
+            size += stat.st_size
+        return (entries, size)
+
+    def evict(self):
+        # Drop least recently used entries down to 90% of the cap
+        entries, self.size = self.scan()
+        for key, (mtime, total) in sorted(entries.items(), key=lambda x: x[1][0]):
+            if self.size <= 0.9 * self.max_size:
+                break
+            for kind in KINDS:
+                try:
+                    os.remove(self.entry(key, kind))
+                except FileNotFoundError:
+                    pass
+            self.size -= total
+            self.evictions += 1
+
+    def report(self):
+        return report_caches([self])
+
+
+def report_caches(caches):
+    # Caches of one worker share the directory, its size is counted once
+    hits = sum(cache.hits for cache in caches)
+    misses = sum(cache.misses for cache in caches)
+    return "hits {}, misses {} ({:.1f}% hit), evictions {}, size {:.1f}MB".format(
+        hits,
+        misses,
+        100 * hits / max(hits + misses, 1),
+        sum(cache.evictions for cache in caches),
+        max(cache.size for cache in caches) / (1 << 20),
+    )
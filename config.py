@@ -3,22 +3,70 @@ CC_ARCH = "-march=rv64gcvh_zicbop_zicbom_zicboz"
 # CC_ARCH = "-march=rv64gcv"
 ELF2HEX = "/nfs/home/changgen/local/bin/riscv64-unknown-elf-elf2hex"
 OBJCOPY = "/nfs/home/changgen/local/bin/riscv64-unknown-linux-gnu-objcopy"
-# SPIKE = "/nfs/home/changgen/riscv-isa-sim/build/spike"
-# SPIKE_ISA_ARG = "--isa=rv64imafdcvh_zicntr_zihpm_zicbom_zicboz_zicbop"
+SPIKE = "/nfs/home/changgen/riscv-isa-sim/build/spike"
+SPIKE_ISA_ARG = "--isa=rv64imafdcvh_zicntr_zihpm_zicbom_zicboz_zicbop"
+SPIKE_TIMEOUT = 1  # 秒
+SPIKE_TRACE_ARG = "-l --log-commits"  # 输出提交日志(在stderr)的Spike参数
 
 FUZZ_EMU = 0
 EMU_BINARY = "/nfs/home/changgen/xs-env/XiangShan/build/emu"
 DIFF_SO_PATH = "/nfs/home/changgen/xs-env/NEMU/ready-to-run/riscv64-nemu-interpreter-so"
+# 1: emu每次运行导出覆盖率, 命中新RTL覆盖点的用例也加入corpus并提高被选中的权重
+RTL_COVERAGE = 0
+EMU_COVERAGE_ARG = "--dump-coverage {}"  # 让emu把覆盖计数器写到{}的参数, 原始uint32数组或Verilator coverage.dat
 
 Fuzz_NEMU = 1
 NEMU_BINARY = "/nfs/home/changgen/xs-env/NEMU/build/riscv64-nemu-interpreter"
-NEMU_TIMEOUT = 1  # 秒
+# 秒, 超时上限; 积累足够样本后按同模板同规模用例运行时间的P99自适应缩短
+NEMU_TIMEOUT = 1
+NEMU_MAX_INSTR = 0  # NEMU最多执行的指令数, 0 表示不限制
+NEMU_MAX_INSTR_ARG = "-I {}"  # 设置指令数上限的NEMU参数, 不支持时设为 ""
+# 1: 常驻NEMU进程通过管道接收镜像并返回退出码, 不可用时回退到每次启动NEMU
+NEMU_SERVER = 0
+NEMU_SERVER_CMD = f"{NEMU_BINARY} --server"  # 本地可用 "python3 nemu_stub.py --server"
+NEMU_TRACE_ARG = "--log-commits"  # 输出Spike格式提交日志的NEMU参数
+
+# 每个用例在同一镜像上并行运行的模拟器, 可选 "nemu", "spike", "emu"
+# 第一个决定用例是否加入corpus, 多个模拟器通过/失败不一致时存入 diff_mismatch
+BACKENDS = ["nemu"]
+LOCKSTEP = 0  # 1: 逐条比较前两个模拟器的提交日志(PC/指令/寄存器写回), 第一处不一致即结束两个进程
+LOCKSTEP_START = 0x80000000  # 从第一条该PC的提交开始比较, 跳过各模拟器自己的启动代码
+COVERAGE = 0  # 1: 参考模型把覆盖位图写入共享内存(路径在环境变量 DIFUZZ_COVERAGE_MAP), 只有命中新覆盖的用例加入corpus
+COVERAGE_MAP_SIZE = 1 << 16  # 字节
 
 NUM_ITER = 3000
+NUM_WORKERS = 1  # 并行fuzz进程数, 0 表示使用全部CPU核
+CORPUS_SYNC_INTERVAL = 50  # 每隔多少次迭代导入其他worker加入corpus的种子
+DISTILL_INTERVAL = 0  # 每隔多少次迭代对内存中的corpus做一次蒸馏(保留覆盖全部覆盖位的最小代价种子集合), 0 表示不做
+PIPELINE = 0  # 1: 生成/编译/NEMU/EMU 流水线并行执行
+PIPELINE_DEPTH = 2  # 流水线各级之间队列深度
+PIPELINE_REPORT_INTERVAL = 60  # 秒, 打印各级队列深度与等待时间
+SPAWNER = 0  # 1: worker启动时fork一个小的辅助进程, 由它posix_spawn编译器和模拟器; Python<3.10 时收益明显
+MINIMIZE = 0  # 1: 运行结束后用ddmin最小化本次发现的mismatch, 结果保存在 <mismatch目录>/minimized
+MINIMIZE_WORKERS = 0  # 最小化时并行评估候选用例的线程数, 0 表示CPU核数
+MINIMIZE_EMU_TIMEOUT = 60  # 秒, 最小化时每次EMU运行的上限, 删掉指令后的候选可能死循环
+TRIAGE = 0  # 1: EMU失败按difftest输出的特征分桶, 每个桶只保存前 TRIAGE_EXEMPLARS 个用例, 计数在 emu_mismatch/index.json
+TRIAGE_EXEMPLARS = 3  # 每个桶保存的用例数
+TRIAGE_MIN_EMU_RATE = 0.2  # 常撞已知桶的生成器/模板组合, EMU运行概率最低降到多少
+# 1: 进程内编码fuzz指令并直接写入预先链接好的模板镜像, 不认识的指令回退到gcc
+FAST_ENCODE = 0
+FAST_ENCODE_RESERVE = {  # 字节, 模板中为每段fuzz指令预留的空间
+    "_fuzz_prefix": 0x1000,
+    "_fuzz_main": 0x20000,
+    "_fuzz_suffix": 0x1000,
+}
+FAST_ENCODE_VALIDATE = 100  # 每隔多少个用例用gcc重新编译一次并比较镜像, 0 表示不检查
+TEMPLATE_OBJECTS = 0  # 1: 模板只汇编一次, 每个用例只汇编fuzz指令和数据再用ld链接
+# MB, 输出目录下 .build_cache 中缓存已编译镜像, 0 表示不使用缓存
+BUILD_CACHE_SIZE = 0
+# 每个通过NEMU的用例再做多少次仅数据变异(直接改写镜像, 不重新编译), 仅串行模式
+DATA_MUTATION_ROUNDS = 0
 CORPUS_SIZE = 300
+SEED_AGE_HALF_LIFE = 500  # 种子能量中新种子加成减半所需的选种次数
 NUM_PREFIX = 0
 NUM_WORDS = 100
 NUM_SUFFIX = 0
+TEST_TIME_BUDGET = 0  # 秒, 每个用例(编译+运行)的时间预算, 按模板选择程序长度; 0 表示每加入一个用例 NUM_WORDS 加一
 
 # 把希望生成的类型设置为1即可
 GENERATOR_SELECTOR = [
@@ -36,3 +84,8 @@ GENERATOR_SELECTOR = [
     0,  # CBOGenerator("RV64G"),
     0,  # TODO VectorGenerator
 ]
+GENERATOR_BANDIT = 0  # 1: 按每CPU秒的新覆盖/mismatch数在线调整生成器选择(Thompson采样), GENERATOR_SELECTOR 作为先验, 权重为0的生成器不会被选中
+BANDIT_PRIOR_SECONDS = 10  # 先验相当于多少秒的观测
+OPERATOR_SCHEDULE = 0  # 1: 按每个变异算子的收益在线调整 mutate_words 的算子概率(MOpt), 结果保存在输出目录下, 下次运行时载入
+OPERATOR_PERIOD = 50  # 每个粒子评估多少个变异用例后更新一次
+OPERATOR_STATE = "mutation_operators.json"  # 输出目录下保存算子概率的文件
@@ -0,0 +1,115 @@
+import mmap
+import os
+import tempfile
+
+""" Coverage feedback from the reference model
+
+The emulator finds the path of a shared memory map in DIFUZZ_COVERAGE_MAP,
+maps it and bumps one byte per event it wants to report: control flow
+edges, opcodes, CSR numbers, exception causes, each hashed into the map.
+The fuzzer clears the map before a run and reads it back afterwards.
+
+Like AFL, hit counts are folded into buckets (1, 2, 3, 4-7, ... 128+), one
+bit per bucket, which turns the map into a single big integer.  Checking
+a run for new coverage and merging it are then two big-int operations on
+the whole map instead of a loop over its bytes.
+"""
+
+ENV = "DIFUZZ_COVERAGE_MAP"
+
+
+def bucket(count):
+    if count == 0:
+        return 0
+    for bit, limit in enumerate([1, 2, 3, 7, 15, 31, 127, 255]):
+        if count <= limit:
+            return 1 << bit
+
+
+def environ_without_map():
+    """The environment for children that must not report into the map"""
+    env = dict(os.environ)
+    env.pop(ENV, None)
+    return env
+
+
+BUCKETS = bytes(bucket(count) for count in range(256))
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    # int.bit_count is Python 3.10+
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+class rvCoverageMap:
+    def __init__(self, size, name=None):
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        if name is None:
+            name = "difuzz_coverage_{}".format(os.getpid())
+        self.path = os.path.join(shm, name)
+        self.size = size
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(fd, size)
+        self.map = mmap.mmap(fd, size)
+        os.close(fd)
+        self.zero = bytes(size)
+        # Children started from now on find the map in their environment
+        os.environ[ENV] = self.path
+
+        # Every bucket bit any run has hit so far
+        self.virgin = 0
+        self.runs = 0
+        self.novel_runs = 0
+        self.silent_runs = 0
+
+    def reset(self):
+        self.map[:] = self.zero
+
+    def collect(self):
+        """Bucketed hit bits of the last run as an int"""
+        return int.from_bytes(self.map[:].translate(BUCKETS), "little")
+
+    def novel(self, bits):
+        return bits & ~self.virgin
+
+    def merge(self, bits):
+        """Add a run's bits, the number of new bits it had"""
+        new = bits & ~self.virgin
+        self.runs += 1
+        if bits == 0:
+            # The emulator wrote nothing, it likely has no coverage support
+            self.silent_runs += 1
+        if not new:
+            return 0
+        self.novel_runs += 1
+        self.virgin |= new
+        return popcount(new)
+
+    def absorb(self, bits):
+        # Bits another worker found, runs that only hit those aren't new
+        self.virgin |= bits
+
+    def report(self):
+        return "coverage {} bits, {} of {} runs found new bits{}".format(
+            popcount(self.virgin),
+            self.novel_runs,
+            self.runs,
+            (
+                ", {} runs reported nothing".format(self.silent_runs)
+                if self.silent_runs
+                else ""
+            ),
+        )
+
+    def close(self):
+        self.map.close()
+        if os.environ.get(ENV) == self.path:
+            del os.environ[ENV]
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,120 @@
+import argparse
+import heapq
+import os
+import shutil
+import struct
+
+from coverage_map import popcount
+
+""" Corpus distillation
+
+Every admitted seed records the coverage bits of its run, its run time
+and its size (corpus/coverage/<name>.cov).  Distillation keeps a small
+favored set that still covers every bit any seed covers: a weighted
+greedy set cover where a seed's cost is run time times size, so among
+seeds covering the same bits the fast and short ones win.  Seeds without
+a coverage record are always kept.
+
+The fuzzer distills its in-memory corpus every DISTILL_INTERVAL
+iterations; `python distill.py output/corpus` distills a corpus
+directory, moving evicted seeds to output/corpus_evicted.
+"""
+
+META = struct.Struct("<dI")
+KINDS = ["sim_input", "elf", "asm", "hex", "bin", "coverage"]
+SUFFIXES = {"sim_input": "si", "asm": "S", "coverage": "cov"}
+
+
+def cost(exec_time, size):
+    return max(exec_time, 1e-6) * max(size, 1)
+
+
+def write_meta(name, exec_time, size, bits):
+    fd = open(name, "wb")
+    fd.write(META.pack(exec_time, size))
+    fd.write(bits.to_bytes((bits.bit_length() + 7) // 8, "little"))
+    fd.close()
+
+
+def read_meta(name):
+    """(exec_time, size, bits)"""
+    fd = open(name, "rb")
+    raw = fd.read()
+    fd.close()
+    exec_time, size = META.unpack_from(raw)
+    return exec_time, size, int.from_bytes(raw[META.size :], "little")
+
+
+def greedy_cover(entries):
+    """Indices of a cheap subset of entries = [(bits, cost)] covering all bits"""
+    # Lazy greedy: the gain of a seed only shrinks as the cover grows, so a
+    # stale heap key is an upper bound and most seeds are never re-counted
+    heap = [(-popcount(bits) / c, i) for i, (bits, c) in enumerate(entries) if bits]
+    heapq.heapify(heap)
+
+    covered = 0
+    chosen = []
+    while heap:
+        _, i = heapq.heappop(heap)
+        bits, c = entries[i]
+        gain = popcount(bits & ~covered)
+        if gain == 0:
+            continue
+        key = -gain / c
+        if heap and key > heap[0][0]:
+            heapq.heappush(heap, (key, i))
+            continue
+        chosen.append(i)
+        covered |= bits
+    return sorted(chosen)
+
+
+def distill_dir(corpus_dir, evict_dir, dry_run=False):
+    names = sorted(
+        name[: -len(".si")]
+        for name in os.listdir(os.path.join(corpus_dir, "sim_input"))
+        if name.endswith(".si")
+    )
+
+    measured = []
+    entries = []
+    for name in names:
+        try:
+            exec_time, size, bits = read_meta(
+                os.path.join(corpus_dir, "coverage", name + ".cov")
+            )
+        except (FileNotFoundError, struct.error):
+            continue
+        measured.append(name)
+        entries.append((bits, cost(exec_time, size)))
+
+    favored = {measured[i] for i in greedy_cover(entries)}
+    evicted = [name for name in measured if name not in favored]
+    print(
+        "[DifuzzDistill] {} seeds, {} with coverage, {} favored, {} evicted".format(
+            len(names), len(measured), len(favored), len(evicted)
+        )
+    )
+    if dry_run:
+        return evicted
+
+    for kind in KINDS:
+        os.makedirs(os.path.join(evict_dir, kind), exist_ok=True)
+    for name in evicted:
+        for kind in KINDS:
+            file_name = "{}.{}".format(name, SUFFIXES.get(kind, kind))
+            src = os.path.join(corpus_dir, kind, file_name)
+            if os.path.isfile(src):
+                shutil.move(src, os.path.join(evict_dir, kind, file_name))
+    return evicted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="?", default="output/corpus")
+    parser.add_argument("--evict-dir", help="default: <corpus>_evicted")
+    parser.add_argument("--dry-run", action="store_true")
+    opts = parser.parse_args()
+
+    corpus = opts.corpus.rstrip("/")
+    distill_dir(corpus, opts.evict_dir or corpus + "_evicted", opts.dry_run)
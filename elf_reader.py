@@ -0,0 +1,320 @@
+import struct
+import sys
+from collections import namedtuple
+
+""" Minimal ELF64 little-endian reader for RISC-V test images
+
+Reads a linked test image once and produces what used to take three
+processes after every build:
+  - binary():    the flat image of `objcopy -O binary`
+  - hex_lines(): the 64-bit wide image of `elf2hex --bit-width 64`
+  - nm_lines():  the symbol listing of `nm` (C locale)
+
+`python elf_reader.py --check OBJCOPY ELF2HEX NM file.elf...` compares the
+output against the real tools.
+"""
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+PT_LOAD = 1
+
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+SHN_COMMON = 0xFFF2
+
+STB_LOCAL = 0
+STB_WEAK = 2
+STB_GNU_UNIQUE = 10
+STT_OBJECT = 1
+STT_SECTION = 3
+STT_FILE = 4
+STT_GNU_IFUNC = 10
+
+# Name prefixes nm maps to a fixed symbol class
+SECTION_CLASSES = [
+    (".bss", "b"),
+    (".code", "t"),
+    (".data", "d"),
+    ("*DEBUG*", "N"),
+    (".debug", "N"),
+    (".drectve", "i"),
+    (".edata", "e"),
+    (".fini", "t"),
+    (".idata", "i"),
+    (".init", "t"),
+    (".pdata", "p"),
+    (".rdata", "r"),
+    (".rodata", "r"),
+    (".sbss", "s"),
+    (".scommon", "c"),
+    (".sdata", "g"),
+    (".text", "t"),
+    ("vars", "d"),
+    ("zerovars", "b"),
+]
+
+ElfSection = namedtuple("ElfSection", "name type flags addr offset size")
+ElfSegment = namedtuple("ElfSegment", "type offset vaddr paddr filesz memsz")
+ElfSymbol = namedtuple("ElfSymbol", "name value size bind type shndx")
+
+
+class rvElf:
+    def __init__(self, data: bytes):
+        assert data[:4] == b"\x7fELF", "Not an ELF file"
+        assert data[4] == 2 and data[5] == 1, "Only ELF64 little-endian is supported"
+
+        self.data = data
+        (
+            self.entry,
+            self.phoff,
+            self.shoff,
+            self.phentsize,
+            self.phnum,
+            self.shentsize,
+            self.shnum,
+            self.shstrndx,
+        ) = struct.unpack_from("<24xQQQ6xHHHHH", data, 0)
+
+        self.segments = []
+        for i in range(self.phnum):
+            tpe, _, offset, vaddr, paddr, filesz, memsz, _ = struct.unpack_from(
+                "<IIQQQQQQ", data, self.phoff + i * self.phentsize
+            )
+            self.segments.append(ElfSegment(tpe, offset, vaddr, paddr, filesz, memsz))
+
+        raw = []
+        for i in range(self.shnum):
+            raw.append(
+                struct.unpack_from("<IIQQQQIIQQ", data, self.shoff + i * self.shentsize)
+            )
+        self.raw_sections = raw
+
+        strtab = raw[self.shstrndx][4]
+        self.sections = []
+        for name, tpe, flags, addr, offset, size, _, _, _, _ in raw:
+            self.sections.append(
+                ElfSection(self._str(strtab, name), tpe, flags, addr, offset, size)
+            )
+
+    @classmethod
+    def load(cls, path):
+        fd = open(path, "rb")
+        data = fd.read()
+        fd.close()
+        return cls(data)
+
+    def _str(self, table_offset, idx):
+        start = table_offset + idx
+        end = self.data.index(b"\x00", start)
+        return self.data[start:end].decode()
+
+    def loadable_sections(self):
+        # Sections that end up in the memory image (what objcopy -O binary dumps)
+        return [
+            sec
+            for sec in self.sections
+            if sec.flags & SHF_ALLOC and sec.type != SHT_NOBITS and sec.size > 0
+        ]
+
+    def lma(self, sec):
+        # Load address, from the segment that holds the section
+        for seg in self.segments:
+            if (
+                seg.type == PT_LOAD
+                and seg.offset <= sec.offset
+                and sec.offset + sec.size <= seg.offset + seg.filesz
+            ):
+                return sec.addr - seg.vaddr + seg.paddr
+        return sec.addr
+
+    def bin_base(self):
+        return min(self.lma(sec) for sec in self.loadable_sections())
+
+    def vaddr_to_offset(self, addr, size=1):
+        for sec in self.loadable_sections():
+            if sec.addr <= addr and addr + size <= sec.addr + sec.size:
+                return sec.offset + addr - sec.addr
+
+        raise KeyError("0x{:x} is not in a loadable section".format(addr))
+
+    def vaddr_to_lma(self, addr, size=1):
+        for sec in self.loadable_sections():
+            if sec.addr <= addr and addr + size <= sec.addr + sec.size:
+                return self.lma(sec) + addr - sec.addr
+
+        raise KeyError("0x{:x} is not in a loadable section".format(addr))
+
+    def binary(self):
+        sections = self.loadable_sections()
+        if not sections:
+            return b""
+
+        base = self.bin_base()
+        end = max(self.lma(sec) + sec.size for sec in sections)
+        image = bytearray(end - base)
+        for sec in sections:
+            start = self.lma(sec) - base
+            image[start : start + sec.size] = self.data[
+                sec.offset : sec.offset + sec.size
+            ]
+        return bytes(image)
+
+    def hex_lines(self, binary=None, bit_width=64):
+        # One little-endian word per line, most significant byte first
+        if binary is None:
+            binary = self.binary()
+        width = bit_width // 8
+
+        lines = []
+        for i in range(0, len(binary), width):
+            word = binary[i : i + width].ljust(width, b"\x00")
+            lines.append(word[::-1].hex() + "\n")
+        return lines
+
+    def symbols(self):
+        symbols = []
+        for name, tpe, _, _, offset, size, link, _, _, entsize in self.raw_sections:
+            if tpe != SHT_SYMTAB:
+                continue
+            strtab = self.raw_sections[link][4]
+            # The first entry is the reserved null symbol
+            for i in range(1, size // entsize):
+                name, info, _, shndx, value, sym_size = struct.unpack_from(
+                    "<IBBHQQ", self.data, offset + i * entsize
+                )
+                symbols.append(
+                    ElfSymbol(
+                        self._str(strtab, name),
+                        value,
+                        sym_size,
+                        info >> 4,
+                        info & 0xF,
+                        shndx,
+                    )
+                )
+        return symbols
+
+    def symbol_class(self, sym):
+        if sym.shndx == SHN_UNDEF:
+            if sym.bind == STB_WEAK:
+                return "v" if sym.type == STT_OBJECT else "w"
+            return "U"
+        if sym.shndx == SHN_COMMON:
+            return "C"
+        if sym.type == STT_GNU_IFUNC:
+            return "i"
+        if sym.bind == STB_WEAK:
+            return "V" if sym.type == STT_OBJECT else "W"
+        if sym.bind == STB_GNU_UNIQUE:
+            return "u"
+
+        if sym.shndx == SHN_ABS:
+            c = "a"
+        else:
+            c = self.section_class(self.sections[sym.shndx])
+        return c if sym.bind == STB_LOCAL else c.upper()
+
+    def section_class(self, sec):
+        for prefix, c in SECTION_CLASSES:
+            if sec.name.startswith(prefix):
+                return c
+
+        if sec.flags & SHF_EXECINSTR:
+            return "t"
+        if sec.type == SHT_NOBITS:
+            return "b"
+        if sec.flags & SHF_ALLOC:
+            return "d" if sec.flags & SHF_WRITE else "r"
+        return "n"
+
+    def listed_symbols(self):
+        # nm hides section and file symbols and the RISC-V mapping symbols
+        return sorted(
+            (
+                sym
+                for sym in self.symbols()
+                if sym.name
+                and sym.type not in [STT_SECTION, STT_FILE]
+                and not (sym.name[:2] in ["$x", "$d"] and sym.name[2:3] in ["", "."])
+            ),
+            key=lambda sym: sym.name.encode(),
+        )
+
+    def nm_lines(self):
+        lines = []
+        for sym in self.listed_symbols():
+            c = self.symbol_class(sym)
+            if c in "Uwv":
+                lines.append("{:16} {} {}\n".format("", c, sym.name))
+            else:
+                lines.append("{:016x} {} {}\n".format(sym.value, c, sym.name))
+        return lines
+
+    def symbol_table(self):
+        # name -> address of every defined symbol, as parsed from nm before
+        symbols = {}
+        for sym in self.listed_symbols():
+            if sym.shndx != SHN_UNDEF:
+                symbols[sym.name] = sym.value
+        return symbols
+
+
+def check(objcopy, elf2hex, nm, elf_names):
+    # Golden check against the binutils / elf2hex output
+    import os
+    import subprocess
+    import tempfile
+
+    env = dict(os.environ, LC_ALL="C")
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for elf_name in elf_names:
+            elf = rvElf.load(elf_name)
+            bin_name = os.path.join(tmp, "golden.bin")
+            hex_name = os.path.join(tmp, "golden.hex")
+            subprocess.check_call([objcopy, "-O", "binary", elf_name, bin_name])
+            subprocess.check_call(
+                [
+                    elf2hex,
+                    "--bit-width",
+                    "64",
+                    "--input",
+                    elf_name,
+                    "--output",
+                    hex_name,
+                ]
+            )
+            golden_nm = subprocess.run(
+                [nm, elf_name], stdout=subprocess.PIPE, env=env, check=True
+            ).stdout.decode()
+
+            fd = open(bin_name, "rb")
+            golden_bin = fd.read()
+            fd.close()
+            fd = open(hex_name, "r")
+            golden_hex = fd.read()
+            fd.close()
+
+            results = [
+                ("bin", elf.binary() == golden_bin),
+                ("hex", "".join(elf.hex_lines()) == golden_hex),
+                ("nm", "".join(elf.nm_lines()) == golden_nm),
+            ]
+            for what, ok in results:
+                if not ok:
+                    failed += 1
+                    print("{}: {} differs".format(elf_name, what))
+            if all(ok for _, ok in results):
+                print("{}: ok".format(elf_name))
+
+    return failed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 6 or sys.argv[1] != "--check":
+        print("usage: {} --check OBJCOPY ELF2HEX NM file.elf...".format(sys.argv[0]))
+        sys.exit(2)
+    sys.exit(1 if check(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:]) else 0)
@@ -0,0 +1,783 @@
+import re
+
+""" In-process RISC-V assembler for the fuzz body
+
+Encodes the populated Word instructions straight into machine code, the
+same way GNU as does inside `.option norvc` / `.option norelax` /
+`.option nopic`:
+  - li is expanded with the load_const algorithm of gas
+  - la is expanded to auipc + addi
+  - conditional branches to far local labels are relaxed to an inverted
+    branch over a jal
+
+Anything that is not understood raises EncodeError, and the caller falls
+back to gcc.
+"""
+
+
+class EncodeError(Exception):
+    pass
+
+
+xreg_abi = (
+    ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1"]
+    + ["a{}".format(i) for i in range(8)]
+    + ["s{}".format(i) for i in range(2, 12)]
+    + ["t{}".format(i) for i in range(3, 7)]
+)
+freg_abi = (
+    ["ft{}".format(i) for i in range(8)]
+    + ["fs0", "fs1"]
+    + ["fa{}".format(i) for i in range(8)]
+    + ["fs{}".format(i) for i in range(2, 12)]
+    + ["ft{}".format(i) for i in range(8, 12)]
+)
+
+XREGS = {"x{}".format(i): i for i in range(32)}
+XREGS.update({name: i for i, name in enumerate(xreg_abi)})
+XREGS["fp"] = 8
+FREGS = {"f{}".format(i): i for i in range(32)}
+FREGS.update({name: i for i, name in enumerate(freg_abi)})
+
+CSRS = {
+    "fflags": 0x001,
+    "frm": 0x002,
+    "fcsr": 0x003,
+    "vstart": 0x008,
+    "vxsat": 0x009,
+    "vxrm": 0x00A,
+    "vcsr": 0x00F,
+    "sstatus": 0x100,
+    "sie": 0x104,
+    "stvec": 0x105,
+    "scounteren": 0x106,
+    "senvcfg": 0x10A,
+    "sscratch": 0x140,
+    "sepc": 0x141,
+    "scause": 0x142,
+    "stval": 0x143,
+    "sip": 0x144,
+    "satp": 0x180,
+    "vsstatus": 0x200,
+    "vsie": 0x204,
+    "vstvec": 0x205,
+    "vsscratch": 0x240,
+    "vsepc": 0x241,
+    "vscause": 0x242,
+    "vstval": 0x243,
+    "vsip": 0x244,
+    "vsatp": 0x280,
+    "mstatus": 0x300,
+    "misa": 0x301,
+    "medeleg": 0x302,
+    "mideleg": 0x303,
+    "mie": 0x304,
+    "mtvec": 0x305,
+    "mcounteren": 0x306,
+    "menvcfg": 0x30A,
+    "mscratch": 0x340,
+    "mepc": 0x341,
+    "mcause": 0x342,
+    "mtval": 0x343,
+    "mip": 0x344,
+    "mtinst": 0x34A,
+    "mtval2": 0x34B,
+    "pmpcfg0": 0x3A0,
+    "pmpcfg2": 0x3A2,
+    "hstatus": 0x600,
+    "hedeleg": 0x602,
+    "hideleg": 0x603,
+    "hie": 0x604,
+    "htimedelta": 0x605,
+    "hcounteren": 0x606,
+    "hgeie": 0x607,
+    "henvcfg": 0x60A,
+    "hstateen0": 0x60C,
+    "hstateen1": 0x60D,
+    "hstateen2": 0x60E,
+    "hstateen3": 0x60F,
+    "htval": 0x643,
+    "hip": 0x644,
+    "hvip": 0x645,
+    "htinst": 0x64A,
+    "hgatp": 0x680,
+    "hcontext": 0x6A8,
+    "mcycle": 0xB00,
+    "minstret": 0xB02,
+    "cycle": 0xC00,
+    "time": 0xC01,
+    "instret": 0xC02,
+    "vl": 0xC20,
+    "vtype": 0xC21,
+    "vlenb": 0xC22,
+    "hgeip": 0xE12,
+    "mvendorid": 0xF11,
+    "marchid": 0xF12,
+    "mimpid": 0xF13,
+    "mhartid": 0xF14,
+}
+CSRS.update({"pmpaddr{}".format(i): 0x3B0 + i for i in range(64)})
+CSRS.update({"hpmcounter{}".format(i): 0xC00 + i for i in range(3, 32)})
+CSRS.update({"mhpmcounter{}".format(i): 0xB00 + i for i in range(3, 32)})
+
+ROUNDING = {"rne": 0, "rtz": 1, "rdn": 2, "rup": 3, "rmm": 4, "dyn": 7}
+
+# name: (opcode, funct3, funct7)
+OP_R = {
+    "add": (0x33, 0, 0x00),
+    "sub": (0x33, 0, 0x20),
+    "sll": (0x33, 1, 0x00),
+    "slt": (0x33, 2, 0x00),
+    "sltu": (0x33, 3, 0x00),
+    "xor": (0x33, 4, 0x00),
+    "srl": (0x33, 5, 0x00),
+    "sra": (0x33, 5, 0x20),
+    "or": (0x33, 6, 0x00),
+    "and": (0x33, 7, 0x00),
+    "mul": (0x33, 0, 0x01),
+    "mulh": (0x33, 1, 0x01),
+    "mulhsu": (0x33, 2, 0x01),
+    "mulhu": (0x33, 3, 0x01),
+    "div": (0x33, 4, 0x01),
+    "divu": (0x33, 5, 0x01),
+    "rem": (0x33, 6, 0x01),
+    "remu": (0x33, 7, 0x01),
+    "addw": (0x3B, 0, 0x00),
+    "subw": (0x3B, 0, 0x20),
+    "sllw": (0x3B, 1, 0x00),
+    "srlw": (0x3B, 5, 0x00),
+    "sraw": (0x3B, 5, 0x20),
+    "mulw": (0x3B, 0, 0x01),
+    "divw": (0x3B, 4, 0x01),
+    "divuw": (0x3B, 5, 0x01),
+    "remw": (0x3B, 6, 0x01),
+    "remuw": (0x3B, 7, 0x01),
+}
+# name: (opcode, funct3)
+OP_I = {
+    "addi": (0x13, 0),
+    "slti": (0x13, 2),
+    "sltiu": (0x13, 3),
+    "xori": (0x13, 4),
+    "ori": (0x13, 6),
+    "andi": (0x13, 7),
+    "addiw": (0x1B, 0),
+}
+# name: (opcode, funct3, imm high bits, max shamt)
+SHIFTS = {
+    "slli": (0x13, 1, 0x000, 63),
+    "srli": (0x13, 5, 0x000, 63),
+    "srai": (0x13, 5, 0x400, 63),
+    "slliw": (0x1B, 1, 0x000, 31),
+    "srliw": (0x1B, 5, 0x000, 31),
+    "sraiw": (0x1B, 5, 0x400, 31),
+}
+# name: (opcode, funct3, fp register)
+LOADS = {
+    "lb": (0x03, 0, False),
+    "lh": (0x03, 1, False),
+    "lw": (0x03, 2, False),
+    "ld": (0x03, 3, False),
+    "lbu": (0x03, 4, False),
+    "lhu": (0x03, 5, False),
+    "lwu": (0x03, 6, False),
+    "flw": (0x07, 2, True),
+    "fld": (0x07, 3, True),
+}
+STORES = {
+    "sb": (0x23, 0, False),
+    "sh": (0x23, 1, False),
+    "sw": (0x23, 2, False),
+    "sd": (0x23, 3, False),
+    "fsw": (0x27, 2, True),
+    "fsd": (0x27, 3, True),
+}
+BRANCHES = {"beq": 0, "bne": 1, "blt": 4, "bge": 5, "bltu": 6, "bgeu": 7}
+AMOS = {
+    "lr": 0x02,
+    "sc": 0x03,
+    "amoswap": 0x01,
+    "amoadd": 0x00,
+    "amoxor": 0x04,
+    "amoand": 0x0C,
+    "amoor": 0x08,
+    "amomin": 0x10,
+    "amomax": 0x14,
+    "amominu": 0x18,
+    "amomaxu": 0x1C,
+}
+CSR_OPS = {"csrrw": 1, "csrrs": 2, "csrrc": 3, "csrrwi": 5, "csrrsi": 6, "csrrci": 7}
+# pseudo: real op with rd = zero
+CSR_PSEUDO = {
+    "csrw": "csrrw",
+    "csrs": "csrrs",
+    "csrc": "csrrc",
+    "csrwi": "csrrwi",
+    "csrsi": "csrrsi",
+    "csrci": "csrrci",
+}
+FIXED = {
+    "ecall": 0x00000073,
+    "ebreak": 0x00100073,
+    "mret": 0x30200073,
+    "sret": 0x10200073,
+    "wfi": 0x10500073,
+    "fence.i": 0x0000100F,
+    "fence.tso": 0x8330000F,
+    "nop": 0x00000013,
+}
+# name: funct7, operands are (rs1, rs2)
+SFENCES = {"sfence.vma": 0x09, "hfence.vvma": 0x11, "hfence.gvma": 0x31}
+# name: (funct7, rs2 field)
+HLV = {
+    "hlv.b": (0x30, 0),
+    "hlv.bu": (0x30, 1),
+    "hlv.h": (0x32, 0),
+    "hlv.hu": (0x32, 1),
+    "hlvx.hu": (0x32, 3),
+    "hlv.w": (0x34, 0),
+    "hlv.wu": (0x34, 1),
+    "hlvx.wu": (0x34, 3),
+    "hlv.d": (0x36, 0),
+}
+HSV = {"hsv.b": 0x31, "hsv.h": 0x33, "hsv.w": 0x35, "hsv.d": 0x37}
+CBOS = {"cbo.inval": 0, "cbo.clean": 1, "cbo.flush": 2, "cbo.zero": 4}
+PREFETCHES = {"prefetch.i": 0, "prefetch.r": 1, "prefetch.w": 3}
+FP_FMT = {"s": 0, "d": 1}
+FP_INT = {"w": 0, "wu": 1, "l": 2, "lu": 3}
+# name: (funct5, fixed rm or None, fixed rs2 or None, rd type, number of sources)
+FP_OPS = {
+    "fadd": (0x00, None, None, "f", 2),
+    "fsub": (0x01, None, None, "f", 2),
+    "fmul": (0x02, None, None, "f", 2),
+    "fdiv": (0x03, None, None, "f", 2),
+    "fsqrt": (0x0B, None, 0, "f", 1),
+    "fsgnj": (0x04, 0, None, "f", 2),
+    "fsgnjn": (0x04, 1, None, "f", 2),
+    "fsgnjx": (0x04, 2, None, "f", 2),
+    "fmin": (0x05, 0, None, "f", 2),
+    "fmax": (0x05, 1, None, "f", 2),
+    "feq": (0x14, 2, None, "x", 2),
+    "flt": (0x14, 1, None, "x", 2),
+    "fle": (0x14, 0, None, "x", 2),
+    "fclass": (0x1C, 1, 0, "x", 1),
+}
+FMA = {"fmadd": 0x43, "fmsub": 0x47, "fnmsub": 0x4B, "fnmadd": 0x4F}
+
+LABEL_RE = re.compile(r"^\s*([A-Za-z_.$][\w.$]*):(.*)$")
+MEM_RE = re.compile(r"^(.*)\(\s*(\w+)\s*\)$")
+
+# Item kinds
+FIX = 0  # fixed instruction word
+BRANCH = 1  # conditional branch to a symbol, 4 or 8 bytes
+JAL = 2  # jal to a symbol
+PCREL = 3  # auipc + addi to a symbol
+
+
+def _sext(val, bits):
+    val &= (1 << bits) - 1
+    return val - (1 << bits) if val >> (bits - 1) else val
+
+
+def _int(text):
+    try:
+        return int(text.strip(), 0)
+    except ValueError:
+        raise EncodeError("bad immediate '{}'".format(text))
+
+
+def _check(val, lo, hi, what):
+    if not lo <= val <= hi:
+        raise EncodeError("{} {} out of range".format(what, val))
+    return val
+
+
+def _xreg(text):
+    reg = XREGS.get(text.strip())
+    if reg is None:
+        raise EncodeError("bad integer register '{}'".format(text))
+    return reg
+
+
+def _freg(text):
+    reg = FREGS.get(text.strip())
+    if reg is None:
+        raise EncodeError("bad float register '{}'".format(text))
+    return reg
+
+
+def _csr(text):
+    text = text.strip()
+    if text in CSRS:
+        return CSRS[text]
+    if text[:1].isdigit():
+        return _check(_int(text), 0, 0xFFF, "csr")
+    raise EncodeError("unknown csr '{}'".format(text))
+
+
+def _mem(text):
+    # imm(reg) or (reg)
+    m = MEM_RE.match(text.strip())
+    if not m:
+        raise EncodeError("bad memory operand '{}'".format(text))
+    imm = m.group(1).strip()
+    return (_int(imm) if imm else 0, _xreg(m.group(2)))
+
+
+def _symbol(text):
+    text = text.strip()
+    if not re.match(r"^[A-Za-z_.$][\w.$]*$", text) or text in XREGS:
+        raise EncodeError("bad symbol '{}'".format(text))
+    return text
+
+
+def enc_r(op, f3, f7, rd, rs1, rs2):
+    return (f7 << 25) | (rs2 << 20) | (rs1 << 15) | (f3 << 12) | (rd << 7) | op
+
+
+def enc_i(op, f3, rd, rs1, imm):
+    _check(imm, -2048, 2047, "imm12")
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (f3 << 12) | (rd << 7) | op
+
+
+def enc_s(op, f3, rs1, rs2, imm):
+    _check(imm, -2048, 2047, "imm12")
+    return (
+        ((imm >> 5 & 0x7F) << 25)
+        | (rs2 << 20)
+        | (rs1 << 15)
+        | (f3 << 12)
+        | ((imm & 0x1F) << 7)
+        | op
+    )
+
+
+def enc_b(f3, rs1, rs2, off):
+    _check(off, -4096, 4094, "branch offset")
+    return (
+        ((off >> 12 & 1) << 31)
+        | ((off >> 5 & 0x3F) << 25)
+        | (rs2 << 20)
+        | (rs1 << 15)
+        | (f3 << 12)
+        | ((off >> 1 & 0xF) << 8)
+        | ((off >> 11 & 1) << 7)
+        | 0x63
+    )
+
+
+def enc_u(op, rd, imm):
+    _check(imm, 0, 0xFFFFF, "imm20")
+    return (imm << 12) | (rd << 7) | op
+
+
+def enc_j(rd, off):
+    _check(off, -(1 << 20), (1 << 20) - 2, "jump offset")
+    return (
+        ((off >> 20 & 1) << 31)
+        | ((off >> 1 & 0x3FF) << 21)
+        | ((off >> 11 & 1) << 20)
+        | ((off >> 12 & 0xFF) << 12)
+        | (rd << 7)
+        | 0x6F
+    )
+
+
+def load_const(rd, val):
+    """li expansion, follows load_const() of gas/config/tc-riscv.c"""
+    lower = _sext(val, 12)
+    upper = _sext(val - lower, 64)
+    if not -(1 << 31) <= val < (1 << 31):
+        shift = 12
+        while (upper >> shift) & 1 == 0:
+            shift += 1
+        words = load_const(rd, upper >> shift)
+        words.append(enc_i(0x13, 1, rd, rd, shift))
+        if lower != 0:
+            words.append(enc_i(0x13, 0, rd, rd, lower))
+        return words
+
+    words = []
+    hi_reg = 0
+    if upper != 0:
+        words.append(enc_u(0x37, rd, (upper & 0xFFFFFFFF) >> 12))
+        hi_reg = rd
+    if lower != 0 or hi_reg == 0:
+        # addiw after lui, addi for a plain small constant
+        op = 0x1B if hi_reg else 0x13
+        words.append(enc_i(op, 0, rd, hi_reg, lower))
+    return words
+
+
+class rvEncoder:
+    def parse(self, inst):
+        """Turn one statement into a list of items (kind, size, fields)"""
+        inst = inst.strip()
+        if not inst:
+            return []
+
+        if inst.startswith(".word"):
+            return [(FIX, 4, _int(v) & 0xFFFFFFFF) for v in inst[5:].split(",")]
+        if inst.startswith("."):
+            raise EncodeError("unsupported directive '{}'".format(inst))
+
+        parts = inst.split(None, 1)
+        name = parts[0].lower()
+        ops = [op.strip() for op in parts[1].split(",")] if len(parts) > 1 else []
+
+        words = self.parse_fixed(name, ops)
+        if words is not None:
+            return [(FIX, 4, word) for word in words]
+
+        if name in BRANCHES or name in ["beqz", "bnez", "bgt", "ble", "bgtu", "bleu"]:
+            return [self.parse_branch(name, ops)]
+        if name in ["jal", "j"]:
+            if name == "j" or len(ops) == 1:
+                rd = 0 if name == "j" else 1
+                return [(JAL, 4, rd, _symbol(ops[0]))]
+            return [(JAL, 4, _xreg(ops[0]), _symbol(ops[1]))]
+        if name in ["la", "lla"]:
+            self._nops(ops, 2)
+            return [(PCREL, 8, _xreg(ops[0]), _symbol(ops[1]))]
+
+        raise EncodeError("unsupported instruction '{}'".format(inst))
+
+    def _nops(self, ops, num):
+        if len(ops) != num:
+            raise EncodeError("expected {} operands, got {}".format(num, len(ops)))
+
+    def parse_branch(self, name, ops):
+        if name in ["beqz", "bnez"]:
+            self._nops(ops, 2)
+            return (BRANCH, 4, BRANCHES[name[:3]], _xreg(ops[0]), 0, _symbol(ops[1]))
+
+        self._nops(ops, 3)
+        rs1, rs2 = _xreg(ops[0]), _xreg(ops[1])
+        if name in ["bgt", "ble", "bgtu", "bleu"]:
+            swap = {"bgt": "blt", "ble": "bge", "bgtu": "bltu", "bleu": "bgeu"}
+            name, rs1, rs2 = swap[name], rs2, rs1
+        return (BRANCH, 4, BRANCHES[name], rs1, rs2, _symbol(ops[2]))
+
+    def parse_fixed(self, name, ops):
+        """Instructions whose encoding does not depend on the layout"""
+        if name in FIXED and not ops:
+            return [FIXED[name]]
+        if name == "fence":
+            if not ops:
+                return [0x0FF0000F]
+            self._nops(ops, 2)
+            bits = {"i": 8, "o": 4, "r": 2, "w": 1}
+            if any(c not in bits for c in "".join(ops)):
+                raise EncodeError("bad fence operands {}".format(ops))
+            pred, succ = [sum(bits[c] for c in op) for op in ops]
+            return [(pred << 24) | (succ << 20) | 0x0F]
+        if name in OP_R:
+            self._nops(ops, 3)
+            op, f3, f7 = OP_R[name]
+            return [enc_r(op, f3, f7, _xreg(ops[0]), _xreg(ops[1]), _xreg(ops[2]))]
+        if name in OP_I:
+            self._nops(ops, 3)
+            op, f3 = OP_I[name]
+            return [enc_i(op, f3, _xreg(ops[0]), _xreg(ops[1]), _int(ops[2]))]
+        if name in SHIFTS:
+            self._nops(ops, 3)
+            op, f3, hi, max_shamt = SHIFTS[name]
+            shamt = _check(_int(ops[2]), 0, max_shamt, "shamt")
+            return [enc_i(op, f3, _xreg(ops[0]), _xreg(ops[1]), _sext(hi | shamt, 12))]
+        if name in LOADS:
+            self._nops(ops, 2)
+            op, f3, fp = LOADS[name]
+            imm, rs1 = _mem(ops[1])
+            rd = _freg(ops[0]) if fp else _xreg(ops[0])
+            return [enc_i(op, f3, rd, rs1, imm)]
+        if name in STORES:
+            self._nops(ops, 2)
+            op, f3, fp = STORES[name]
+            imm, rs1 = _mem(ops[1])
+            rs2 = _freg(ops[0]) if fp else _xreg(ops[0])
+            return [enc_s(op, f3, rs1, rs2, imm)]
+        if name in ["lui", "auipc"]:
+            self._nops(ops, 2)
+            op = 0x37 if name == "lui" else 0x17
+            return [enc_u(op, _xreg(ops[0]), _int(ops[1]))]
+        if name == "jalr":
+            return [self.parse_jalr(ops)]
+        if name in ["jr", "ret"]:
+            rs1 = 1 if name == "ret" else _xreg(ops[0])
+            return [enc_i(0x67, 0, 0, rs1, 0)]
+        if name == "li":
+            self._nops(ops, 2)
+            val = _int(ops[1])
+            _check(val, -(1 << 63), (1 << 64) - 1, "li constant")
+            return load_const(_xreg(ops[0]), _sext(val, 64))
+        if name == "mv":
+            self._nops(ops, 2)
+            return [enc_i(0x13, 0, _xreg(ops[0]), _xreg(ops[1]), 0)]
+        if name == "not":
+            self._nops(ops, 2)
+            return [enc_i(0x13, 4, _xreg(ops[0]), _xreg(ops[1]), -1)]
+        if name in ["neg", "negw"]:
+            self._nops(ops, 2)
+            op = 0x33 if name == "neg" else 0x3B
+            return [enc_r(op, 0, 0x20, _xreg(ops[0]), 0, _xreg(ops[1]))]
+        if name == "sext.w":
+            self._nops(ops, 2)
+            return [enc_i(0x1B, 0, _xreg(ops[0]), _xreg(ops[1]), 0)]
+        if name == "seqz":
+            self._nops(ops, 2)
+            return [enc_i(0x13, 3, _xreg(ops[0]), _xreg(ops[1]), 1)]
+        if name == "snez":
+            self._nops(ops, 2)
+            return [enc_r(0x33, 3, 0, _xreg(ops[0]), 0, _xreg(ops[1]))]
+        if name in CSR_OPS:
+            self._nops(ops, 3)
+            f3 = CSR_OPS[name]
+            src = _check(_int(ops[2]), 0, 31, "uimm5") if f3 > 4 else _xreg(ops[2])
+            return [enc_i(0x73, f3, _xreg(ops[0]), src, _sext(_csr(ops[1]), 12))]
+        if name == "csrr":
+            self._nops(ops, 2)
+            return [enc_i(0x73, 2, _xreg(ops[0]), 0, _sext(_csr(ops[1]), 12))]
+        if name in CSR_PSEUDO:
+            self._nops(ops, 2)
+            return self.parse_fixed(CSR_PSEUDO[name], ["zero"] + ops)
+        if name in SFENCES:
+            rs = [_xreg(op) for op in ops] + [0] * (2 - len(ops))
+            return [enc_r(0x73, 0, SFENCES[name], 0, rs[0], rs[1])]
+        if name in HLV:
+            self._nops(ops, 2)
+            f7, sel = HLV[name]
+            imm, rs1 = _mem(ops[1])
+            _check(imm, 0, 0, "offset")
+            return [enc_r(0x73, 4, f7, _xreg(ops[0]), rs1, sel)]
+        if name in HSV:
+            self._nops(ops, 2)
+            imm, rs1 = _mem(ops[1])
+            _check(imm, 0, 0, "offset")
+            return [enc_r(0x73, 4, HSV[name], 0, rs1, _xreg(ops[0]))]
+        if name in CBOS:
+            self._nops(ops, 1)
+            imm, rs1 = _mem(ops[0])
+            _check(imm, 0, 0, "offset")
+            return [enc_i(0x0F, 2, 0, rs1, CBOS[name])]
+        if name in PREFETCHES:
+            self._nops(ops, 1)
+            imm, rs1 = _mem(ops[0])
+            if imm & 0x1F:
+                raise EncodeError(
+                    "prefetch offset {} is not 32-byte aligned".format(imm)
+                )
+            return [
+                enc_i(
+                    0x13,
+                    6,
+                    0,
+                    rs1,
+                    _check(imm, -2048, 2047, "imm12") | PREFETCHES[name],
+                )
+            ]
+
+        base = name.split(".")[0]
+        if base in AMOS:
+            return [self.parse_amo(name, ops)]
+        if base in FP_OPS or base in FMA or base in ["fcvt", "fmv"]:
+            return [self.parse_fp(name, ops)]
+
+        return None
+
+    def parse_jalr(self, ops):
+        if len(ops) == 1:
+            rd, (imm, rs1) = 1, (0, _xreg(ops[0]))
+        elif len(ops) == 2 and "(" in ops[1]:
+            rd, (imm, rs1) = _xreg(ops[0]), _mem(ops[1])
+        elif len(ops) == 2:
+            rd, imm, rs1 = _xreg(ops[0]), 0, _xreg(ops[1])
+        else:
+            self._nops(ops, 3)
+            rd, rs1, imm = _xreg(ops[0]), _xreg(ops[1]), _int(ops[2])
+        return enc_i(0x67, 0, rd, rs1, imm)
+
+    def parse_amo(self, name, ops):
+        fields = name.split(".")
+        if len(fields) < 2 or fields[1] not in ["w", "d"]:
+            raise EncodeError("bad amo '{}'".format(name))
+        f3 = 2 if fields[1] == "w" else 3
+        order = fields[2] if len(fields) > 2 else ""
+        if order not in ["", "aq", "rl", "aqrl"]:
+            raise EncodeError("bad amo ordering '{}'".format(name))
+        aqrl = (2 if "aq" in order else 0) | (1 if "rl" in order else 0)
+
+        f5 = AMOS[fields[0]]
+        if fields[0] == "lr":
+            self._nops(ops, 2)
+            rd, rs2, addr = _xreg(ops[0]), 0, ops[1]
+        else:
+            self._nops(ops, 3)
+            rd, rs2, addr = _xreg(ops[0]), _xreg(ops[1]), ops[2]
+        imm, rs1 = _mem(addr)
+        _check(imm, 0, 0, "offset")
+        return enc_r(0x2F, f3, (f5 << 2) | aqrl, rd, rs1, rs2)
+
+    def _rm(self, ops, num, default=7):
+        if len(ops) == num + 1:
+            rm = ROUNDING.get(ops[num])
+            if rm is None:
+                raise EncodeError("bad rounding mode '{}'".format(ops[num]))
+            return rm
+        self._nops(ops, num)
+        return default
+
+    def parse_fp(self, name, ops):
+        fields = name.split(".")
+        base = fields[0]
+
+        if base == "fmv" and len(fields) == 3:
+            # fmv.x.w / fmv.x.d / fmv.w.x / fmv.d.x
+            self._nops(ops, 2)
+            if fields[1] == "x" and fields[2] in ["w", "d"]:
+                fmt = 0 if fields[2] == "w" else 1
+                return enc_r(0x53, 0, 0x70 | fmt, _xreg(ops[0]), _freg(ops[1]), 0)
+            if fields[2] == "x" and fields[1] in ["w", "d"]:
+                fmt = 0 if fields[1] == "w" else 1
+                return enc_r(0x53, 0, 0x78 | fmt, _freg(ops[0]), _xreg(ops[1]), 0)
+            raise EncodeError("bad fmv '{}'".format(name))
+
+        if base == "fcvt" and len(fields) == 3:
+            dst, src = fields[1], fields[2]
+            if dst in FP_INT and src in FP_FMT:
+                rm = self._rm(ops, 2)
+                f7 = 0x60 | FP_FMT[src]
+                return enc_r(0x53, rm, f7, _xreg(ops[0]), _freg(ops[1]), FP_INT[dst])
+            if dst in FP_FMT and src in FP_INT:
+                # int -> double is exact, gas defaults to rne there
+                exact = dst == "d" and src in ["w", "wu"]
+                rm = self._rm(ops, 2, 0 if exact else 7)
+                f7 = 0x68 | FP_FMT[dst]
+                return enc_r(0x53, rm, f7, _freg(ops[0]), _xreg(ops[1]), FP_INT[src])
+            if dst in FP_FMT and src in FP_FMT and dst != src:
+                rm = self._rm(ops, 2, 0 if dst == "d" else 7)
+                f7 = 0x20 | FP_FMT[dst]
+                return enc_r(0x53, rm, f7, _freg(ops[0]), _freg(ops[1]), FP_FMT[src])
+            raise EncodeError("bad fcvt '{}'".format(name))
+
+        if len(fields) != 2 or fields[1] not in FP_FMT:
+            raise EncodeError("unsupported fp format '{}'".format(name))
+        fmt = FP_FMT[fields[1]]
+
+        if base in FMA:
+            rm = self._rm(ops, 4)
+            rd, rs1, rs2, rs3 = [_freg(op) for op in ops[:4]]
+            return (
+                (rs3 << 27)
+                | (fmt << 25)
+                | (rs2 << 20)
+                | (rs1 << 15)
+                | (rm << 12)
+                | (rd << 7)
+                | FMA[base]
+            )
+
+        f5, rm, rs2, rd_type, nsrc = FP_OPS[base]
+        if rm is None:
+            rm = self._rm(ops, 1 + nsrc)
+        else:
+            self._nops(ops, 1 + nsrc)
+        rd = _xreg(ops[0]) if rd_type == "x" else _freg(ops[0])
+        rs1 = _freg(ops[1])
+        if rs2 is None:
+            rs2 = _freg(ops[2])
+        return enc_r(0x53, rm, (f5 << 2) | fmt, rd, rs1, rs2)
+
+    def assemble(self, regions, symbols):
+        """Assemble regions = [(base, lines)] and return (codes, labels)
+
+        lines are rendered instructions, optionally starting with "label:".
+        All regions live in the same section, so branches between them are
+        relaxed like local ones.  symbols holds the addresses of everything
+        defined outside the regions (data labels, template symbols).
+        """
+        parsed = []
+        local = {}
+        for n, (base, lines) in enumerate(regions):
+            items = []
+            for line in lines:
+                m = LABEL_RE.match(line)
+                while m:
+                    if m.group(1) in local or m.group(1) in symbols:
+                        raise EncodeError("symbol {} redefined".format(m.group(1)))
+                    local[m.group(1)] = (n, len(items))
+                    line = m.group(2)
+                    m = LABEL_RE.match(line)
+                items += self.parse(line)
+            parsed.append((base, items))
+
+        # Relax far conditional branches until the layout is stable
+        sizes = [[item[1] for item in items] for _, items in parsed]
+        while True:
+            layouts = []
+            for (base, items), region_sizes in zip(parsed, sizes):
+                addrs = []
+                addr = base
+                for size in region_sizes:
+                    addrs.append(addr)
+                    addr += size
+                addrs.append(addr)
+                layouts.append(addrs)
+
+            changed = False
+            for n, (base, items) in enumerate(parsed):
+                for i, item in enumerate(items):
+                    if item[0] != BRANCH or sizes[n][i] == 8:
+                        continue
+                    target = local.get(item[5])
+                    if target is None:
+                        # outside of the fuzz body gas can not tell the distance
+                        far = True
+                    else:
+                        dist = layouts[target[0]][target[1]] - layouts[n][i]
+                        far = not -4096 <= dist < 4096
+                    if far:
+                        sizes[n][i] = 8
+                        changed = True
+            if not changed:
+                break
+
+        labels = {label: layouts[n][i] for label, (n, i) in local.items()}
+
+        codes = []
+        for (base, items), region_sizes, addrs in zip(parsed, sizes, layouts):
+            code = bytearray()
+            for item, size, pc in zip(items, region_sizes, addrs):
+                for word in self.encode(item, size, pc, labels, symbols):
+                    code += word.to_bytes(4, "little")
+            codes.append(bytes(code))
+
+        return (codes, labels)
+
+    def _target(self, name, labels, symbols):
+        addr = labels.get(name, symbols.get(name))
+        if addr is None:
+            raise EncodeError("undefined symbol {}".format(name))
+        return addr
+
+    def encode(self, item, size, pc, labels, symbols):
+        kind = item[0]
+        if kind == FIX:
+            return [item[2]]
+
+        if kind == JAL:
+            _, _, rd, sym = item
+            return [enc_j(rd, self._target(sym, labels, symbols) - pc)]
+
+        if kind == PCREL:
+            _, _, rd, sym = item
+            off = self._target(sym, labels, symbols) - pc
+            hi = (off + 0x800) >> 12
+            lo = off - (hi << 12)
+            return [enc_u(0x17, rd, hi & 0xFFFFF), enc_i(0x13, 0, rd, rd, lo)]
+
+        _, _, f3, rs1, rs2, sym = item
+        target = self._target(sym, labels, symbols)
+        if size == 4:
+            return [enc_b(f3, rs1, rs2, target - pc)]
+        # b<inverted> rs1, rs2, .+8; jal x0, target
+        return [enc_b(f3 ^ 1, rs1, rs2, 8), enc_j(0, target - pc - 4)]
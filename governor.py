@@ -0,0 +1,111 @@
+import random
+
+from bandit import rvBandit
+
+""" Program length governor
+
+Instead of growing the program by a word per admitted test, the length
+of a generated program is picked per template against a time budget per
+test (build + run).
+
+For every template the governor fits the cost of a test as a linear
+function of its length (least squares over running sums) and never
+picks a length whose predicted cost is over the budget.  Lengths are
+grouped in power-of-two buckets; which bucket to use is a bandit over
+rewards (new coverage, mismatches) per second, so the length drifts to
+where coverage is cheapest instead of to the maximum.  Until the cost
+fit has enough samples, lengths are only explored up to twice the
+longest program measured so far.
+"""
+
+# Tests of a template before its cost fit is trusted
+MIN_SAMPLES = 8
+
+
+def length_buckets(min_len, max_len):
+    buckets = []
+    lo = min_len
+    while lo < max_len:
+        hi = min(lo * 2, max_len)
+        buckets.append((lo, hi))
+        lo = hi
+    return buckets or [(min_len, max_len)]
+
+
+class rvTemplateCost:
+    def __init__(self):
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.longest = 0
+
+    def record(self, length, seconds):
+        self.n += 1
+        self.sx += length
+        self.sy += seconds
+        self.sxx += length * length
+        self.sxy += length * seconds
+        self.longest = max(self.longest, length)
+
+    def fit(self):
+        """(seconds per test, seconds per word), None without enough samples"""
+        if self.n < MIN_SAMPLES:
+            return None
+        var = self.n * self.sxx - self.sx * self.sx
+        if var <= 0:
+            return None
+        slope = (self.n * self.sxy - self.sx * self.sy) / var
+        base = (self.sy - slope * self.sx) / self.n
+        return base, max(slope, 1e-9)
+
+
+class rvLengthGovernor:
+    def __init__(self, budget, min_len, max_len, start_len):
+        self.budget = budget
+        self.min_len = min_len
+        self.max_len = max_len
+        self.start_len = start_len
+        self.buckets = length_buckets(min_len, max_len)
+        self.costs = {}
+        self.bandits = {}
+
+    def template(self, template):
+        if template not in self.costs:
+            self.costs[template] = rvTemplateCost()
+            # One reward per test at the budget as the prior of every bucket
+            self.bandits[template] = rvBandit([1] * len(self.buckets), self.budget)
+        return self.costs[template], self.bandits[template]
+
+    def max_length(self, template):
+        cost, _ = self.template(template)
+        limit = max(2 * cost.longest, self.start_len)
+        fit = cost.fit()
+        if fit is not None:
+            base, per_word = fit
+            limit = int((self.budget - base) / per_word)
+        return min(max(limit, self.min_len), self.max_len)
+
+    def length(self, template):
+        _, bandit = self.template(template)
+        limit = self.max_length(template)
+        arms = [i for i, (lo, _) in enumerate(self.buckets) if lo <= limit]
+        # Every bucket in reach is tried before the draws decide
+        untried = [i for i in arms if bandit.pulls[i] < MIN_SAMPLES]
+        lo, hi = self.buckets[random.choice(untried) if untried else bandit.pick(arms)]
+        return random.randint(lo, min(hi, limit))
+
+    def record(self, template, length, seconds, rewards):
+        cost, bandit = self.template(template)
+        cost.record(length, seconds)
+        for i, (lo, hi) in enumerate(self.buckets):
+            if length <= hi or i == len(self.buckets) - 1:
+                bandit.credit(i, seconds, rewards)
+                break
+
+    def report(self):
+        return ", ".join(
+            "template {} up to {} words".format(template, self.max_length(template))
+            for template in sorted(self.costs)
+        )
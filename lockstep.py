@@ -0,0 +1,139 @@
+import re
+import time
+from collections import deque, namedtuple
+
+import spawner
+
+""" Lock-step comparison of two commit traces
+
+Both reference models run with their commit log going to a pipe, in the
+format of `spike -l --log-commits`:
+
+    core   0: 3 0x0000000080000000 (0x00000297) x5  0x0000000080000000
+
+Commits are compared one by one as they stream in: PC, instruction word
+and the integer / float register writebacks (only when both models report
+them).  The models are started through spawner.stream(); at the first
+difference both pipes are closed, which ends the models, so a divergent
+test costs as long as it takes to reach the divergence instead of a full
+run, and the divergence itself is the report.
+"""
+
+COMMIT_RE = re.compile(r"core\s+\d+:\s+\d\s+0x([0-9a-f]+)\s+\(0x([0-9a-f]+)\)(.*)")
+WRITE_RE = re.compile(r"\b([xf]\d+)\s+0x([0-9a-f]+)")
+
+Commit = namedtuple("Commit", "pc inst writes")
+StreamResult = namedtuple("StreamResult", "returncode killed timed_out elapsed")
+
+
+def parse_commit(line):
+    m = COMMIT_RE.search(line)
+    if m is None:
+        return None
+    writes = tuple(
+        (reg, int(value, 16))
+        for reg, value in WRITE_RE.findall(m.group(3))
+        if reg not in ["x0"]
+    )
+    return Commit(int(m.group(1), 16), int(m.group(2), 16), writes)
+
+
+def format_commit(commit):
+    if commit is None:
+        return "<end of trace>"
+    writes = " ".join("{} 0x{:016x}".format(reg, value) for reg, value in commit.writes)
+    return "0x{:016x} (0x{:08x}) {}".format(commit.pc, commit.inst, writes).rstrip()
+
+
+def same_commit(a, b):
+    if a.pc != b.pc or a.inst != b.inst:
+        return False
+    # A model that doesn't log writebacks can only be checked on the PC
+    return not a.writes or not b.writes or a.writes == b.writes
+
+
+class rvLockstep:
+    def __init__(self, start, context=8):
+        # Commits before the first one at `start` are each model's boot code
+        self.start = start
+        self.context = context
+        self.commits = 0
+        self.divergences = 0
+
+    def commits_of(self, stream):
+        started = False
+        for raw in stream:
+            commit = parse_commit(raw.decode(errors="replace"))
+            if commit is None:
+                continue
+            if not started:
+                if commit.pc != self.start:
+                    continue
+                started = True
+            yield commit
+
+    def run(self, names, commands, streams, timeout):
+        """Divergence report (None if the traces agree) and a StreamResult per model"""
+        start = time.time()
+        procs = [
+            spawner.stream(cmd, stream, timeout)
+            for cmd, stream in zip(commands, streams)
+        ]
+
+        traces = [self.commits_of(proc.pipe) for proc in procs]
+        history = deque(maxlen=self.context)
+        divergence = None
+        # Models whose trace was cut off at the divergence
+        cut = [False, False]
+        n = 0
+        try:
+            while True:
+                a = next(traces[0], None)
+                b = next(traces[1], None)
+                if a is None and b is None:
+                    break
+                if a is None or b is None or not same_commit(a, b):
+                    divergence = (n, a, b, list(history))
+                    cut = [a is not None, b is not None]
+                    break
+                history.append(a)
+                n += 1
+        finally:
+            # Closing the pipes ends a model that is still running (SIGPIPE)
+            for proc in procs:
+                proc.close()
+            spawned = [proc.wait() for proc in procs]
+
+        elapsed = time.time() - start
+        timed_out = any(result.timed_out for result in spawned)
+        # A model killed by the timeout ends its trace, that is no divergence
+        if timed_out:
+            divergence = None
+            cut = [False, False]
+        self.commits += n
+        if divergence is not None:
+            self.divergences += 1
+
+        results = [
+            StreamResult(result.returncode, killed, timed_out, elapsed)
+            for result, killed in zip(spawned, cut)
+        ]
+        return self.describe(names, divergence), results
+
+    def describe(self, names, divergence):
+        if divergence is None:
+            return None
+        n, a, b, history = divergence
+        lines = ["lock-step divergence at commit {}\n".format(n)]
+        for name, commit in zip(names, [a, b]):
+            lines.append("  {:<6} {}\n".format(name, format_commit(commit)))
+        if history:
+            lines.append("last common commits:\n")
+            for commit in history:
+                lines.append("         {}\n".format(format_commit(commit)))
+        return "".join(lines)
+
+    def report(self):
+        return "lock-step {} commits compared, {} divergences".format(
+            self.commits, self.divergences
+        )
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import os
+import threading
+
+from backends import FAIL, MISMATCH, PASS, rvDiffRunner, rvEmuBackend
+from config import (
+    BACKENDS,
+    CC,
+    ELF2HEX,
+    MINIMIZE_EMU_TIMEOUT,
+    MINIMIZE_WORKERS,
+    OBJCOPY,
+)
+from mutator import MAIN, rvMutator
+from preprocessor import rvPreProcessor
+
+""" Test case minimizer
+
+ddmin over the main words of a saved mismatch: a candidate keeps a subset
+of the words, the others are turned into NOPs with rvMutator.make_nop and
+dropped with rvMutator.delete_nop, and the candidate is interesting if it
+still reproduces the mismatch:
+  - emu:  the reference model passes and the EMU fails
+  - diff: the backends in BACKENDS disagree
+
+The candidates of a ddmin round are built and run by MINIMIZE_WORKERS
+threads, each with its own scratch slot, preprocessor and backends.
+Verdicts are cached by the hash of the candidate program, since ddmin
+tries the same subset again after its granularity changes.
+
+    python minimize.py output/emu_mismatch/sim_input/<name>.si
+    python minimize.py output/diff_mismatch --kind diff
+
+Results go to <mismatch dir>/minimized/<name>.{si,S}.  The fuzzer runs
+this on the mismatches of a campaign after it when MINIMIZE is set.
+"""
+
+KINDS = ["emu", "diff"]
+
+
+def program_hash(sim_input, data):
+    text = [str(sim_input.template)]
+    text += sim_input.get_prefix() + sim_input.get_insts() + sim_input.get_suffix()
+    text += [str(i) for i in sim_input.ints] + ["{:x}".format(d) for d in data]
+    return hashlib.sha1("\n".join(text).encode()).hexdigest()
+
+
+def split(units, n):
+    size, rest = divmod(len(units), n)
+    chunks = []
+    start = 0
+    for i in range(n):
+        end = start + size + (1 if i < rest else 0)
+        chunks.append(units[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+
+class rvMinimizer:
+    def __init__(self, kind, out="output", template="Template", workers=None):
+        assert kind in KINDS, "Unknown mismatch kind {}".format(kind)
+        self.kind = kind
+        self.out = out
+        self.mutator = rvMutator()
+        self.workers = workers or MINIMIZE_WORKERS or os.cpu_count()
+
+        self.slots = ["min_{}".format(k) for k in range(self.workers)]
+        self.preprocessors = {
+            slot: rvPreProcessor(CC, ELF2HEX, OBJCOPY, template, out, slot)
+            for slot in self.slots
+        }
+        self.runners = {slot: rvDiffRunner(BACKENDS) for slot in self.slots}
+        # A candidate missing words can loop forever, a timeout doesn't reproduce
+        self.emu = rvEmuBackend(MINIMIZE_EMU_TIMEOUT)
+
+        # Program hash -> reproduces
+        self.verdicts = {}
+        self.runs = 0
+        self.hits = 0
+
+    def reproduces(self, slot, sim_input, data, intr):
+        key = program_hash(sim_input, data)
+        if key in self.verdicts:
+            self.hits += 1
+            return self.verdicts[key]
+
+        self.runs += 1
+        self.preprocessors[slot].process(sim_input, data, intr)
+        status, results, _ = self.runners[slot].run(slot, self.out, sim_input)
+        if self.kind == "diff":
+            verdict = status == MISMATCH
+        else:
+            verdict = (
+                results[0].status == PASS
+                and self.emu.run(slot, self.out).status == FAIL
+            )
+        self.verdicts[key] = verdict
+        return verdict
+
+    def candidate(self, sim_input, keep):
+        keep = set(keep)
+        mask = [i not in keep for i in range(sim_input.num_words)]
+        nop_input, _ = self.mutator.make_nop(sim_input, mask, MAIN)
+        return self.mutator.delete_nop(nop_input)[0]
+
+    def first_reproducing(self, sim_input, data, intr, subsets):
+        """First of `subsets` that still reproduces, evaluated a batch at a time"""
+        for start in range(0, len(subsets), self.workers):
+            batch = subsets[start : start + self.workers]
+            verdicts = [False] * len(batch)
+
+            def evaluate(k):
+                candidate = self.candidate(sim_input, batch[k])
+                verdicts[k] = self.reproduces(self.slots[k], candidate, data, intr)
+
+            threads = [
+                threading.Thread(target=evaluate, args=(k,)) for k in range(len(batch))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for subset, verdict in zip(batch, verdicts):
+                if verdict:
+                    return subset
+        return None
+
+    def ddmin(self, sim_input, data, intr):
+        units = list(range(sim_input.num_words))
+        n = 2
+        while len(units) >= 2:
+            chunks = split(units, n)
+            complements = []
+            for chunk in chunks:
+                drop = set(chunk)
+                complements.append([u for u in units if u not in drop])
+            found = self.first_reproducing(sim_input, data, intr, chunks)
+            if found is not None:
+                units, n = found, 2
+                continue
+            if n > 2:
+                found = self.first_reproducing(sim_input, data, intr, complements)
+                if found is not None:
+                    units, n = found, max(n - 1, 2)
+                    continue
+            if n >= len(units):
+                break
+            n = min(n * 2, len(units))
+        return units
+
+    def minimize(self, si_name):
+        """Minimized (sim_input, data, intr), None if the mismatch doesn't reproduce"""
+        sim_input, data, intr = self.mutator.read_siminput(si_name)
+        if not self.reproduces(self.slots[0], sim_input, data, intr):
+            return None
+        keep = self.ddmin(sim_input, data, intr)
+        return self.candidate(sim_input, keep), data, intr
+
+    def save(self, sim_input, data, intr, mismatch_dir, name):
+        os.makedirs(f"{mismatch_dir}/minimized", exist_ok=True)
+        sim_input.save(f"{mismatch_dir}/minimized/{name}.si", data)
+        # Rebuild it once more for the assembly
+        slot = self.slots[0]
+        self.preprocessors[slot].process(sim_input, data, intr)
+        try:
+            os.replace(
+                f"{self.out}/.input_{slot}.S", f"{mismatch_dir}/minimized/{name}.S"
+            )
+        except FileNotFoundError:
+            pass
+
+    def minimize_dir(self, mismatch_dir, names=None):
+        si_dir = f"{mismatch_dir}/sim_input"
+        if names is None:
+            names = sorted(
+                f[: -len(".si")] for f in os.listdir(si_dir) if f.endswith(".si")
+            )
+        for name in names:
+            if os.path.isfile(f"{mismatch_dir}/minimized/{name}.si"):
+                continue
+            self.minimize_file(f"{si_dir}/{name}.si", mismatch_dir)
+
+    def minimize_file(self, si_name, mismatch_dir=None):
+        if mismatch_dir is None:
+            mismatch_dir = os.path.dirname(os.path.dirname(os.path.abspath(si_name)))
+        name = os.path.basename(si_name)[: -len(".si")]
+        runs = self.runs
+        result = self.minimize(si_name)
+        if result is None:
+            print(f"[DifuzzMinimize] {name} does not reproduce")
+            return None
+        sim_input, data, intr = result
+        self.save(sim_input, data, intr, mismatch_dir, name)
+        print(
+            f"[DifuzzMinimize] {name} minimized to {sim_input.num_words} words "
+            f"in {self.runs - runs} runs ({self.hits} cached verdicts)"
+        )
+        return sim_input
+
+    def stop(self):
+        for runner in self.runners.values():
+            runner.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help=".si files or mismatch directories")
+    parser.add_argument("--kind", choices=KINDS, default="emu")
+    parser.add_argument("--out", default="output")
+    parser.add_argument("--template", default="Template")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    opts = parser.parse_args()
+
+    minimizer = rvMinimizer(opts.kind, opts.out, opts.template, opts.workers)
+    for path in opts.paths:
+        if os.path.isdir(path):
+            minimizer.minimize_dir(path.rstrip("/"))
+        else:
+            minimizer.minimize_file(path)
+    minimizer.stop()
@@ -1,8 +1,21 @@
 import os
 import random
-from copy import deepcopy
-
-from config import CORPUS_SIZE, GENERATOR_SELECTOR, NUM_PREFIX, NUM_SUFFIX, NUM_WORDS
+from collections import Counter
+
+from bandit import rvBandit
+from config import (
+    BANDIT_PRIOR_SECONDS,
+    CORPUS_SIZE,
+    GENERATOR_BANDIT,
+    GENERATOR_SELECTOR,
+    NUM_PREFIX,
+    NUM_SUFFIX,
+    NUM_WORDS,
+    OPERATOR_PERIOD,
+    OPERATOR_SCHEDULE,
+    SEED_AGE_HALF_LIFE,
+    TEST_TIME_BUDGET,
+)
 from inst_generator import (
     BitmaprGenerator,
     CBOGenerator,
@@ -22,12 +35,42 @@ from inst_generator import (
     MAIN,
     SUFFIX,
 )
+from distill import cost, greedy_cover, read_meta
+from governor import rvLengthGovernor
+from operators import OPERATORS, rvOperatorSchedule
+from schedule import rvSchedule
+from word import END, link_labels
+
+# In the order of GENERATOR_SELECTOR
+GENERATORS = [
+    CounterTimerGenerator,
+    ExceptionGenerator,
+    InterruptGenerator,
+    RandSwitchGenerator,
+    RandomInstGenerator,
+    IllLow2highGenerator,
+    M2SLegalSwitchGenerator,
+    S2ULegalSwitchGenerator,
+    HyperviserGenerator,
+    BitmaprGenerator,
+    MptGenerator,
+    CBOGenerator,
+    VectorGenerator,
+]
 
 """ Mutation phases """
 GENERATION = 0
 MUTATION = 1
 MERGE = 2
 
+""" mutate_words operators, in the order of operators.OPERATORS """
+INSERT = 0
+REPLACE = 1
+CLEAR = 2
+SHUFFLE = 3
+DUPLICATE = 4
+KEEP_WORD = 0.7
+
 """ Template versions """
 P_M = 0
 P_S = 1
@@ -40,6 +83,35 @@ PT = 4
 
 templates = ["m", "s", "u", "v", "pt"]
 
+""" Interesting 64-bit values for data mutation """
+INTERESTING_64 = [
+    0x0000000000000000,
+    0x0000000000000001,
+    0x000000000000007F,
+    0x0000000000000080,
+    0x00000000000000FF,
+    0x0000000000007FFF,
+    0x0000000000008000,
+    0x000000000000FFFF,
+    0x000000007FFFFFFF,
+    0x00000000FFFFFFFF,
+    0x0000000100000000,
+    0x7FFFFFFFFFFFFFFF,
+    0x8000000000000000,
+    0xFFFFFFFF80000000,
+    0xFFFFFFFFFFFFFFFF,
+    0x0000000080000000,  # DRAM base
+    0x7FF0000000000000,  # +inf (double)
+    0xFFF0000000000000,  # -inf (double)
+    0x7FF8000000000000,  # canonical NaN (double)
+    0x7FF0000000000001,  # signaling NaN (double)
+    0x000FFFFFFFFFFFFF,  # largest subnormal (double)
+    0xFFFFFFFF7FC00000,  # NaN-boxed canonical NaN (float)
+    0xFFFFFFFF7F800000,  # NaN-boxed +inf (float)
+    0xFFFFFFFF3F800000,  # NaN-boxed 1.0 (float)
+    0x000000003F800000,  # unboxed 1.0 (float)
+]
+
 
 class simInput:
     def __init__(
@@ -62,6 +134,8 @@ class simInput:
 
         self.data_seed = data_seed
         self.template = template
+        # Mutation operator counts of a mutated input, not saved
+        self.ops = None
 
     def save(self, name, data=[]):
         prefix_insts = self.get_prefix()
@@ -122,6 +196,11 @@ class rvMutator:
     def __init__(self, max_data_seeds=100, corpus_size=CORPUS_SIZE, no_guide=False):
         self.corpus_size = corpus_size
         self.corpus = []
+        # Energy of every corpus entry, self.oldest is the next one to evict
+        self.schedule = rvSchedule(SEED_AGE_HALF_LIFE)
+        self.oldest = 0
+        # (coverage bits, cost) of every corpus entry, None if not measured
+        self.infos = []
 
         self.phases = [GENERATION, MUTATION, MERGE]
         self.phase = GENERATION
@@ -131,35 +210,67 @@ class rvMutator:
         self.num_suffix = NUM_SUFFIX
 
         self.max_nWords = 20000
+        # Picks the program length per template against TEST_TIME_BUDGET
+        self.governor = None
+        if TEST_TIME_BUDGET > 0:
+            self.governor = rvLengthGovernor(
+                TEST_TIME_BUDGET, max(NUM_WORDS // 4, 1), self.max_nWords, NUM_WORDS
+            )
         self.no_guide = no_guide
 
         self.max_data = max_data_seeds
         self.random_data = {}
         self.data_seeds = []
+        # Corpus entries using each data seed, those are never recycled
+        self.corpus_data = Counter()
+
+        # Corpus files already known to this mutator (own or imported)
+        self.synced = set()
+
+        self.bandit = None
+        if GENERATOR_BANDIT == 1:
+            self.bandit = rvBandit(GENERATOR_SELECTOR, BANDIT_PRIOR_SECONDS)
+        # Operators applied by mutate_words since the last get()
+        self.operators = rvOperatorSchedule(OPERATOR_PERIOD, OPERATOR_SCHEDULE == 1)
+        self.ops = [0] * len(OPERATORS)
+
+        self.generator_ids = {
+            generator.__name__.lower(): i for i, generator in enumerate(GENERATORS)
+        }
 
     def inst_generator(self, seed=0):
-        generator_list = [
-            CounterTimerGenerator("RV64G"),
-            ExceptionGenerator("RV64G"),
-            InterruptGenerator("RV64G"),
-            RandSwitchGenerator("RV64G"),
-            RandomInstGenerator("RV64G"),
-            IllLow2highGenerator("RV64G"),
-            M2SLegalSwitchGenerator("RV64G"),
-            S2ULegalSwitchGenerator("RV64G"),
-            HyperviserGenerator("RV64G"),
-            BitmaprGenerator("RV64G"),
-            MptGenerator("RV64G"),
-            CBOGenerator("RV64G"),
-            VectorGenerator("RV64G"),
-        ]
-        return random.choices(generator_list, GENERATOR_SELECTOR)[0]
+        if self.bandit is not None:
+            idx = self.bandit.pick()
+        else:
+            idx = random.choices(range(len(GENERATORS)), GENERATOR_SELECTOR)[0]
+        return GENERATORS[idx]("RV64G")
+
+    def report_bandit(self):
+        return self.bandit.report([generator.__name__ for generator in GENERATORS])
+
+    def credit(self, generator_name, sim_input, seconds, rewards):
+        """Rewards (new coverage, mismatches) of a test and the time spent on it"""
+        if self.bandit is not None:
+            self.bandit.credit(self.generator_ids[generator_name], seconds, rewards)
+        self.operators.credit(sim_input.ops, rewards)
+        if self.governor is not None:
+            self.governor.record(
+                sim_input.get_template(), sim_input.num_words, seconds, rewards
+            )
+
+    def max_words(self, template):
+        if self.governor is not None:
+            return self.governor.max_length(template)
+        return self.max_nWords
 
     def add_data(self, new_data=[]):
-        if len(self.data_seeds) == self.max_data:
-            seed = self.data_seeds.pop(0)
-        else:
-            seed = len(self.data_seeds)
+        # Recycle the least recently used seed no corpus entry refers to
+        seed = len(self.random_data)
+        if len(self.data_seeds) >= self.max_data:
+            for i, old in enumerate(self.data_seeds):
+                if not self.corpus_data[old]:
+                    seed = self.data_seeds.pop(i)
+                    break
 
         if new_data:
             self.random_data[seed] = new_data
@@ -182,6 +293,41 @@ class rvMutator:
         self.data_seeds.pop(idx)
         self.data_seeds.append(seed)
 
+    def mutate_data(self, sim_input, data):
+        """Data only mutation of a built test
+
+        Returns a simInput sharing the words of sim_input with a new data
+        seed, so the image can be patched without recompiling.
+        """
+        new_data = list(data)
+        for _ in range(random.randint(1, 8)):
+            idx = random.randrange(len(new_data))
+            rand = random.random()
+            if rand < 0.4:
+                new_data[idx] ^= 1 << random.randint(0, 63)
+            elif rand < 0.7:
+                new_data[idx] = random.choice(INTERESTING_64)
+            elif rand < 0.85:
+                delta = random.randint(-35, 35)
+                new_data[idx] = (new_data[idx] + delta) & 0xFFFFFFFFFFFFFFFF
+            else:
+                # Splice a run of words from another data seed
+                other = self.random_data[random.choice(self.data_seeds)]
+                end = min(idx + random.randint(1, 16), len(new_data), len(other))
+                new_data[idx:end] = other[idx:end]
+
+        data_seed = self.add_data(new_data)
+        new_input = simInput(
+            sim_input.prefix,
+            sim_input.words,
+            sim_input.suffix,
+            sim_input.ints,
+            data_seed,
+            sim_input.template,
+        )
+
+        return (new_input, self.random_data[data_seed])
+
     def read_label(self, line, tuples):
         label = line[:8].split(":")[0]
         label_num = int(label[2:])
@@ -202,6 +348,7 @@ class rvMutator:
             word.populate({}, part)
 
             words.append(word)
+        link_labels(words)
 
         return words
 
@@ -308,6 +455,8 @@ class rvMutator:
             if mask:
                 new_word = Word(word.label, ["nop"])
                 new_word.populate({}, part)
+                # Jumps to the word now go to the NOP
+                new_word.uid = word.uid
                 new_target.append(new_word)
             else:
                 new_target.append(word)
@@ -323,7 +472,8 @@ class rvMutator:
                 else:
                     new_ints += [ints[k + j] for j in range(new_target[i].len_insts)]
 
-                k += new_target[i].len_insts
+                # Indices of the original program's instructions
+                k += target[i].len_insts
 
             min_input = simInput(
                 prefix, new_target, suffix, new_ints, data_seed, template
@@ -349,8 +499,7 @@ class rvMutator:
             tmps = []
             for word in target:
                 if word.insts != ["nop"]:
-                    new_word = deepcopy(word)
-                    tmps.append(new_word)
+                    tmps.append(word)
 
                 if part == MAIN:
                     if word.insts != ["nop"]:
@@ -379,53 +528,142 @@ class rvMutator:
         start = max(num_files - update_num, 0)
         for i in range(start, num_files):
             try:
-                (sim_input, _) = self.read_siminput(corpus_dir + "/id_{}.si".format(i))
+                sim_input, _ = self.read_siminput(corpus_dir + "/id_{}.si".format(i))
                 self.add_corpus(sim_input)
             except:
                 continue
 
-    def reset_labels(self, words, part):
-        n = 0
+    def sync_corpus(self, si_dir):
+        """Import seeds admitted by other workers, returns their coverage bits"""
+        imported = 0
+        try:
+            si_files = sorted(os.listdir(si_dir))
+        except FileNotFoundError:
+            return imported
 
-        label_map = {}
-        for n, word in enumerate(words):
-            tup = word.reset_label(n, part)
-            if tup:
-                label_map[tup[0]] = tup[1]
+        for si_file in si_files:
+            if si_file in self.synced:
+                continue
+            self.synced.add(si_file)
+            try:
+                sim_input, _, _ = self.read_siminput(si_dir + "/" + si_file)
+            except Exception:
+                continue
+            # Coverage record written next to the seed by the admitting worker
+            cov_name = "{}/../coverage/{}.cov".format(si_dir, si_file[: -len(".si")])
+            try:
+                exec_time, _, bits = read_meta(cov_name)
+            except Exception:
+                exec_time, bits = None, None
+            else:
+                imported |= bits
+            # Only the worker that admitted the seed grows the program length
+            self.add_corpus(sim_input, exec_time=exec_time, bits=bits, grow=False)
+
+        return imported
+
+    def reset_labels(self, words, part):
+        """Number the words in order and retarget their label references
 
+        Words are shared between corpus entries (copy-on-write), so a word
+        is only copied when its label or one of its targets changes.  A
+        reference to a word that is gone gets a random later label.
+        """
         max_label = len(words)
+        index = {}
+        for n in range(max_label - 1, -1, -1):
+            word = words[n]
+            if word.uid in index:
+                # A duplicate, references go to the last one
+                word = words[n] = word.copy()
+                word.uid = next(Word.uids)
+            index[word.uid] = n
+        index[END] = max_label
 
-        for word in words:
-            word.repop_label(label_map, max_label, part)
+        for n, word in enumerate(words):
+            if word.label == n and all(
+                index.get(uid) == label for _, _, uid, label in word.refs
+            ):
+                continue
+            refs = []
+            for i, pos, uid, label in word.refs:
+                label = index.get(uid)
+                if label is None:
+                    label = random.randint(n + 1, max_label)
+                    uid = words[label].uid if label < max_label else END
+                refs.append((i, pos, uid, label))
+            word = words[n] = word.copy()
+            word.relabel(n, refs)
 
         return words
 
     def mutate_words(self, seed_words, part, max_num):
-        words = []
-
+        """Mutate a word sequence in O(n)
+
+        Same operators as appending/inserting into a list word by word, but
+        the operators are drawn first and the words placed afterwards:
+        everything before the last clear is dropped, everything up to the
+        last shuffle ends up in random order, and walking the later appends
+        and random inserts backwards, an append takes the last free slot of
+        the result and a random insert a uniformly random free slot.  New
+        words are only generated for slots that survive the cut at max_num.
+        """
+        # (random insert, word or None for a new word), in order
+        events = []
+        # events[:shuffled] were shuffled together
+        shuffled = 0
         for word in seed_words:
-            rand = random.random()
-            if rand < 0.7:
-                words.append(word)
-            elif rand < 0.75:
-                words.append(word)
-                k = random.randint(0, 10)
-                while k > 0:
-                    new_word = self.inst_generator().get_word(part)
-                    words.append(new_word)
-                    k -= 1
-            elif rand < 0.8:
-                new_word = self.inst_generator().get_word(part)
-                words.append(new_word)
-            elif rand < 0.82:
-                words.clear()
-                words.append(word)
-            elif rand < 0.9:
-                words.append(word)
-                random.shuffle(words)
+            if random.random() < KEEP_WORD:
+                events.append((False, word))
+                continue
+
+            op = self.operators.pick()
+            self.ops[op] += 1
+            if op == INSERT:
+                events.append((False, word))
+                events += [(False, None)] * random.randint(0, 10)
+            elif op == REPLACE:
+                events.append((False, None))
+            elif op == CLEAR:
+                events = [(False, word)]
+                shuffled = 0
+            elif op == SHUFFLE:
+                events.append((False, word))
+                shuffled = len(events)
+            else:
+                events.append((True, word))
+
+        num = len(events)
+        words = [None] * num
+        # Free slots of the result, with the index of every slot in the list
+        free = list(range(num))
+        index = list(range(num))
+        last = num - 1
+        for random_insert, word in reversed(events[shuffled:]):
+            if random_insert:
+                slot = free[random.randrange(len(free))]
             else:
-                words.insert(random.randint(0, len(words)), word)
+                while index[last] < 0:
+                    last -= 1
+                slot = last
+            # Swap-remove the slot from the free list
+            i = index[slot]
+            moved = free.pop()
+            if moved != slot:
+                free[i] = moved
+                index[moved] = i
+            index[slot] = -1
+            words[slot] = word
+
+        base = [word for _, word in events[:shuffled]]
+        random.shuffle(base)
+        for slot, word in zip(free, base):
+            words[slot] = word
+
         words = words[0:max_num]
+        for n, word in enumerate(words):
+            if word is None:
+                words[n] = self.inst_generator().get_word(part)
         words = self.reset_labels(words, part)
 
         return words
@@ -441,11 +679,15 @@ class rvMutator:
 
         data_seed = -1
         template = random.choice(generator.templates)
+        self.ops = [0] * len(OPERATORS)
         if self.phase == GENERATION:
+            num_words = self.num_words
+            if self.governor is not None:
+                num_words = self.governor.length(template)
             for n in range(self.num_prefix):
                 word = generator.get_word(PREFIX)
                 prefix.append(word)
-            for n in range(self.num_words):
+            for n in range(num_words):
                 word = generator.get_word(MAIN)
                 words.append(word)
             for n in range(self.num_suffix):
@@ -455,22 +697,24 @@ class rvMutator:
         elif self.phase in [MUTATION, MERGE]:
             if self.phase == MUTATION:
                 print("[rvMutator] phase MUTATION")
-                seed_si = random.choice(self.corpus)
-                seed_prefix = deepcopy(seed_si.prefix)
-                seed_words = deepcopy(seed_si.words)
-                seed_suffix = deepcopy(seed_si.suffix)
+                seed_si = self.pick_seed()
+                # The words are shared with the seed, reset_labels copies
+                # the ones that change
+                seed_prefix = list(seed_si.prefix)
+                seed_words = list(seed_si.words)
+                seed_suffix = list(seed_si.suffix)
                 data_seed = seed_si.get_seed()
                 template = seed_si.get_template()
             else:
                 print("[rvMutator] phase MERGE")
                 seed_words = []
-                seed_si1 = random.choice(self.corpus)
-                seed_si2 = random.choice(self.corpus)
+                seed_si1 = self.pick_seed()
+                seed_si2 = self.pick_seed()
 
-                seed_prefix = deepcopy(seed_si1.prefix)
-                si1_words = deepcopy(seed_si1.words)
-                si2_words = deepcopy(seed_si2.words)
-                seed_suffix = deepcopy(seed_si1.suffix)
+                seed_prefix = list(seed_si1.prefix)
+                si1_words = seed_si1.words
+                si2_words = seed_si2.words
+                seed_suffix = list(seed_si1.suffix)
                 idx = random.randint(0, min(len(si1_words), len(si2_words)))
 
                 for i in range(idx):
@@ -481,7 +725,7 @@ class rvMutator:
                 template = seed_si1.get_template()
 
             prefix = self.mutate_words(seed_prefix, PREFIX, self.num_prefix)
-            words = self.mutate_words(seed_words, MAIN, self.max_nWords)
+            words = self.mutate_words(seed_words, MAIN, self.max_words(template))
             suffix = self.mutate_words(seed_suffix, SUFFIX, self.num_suffix)
 
         for word in prefix:
@@ -495,6 +739,9 @@ class rvMutator:
         for word in suffix:
             generator.populate_word(word, len(suffix), SUFFIX)
 
+        for part in [prefix, words, suffix]:
+            link_labels(part)
+
         ints = [0 for i in range(i_len)]
         if assert_intr:
             idx = random.randint(0, min(len(ints), 10) - 1)
@@ -506,12 +753,15 @@ class rvMutator:
         else:
             self.update_data_seeds(data_seed)
         sim_input = simInput(prefix, words, suffix, ints, data_seed, template)
+        if self.phase in [MUTATION, MERGE]:
+            sim_input.ops = self.ops
         data = self.random_data[data_seed]
 
         return (sim_input, data, type(generator).__name__.lower())
 
     def update_phase(self, it):
-        if it < self.corpus_size / 100 or self.no_guide:
+        # Nothing to mutate before the first test is admitted
+        if it < self.corpus_size / 100 or self.no_guide or not self.corpus:
             self.phase = GENERATION
         else:
             rand = random.random()
@@ -522,9 +772,44 @@ class rvMutator:
             else:
                 self.phase = MERGE
 
-    def add_corpus(self, sim_input):
-        self.corpus.append(sim_input)
-
-        self.num_words = min(self.num_words + 1, self.max_nWords)
-        if len(self.corpus) > self.corpus_size:
-            self.corpus.pop(0)
+    def pick_seed(self):
+        return self.corpus[self.schedule.pick()]
+
+    def add_corpus(self, sim_input, found=0, exec_time=None, bits=None, grow=True):
+        """found: cover points the seed hit first, exec_time and bits of its run if known"""
+        self.corpus_data[sim_input.get_seed()] += 1
+        size = sim_input.num_words
+        info = None
+        if bits is not None:
+            info = (bits, cost(exec_time or 0, size))
+
+        if len(self.corpus) < self.corpus_size:
+            self.corpus.append(sim_input)
+            self.infos.append(info)
+            self.schedule.add(exec_time, size, found)
+        else:
+            # Overwrite the oldest entry in place instead of shifting the lists
+            i = self.oldest
+            self.corpus_data[self.corpus[i].get_seed()] -= 1
+            self.corpus[i] = sim_input
+            self.infos[i] = info
+            self.schedule.replace(i, exec_time, size, found)
+            self.oldest = (i + 1) % len(self.corpus)
+
+        if grow and self.governor is None:
+            self.num_words = min(self.num_words + 1, self.max_nWords)
+
+    def distill(self):
+        """Keep the favored seeds and the unmeasured ones, returns the number evicted"""
+        # Oldest first, so eviction keeps going in admission order afterwards
+        order = list(range(self.oldest, len(self.corpus))) + list(range(self.oldest))
+        measured = [i for i in order if self.infos[i] is not None]
+        favored = {measured[i] for i in greedy_cover([self.infos[i] for i in measured])}
+        keep = [i for i in order if self.infos[i] is None or i in favored]
+        evicted = len(self.corpus) - len(keep)
+        self.corpus = [self.corpus[i] for i in keep]
+        self.corpus_data = Counter(si.get_seed() for si in self.corpus)
+        self.infos = [self.infos[i] for i in keep]
+        self.schedule.keep(keep)
+        self.oldest = 0
+        return evicted
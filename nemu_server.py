@@ -0,0 +1,139 @@
+import os
+import select
+import shlex
+import signal
+import subprocess
+import time
+
+""" Resident NEMU execution harness
+
+Starting `riscv64-nemu-interpreter -b` for every test pays the emulator's
+whole startup (argument parsing, memory and device setup) before the first
+instruction runs.  A resident NEMU started with NEMU_SERVER_CMD instead
+keeps that state and executes one image per request, forking before every
+run so a test can't leave anything behind for the next one.
+
+Line protocol over the server's stdin / stdout:
+    server -> READY
+    client -> RUN <path to .bin>
+    server -> EXIT <status>
+A test that doesn't answer within the timeout gets the whole server killed
+and restarted.  Whenever the server can't be started or talks nonsense the
+caller falls back to spawning NEMU per test.
+
+nemu_stub.py implements the server side of the protocol, so the harness can
+be exercised without a NEMU build.
+"""
+
+READY = "READY"
+
+
+class ServerError(Exception):
+    pass
+
+
+class rvNemuServer:
+    def __init__(self, cmd, start_timeout=10, max_restarts=3):
+        self.cmd = shlex.split(cmd)
+        self.start_timeout = start_timeout
+        self.max_restarts = max_restarts
+
+        self.proc = None
+        self.buf = b""
+        self.starts = 0
+        self.runs = 0
+        self.timeouts = 0
+        self.failures = 0
+        # Once the server failed too often every test is spawned instead
+        self.disabled = False
+
+    def start(self):
+        self.buf = b""
+        self.starts += 1
+        self.proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        line = self.readline(self.start_timeout)
+        if line != READY:
+            raise ServerError("bad handshake {!r}".format(line))
+
+    def stop(self):
+        if self.proc is None:
+            return
+        # The server and the test it forked share a process group
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc.wait()
+        self.proc = None
+
+    def readline(self, timeout):
+        """Next line from the server, None on timeout"""
+        deadline = time.time() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self.buf:
+            left = deadline - time.time()
+            if left <= 0 or not select.select([fd], [], [], left)[0]:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise ServerError("server exited")
+            self.buf += chunk
+
+        line, _, self.buf = self.buf.partition(b"\n")
+        return line.decode().strip()
+
+    def run(self, bin_name, timeout):
+        """Exit status of the test, -1 on timeout, None if the server is unusable"""
+        if self.disabled:
+            return None
+
+        try:
+            if self.proc is None:
+                self.start()
+            self.proc.stdin.write("RUN {}\n".format(os.path.abspath(bin_name)).encode())
+            self.proc.stdin.flush()
+            line = self.readline(timeout)
+        except (OSError, ServerError) as e:
+            self.fail(e)
+            return None
+
+        if line is None:
+            self.timeouts += 1
+            self.stop()
+            return -1
+
+        fields = line.split()
+        try:
+            if len(fields) != 2 or fields[0] != "EXIT":
+                raise ValueError
+            status = int(fields[1])
+        except ValueError:
+            self.fail(ServerError("bad reply {!r}".format(line)))
+            return None
+
+        self.runs += 1
+        self.failures = 0
+        return status
+
+    def fail(self, e):
+        self.stop()
+        self.failures += 1
+        if self.failures >= self.max_restarts:
+            print("[DifuzzNEMU] server disabled, spawning NEMU per test: {}".format(e))
+            self.disabled = True
+
+    def report(self):
+        return "{} runs, {} timeouts, {} starts{}".format(
+            self.runs,
+            self.timeouts,
+            self.starts,
+            ", disabled" if self.disabled else "",
+        )
@@ -0,0 +1,139 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+
+""" Stand-in for riscv64-nemu-interpreter
+
+Speaks both ways of running a test so the harness can be tried without a
+NEMU build:
+    python3 nemu_stub.py -b test.bin     exit status of one test
+    python3 nemu_stub.py --server        resident mode, see nemu_server.py
+
+Nothing is emulated.  A test "passes" unless its image is empty or holds
+the --fail word, and loops forever when it holds the --hang word, which
+by default is `j .` (0x0000006f), unless an instruction limit (-I) is set.
+--startup models NEMU's start-up cost.
+
+--log-commits prints a Spike style commit log (to stderr with
+--log-stderr), made up from the image words as if they ran in a row from
+0x80000000; --boot adds a few commits of boot code before it and
+--diverge N changes the writeback of commit N, for lock-step testing.
+Opcodes and opcode pairs of the image are reported into the coverage map
+named by DIFUZZ_COVERAGE_MAP (see coverage_map.py).
+"""
+
+
+def log_commits(words, args):
+    out = sys.stderr if args.log_stderr else sys.stdout
+    if args.boot:
+        for pc in range(0x1000, 0x1010, 4):
+            out.write("core   0: 3 0x{:016x} (0x00000013)\n".format(pc))
+
+    pc = 0x80000000
+    for i, word in enumerate(words):
+        value = (pc * 0x9E3779B1 ^ word) & 0xFFFFFFFFFFFFFFFF
+        if i == args.diverge:
+            value ^= 1
+        out.write(
+            "core   0: 3 0x{:016x} (0x{:08x}) x{:<2} 0x{:016x}\n".format(
+                pc, word, (word >> 7) & 31, value
+            )
+        )
+        if word == args.hang and args.max_instr == 0:
+            # Keep committing the same jump, like a real `j .`
+            while True:
+                out.write("core   0: 3 0x{:016x} (0x{:08x})\n".format(pc, word))
+        pc += 4
+    out.flush()
+
+
+def report_coverage(trace):
+    # Opcode and instruction-pair events, hashed into the fuzzer's map
+    path = os.environ.get("DIFUZZ_COVERAGE_MAP")
+    if not path:
+        return
+    fd = open(path, "r+b")
+    cov = mmap.mmap(fd.fileno(), 0)
+    fd.close()
+    size = len(cov)
+    prev = 0
+    for word in trace:
+        for event in [word & 0x707F, (prev * 31 + (word & 0x7F)) & 0xFFFF]:
+            k = (event * 0x9E3779B1 >> 7) % size
+            cov[k] = min(cov[k] + 1, 255)
+        prev = word & 0x7F
+    cov.close()
+
+
+def execute(bin_name, args):
+    try:
+        fd = open(bin_name, "rb")
+        image = fd.read()
+        fd.close()
+    except OSError:
+        return 1
+
+    trace = [
+        int.from_bytes(image[i : i + 4], "little") for i in range(0, len(image) - 3, 4)
+    ]
+    report_coverage(trace)
+    if args.log_commits:
+        log_commits(trace, args)
+    words = set(trace)
+    if args.hang in words:
+        if args.max_instr > 0:
+            return 1
+        while True:
+            time.sleep(1)
+    if not image or args.fail in words:
+        return 1
+    return 0
+
+
+def serve(args):
+    out = sys.stdout
+    out.write("READY\n")
+    out.flush()
+    for line in sys.stdin:
+        fields = line.split()
+        if len(fields) != 2 or fields[0] != "RUN":
+            out.write("ERROR {}\n".format(line.strip()))
+            out.flush()
+            continue
+
+        # Fork server: every test runs in a fresh copy of the started emulator
+        pid = os.fork()
+        if pid == 0:
+            os._exit(execute(fields[1], args))
+        _, status = os.waitpid(pid, 0)
+        out.write("EXIT {}\n".format(os.waitstatus_to_exitcode(status)))
+        out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", dest="bin_name")
+    parser.add_argument("--server", action="store_true")
+    parser.add_argument("-I", dest="max_instr", type=int, default=0)
+    parser.add_argument("--log-commits", action="store_true")
+    parser.add_argument("--log-stderr", action="store_true")
+    parser.add_argument("--boot", action="store_true")
+    parser.add_argument("--diverge", type=int, default=-1)
+    parser.add_argument("--startup", type=float, default=0.0)
+    parser.add_argument("--hang", type=lambda x: int(x, 0), default=0x0000006F)
+    parser.add_argument("--fail", type=lambda x: int(x, 0), default=-1)
+    args = parser.parse_args()
+
+    time.sleep(args.startup)
+    if args.server:
+        serve(args)
+        return 0
+    if args.bin_name is None:
+        parser.error("one of -b or --server is required")
+    return execute(args.bin_name, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import fcntl
+import json
+import os
+import random
+
+""" Mutation operator scheduling for mutate_words
+
+mutate_words keeps a word with a fixed probability and otherwise applies
+one of the operators below.  Which operator is picked is learned online,
+in the style of MOpt: a few swarms (particles) each hold a probability
+distribution over the operators.  The swarm in use is credited, for every
+executed test, with the operators that built it and the rewards the test
+earned.  After OPERATOR_PERIOD tests its position moves by particle swarm
+optimization towards the best distribution it has seen itself (per
+operator, the probability at which that operator's yield per use peaked)
+and towards the campaign-wide yield per use of every operator, then the
+next swarm takes over.
+
+The swarms and the campaign totals are saved to a JSON file at the end
+of a run and loaded at the start of the next one.  The workers of a
+campaign share the file: a save adds what this worker learned since its
+load to the totals in the file and keeps, per swarm and operator, the
+best distribution of either side.
+"""
+
+OPERATORS = ["insert", "replace", "clear", "shuffle", "duplicate"]
+# The hard-coded mix mutate_words had: 5%, 5%, 2%, 8%, 10% of all words
+DEFAULT_MIX = [5 / 30, 5 / 30, 2 / 30, 8 / 30, 10 / 30]
+
+NUM_SWARMS = 5
+INERTIA = 0.7
+# No operator is ever starved of tries
+P_MIN = 0.02
+P_MAX = 0.8
+
+
+def normalize(probs):
+    probs = [min(max(p, P_MIN), P_MAX) for p in probs]
+    total = sum(probs)
+    return [p / total for p in probs]
+
+
+class rvOperatorSchedule:
+    def __init__(self, period, learn=True):
+        self.period = period
+        self.learn = learn
+        n = len(OPERATORS)
+
+        # Swarm 0 starts at the old mix, the others around it
+        self.x = [DEFAULT_MIX] + [
+            normalize([p * random.uniform(0.5, 1.5) for p in DEFAULT_MIX])
+            for _ in range(NUM_SWARMS - 1)
+        ]
+        self.v = [[0.0] * n for _ in range(NUM_SWARMS)]
+        self.best = [list(x) for x in self.x]
+        self.best_yield = [[0.0] * n for _ in range(NUM_SWARMS)]
+        self.total_uses = [0] * n
+        self.total_finds = [0.0] * n
+        # The totals as loaded, what a save adds to the file is the difference
+        self.base_uses = [0] * n
+        self.base_finds = [0.0] * n
+
+        self.swarm = 0
+        self.execs = 0
+        self.uses = [0] * n
+        self.finds = [0.0] * n
+        self.updates = 0
+        self.set_probs(DEFAULT_MIX)
+
+    def set_probs(self, probs):
+        self.cum = []
+        total = 0.0
+        for p in probs:
+            total += p
+            self.cum.append(total)
+
+    def pick(self):
+        return random.choices(range(len(OPERATORS)), cum_weights=self.cum)[0]
+
+    def credit(self, ops, rewards):
+        """ops: how often each operator was applied to build the test"""
+        if not self.learn or ops is None:
+            return
+        for op, count in enumerate(ops):
+            if count:
+                self.uses[op] += count
+                self.finds[op] += rewards
+        self.execs += 1
+        if self.execs >= self.period:
+            self.update()
+
+    def update(self):
+        s = self.swarm
+        for op in range(len(OPERATORS)):
+            self.total_uses[op] += self.uses[op]
+            self.total_finds[op] += self.finds[op]
+            if self.uses[op]:
+                op_yield = self.finds[op] / self.uses[op]
+                if op_yield > self.best_yield[s][op]:
+                    self.best_yield[s][op] = op_yield
+                    self.best[s][op] = self.x[s][op]
+
+        # Campaign-wide yield per use, as a distribution
+        total_yield = [
+            finds / uses if uses else 0.0
+            for finds, uses in zip(self.total_finds, self.total_uses)
+        ]
+        if sum(total_yield) > 0:
+            target = normalize(total_yield)
+            x = self.x[s]
+            for op in range(len(OPERATORS)):
+                self.v[s][op] = (
+                    INERTIA * self.v[s][op]
+                    + random.random() * (self.best[s][op] - x[op])
+                    + random.random() * (target[op] - x[op])
+                )
+            self.x[s] = normalize([p + dv for p, dv in zip(x, self.v[s])])
+
+        self.updates += 1
+        self.swarm = (s + 1) % NUM_SWARMS
+        self.set_probs(self.x[self.swarm])
+        self.execs = 0
+        self.uses = [0] * len(OPERATORS)
+        self.finds = [0.0] * len(OPERATORS)
+
+    def read(self, name):
+        try:
+            fd = open(name)
+            state = json.load(fd)
+            fd.close()
+        except (FileNotFoundError, ValueError):
+            return None
+        if state.get("operators") != OPERATORS:
+            return None
+        return state
+
+    def merge(self, state):
+        """Add the totals learned since the load to those of the file"""
+        for op in range(len(OPERATORS)):
+            self.total_uses[op] += state["total_uses"][op] - self.base_uses[op]
+            self.total_finds[op] += state["total_finds"][op] - self.base_finds[op]
+            for s in range(NUM_SWARMS):
+                if state["best_yield"][s][op] > self.best_yield[s][op]:
+                    self.best_yield[s][op] = state["best_yield"][s][op]
+                    self.best[s][op] = state["best"][s][op]
+
+    def save(self, name):
+        lock = open(name + ".lock", "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Tests since the last update count too
+            for op in range(len(OPERATORS)):
+                self.total_uses[op] += self.uses[op]
+                self.total_finds[op] += self.finds[op]
+            self.uses = [0] * len(OPERATORS)
+            self.finds = [0.0] * len(OPERATORS)
+            self.execs = 0
+
+            state = self.read(name)
+            if state is not None:
+                self.merge(state)
+            self.base_uses = list(self.total_uses)
+            self.base_finds = list(self.total_finds)
+
+            state = {
+                "operators": OPERATORS,
+                "x": self.x,
+                "v": self.v,
+                "best": self.best,
+                "best_yield": self.best_yield,
+                "total_uses": self.total_uses,
+                "total_finds": self.total_finds,
+            }
+            tmp_name = "{}.{}.tmp".format(name, os.getpid())
+            fd = open(tmp_name, "w")
+            json.dump(state, fd, indent=1)
+            fd.close()
+            os.replace(tmp_name, name)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def load(self, name):
+        state = self.read(name)
+        if state is None:
+            return False
+        self.x = state["x"]
+        self.v = state["v"]
+        self.best = state["best"]
+        self.best_yield = state["best_yield"]
+        self.total_uses = state["total_uses"]
+        self.total_finds = state["total_finds"]
+        self.base_uses = list(self.total_uses)
+        self.base_finds = list(self.total_finds)
+        self.set_probs(self.x[self.swarm])
+        return True
+
+    def report(self):
+        probs = [b - a for a, b in zip([0.0] + self.cum, self.cum)]
+        return "mutation operators {} ({} updates)".format(
+            ", ".join("{} {:.2f}".format(name, p) for name, p in zip(OPERATORS, probs)),
+            self.updates,
+        )
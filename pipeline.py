@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+
+""" Pipelined test execution
+
+Each stage runs in its own thread and is connected to the next one by a
+bounded queue.  Toolchain and emulator stages spend their time waiting for
+child processes, so while test N is in NEMU, test N+1 can already be
+generated and assembled.
+
+Every stage records how long it was busy, how long it starved waiting for
+input and how long it was blocked on a full output queue, which shows the
+bottleneck stage of a campaign.
+"""
+
+STOP = None
+
+
+class rvStage:
+    def __init__(self, name, func, inq=None, outq=None):
+        # func(item) returns the item for the next stage, or None to drop it.
+        # The first stage (inq is None) is called with no item and returns
+        # STOP when the campaign is over.
+        self.name = name
+        self.func = func
+        self.inq = inq
+        self.outq = outq
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self.starve_time = 0.0
+        self.block_time = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.error = None
+
+    def _get(self):
+        start = time.time()
+        item = self.inq.get()
+        self.starve_time += time.time() - start
+        return item
+
+    def _put(self, item):
+        if self.outq is None:
+            return
+        start = time.time()
+        self.outq.put(item)
+        self.block_time += time.time() - start
+
+    def run(self):
+        try:
+            while True:
+                if self.inq is None:
+                    start = time.time()
+                    item = self.func()
+                    if item is STOP:
+                        break
+                else:
+                    depth = self.inq.qsize()
+                    self.depth_sum += depth
+                    self.depth_max = max(self.depth_max, depth)
+
+                    item = self._get()
+                    if item is STOP:
+                        break
+                    start = time.time()
+                    item = self.func(item)
+
+                self.busy_time += time.time() - start
+                self.processed += 1
+                if item is not None:
+                    self._put(item)
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            self._put(STOP)
+
+    def report(self, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        depth_avg = self.depth_sum / self.processed if self.processed else 0.0
+        depth_cap = self.inq.maxsize if self.inq is not None else 0
+        return (
+            "[DifuzzPipeline] stage {:<6} {:>7} items, busy {:5.1f}%, "
+            "starved {:8.2f}s, blocked {:8.2f}s, queue avg {:.2f} max {}/{}".format(
+                self.name,
+                self.processed,
+                100 * self.busy_time / elapsed,
+                self.starve_time,
+                self.block_time,
+                depth_avg,
+                self.depth_max,
+                depth_cap,
+            )
+        )
+
+
+class rvPipeline:
+    def __init__(self, depth=2, report_interval=60):
+        self.depth = depth
+        self.report_interval = report_interval
+        self.stages = []
+
+    def add_stage(self, name, func):
+        stage = rvStage(name, func)
+        self.stages.append(stage)
+        return stage
+
+    def in_flight(self):
+        # Maximum number of items alive at the same time: one per stage plus
+        # the contents of every queue
+        return len(self.stages) + self.depth * (len(self.stages) - 1)
+
+    def run(self):
+        for prev, stage in zip(self.stages, self.stages[1:]):
+            stage.inq = queue.Queue(maxsize=self.depth)
+            prev.outq = stage.inq
+
+        threads = [
+            threading.Thread(target=stage.run, name=stage.name, daemon=True)
+            for stage in self.stages
+        ]
+        start = time.time()
+        last_report = start
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            threads[-1].join(timeout=1)
+            if any(stage.error is not None for stage in self.stages):
+                # Upstream stages may be blocked on a queue nobody drains
+                break
+            now = time.time()
+            if now - last_report >= self.report_interval:
+                self.report(now - start)
+                last_report = now
+
+        self.report(time.time() - start)
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def report(self, elapsed):
+        for stage in self.stages:
+            print(stage.report(elapsed))
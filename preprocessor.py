@@ -1,11 +1,33 @@
+import hashlib
 import os
-import subprocess
+import re
 import shutil
 import random
 
-from config import CC_ARCH
+import spawner
+
+from build_cache import dir_digest, file_digest, rvBuildCache
+from config import (
+    BUILD_CACHE_SIZE,
+    CC_ARCH,
+    FAST_ENCODE,
+    FAST_ENCODE_RESERVE,
+    FAST_ENCODE_VALIDATE,
+    TEMPLATE_OBJECTS,
+)
+from elf_reader import rvElf
+from encoder import EncodeError, enc_j, rvEncoder
 from mutator import PT, simInput, templates, P_M, P_S, P_U, V_U
 
+FUZZ_MARKERS = ["_fuzz_prefix", "_fuzz_main", "_fuzz_suffix"]
+
+SECTION_RE = re.compile(r'^\s*\.section\s+"?([^\s,;"]+)')
+SHORT_SECTION_RE = re.compile(r"^\s*\.(text|data|bss)\b")
+DATA_LABEL_RE = re.compile(r"^\s*(d_\d+_\d+):")
+RANDOM_DATA_RE = re.compile(r"^\s*_random_data(\d+):")
+END_DATA_RE = re.compile(r"^\s*_end_data\d+:")
+SIZE_RE = re.compile(r"^\s*\.size\b")
+
 
 class rvPreProcessor:
     def __init__(
@@ -59,27 +81,131 @@ class rvPreProcessor:
             "-Wl,--gc-sections",
             "-o",
         ]
-        self.elf2hex_args = [elf2hex, "--bit-width", "64", "--input"]
-        self.objdump_args = [objdump, "-O", "binary"]
 
-    def get_symbols(self, elf_name, sym_name):
-        # symbol_file = self.base + '/.input.symbols'
-        fd = open(sym_name, "w")
-        subprocess.call(["nm", elf_name], stdout=fd)
-        fd.close()
+        # Fast path: encode the fuzz body in-process and patch it into a
+        # skeleton image that was linked once with gcc
+        self.fast_encode = FAST_ENCODE
+        self.encoder = rvEncoder()
+        self.skeletons = {}
+        self.num_fast = 0
+        self.num_fallback = 0
+
+        # Template objects: every template is assembled once, a test only
+        # assembles its fuzz body and data and links them with ld
+        self.template_objects = TEMPLATE_OBJECTS
+        self.objects = {}
+        self.num_objects = 0
+        self.num_object_fallback = 0
+        prefix = cc[: -len("gcc")] if cc.endswith("gcc") else ""
+        self.as_args = [prefix + "as", CC_ARCH, "-mabi=lp64d"]
+        self.ld_args = [prefix + "ld", "-static", "-nostdlib"]
+
+        # Template derived files (PT assembly), see template_artifact
+        self.artifacts = {}
+        self._cc_digest = None
+
+        # Images already built by any worker, keyed by their sources
+        self.cache = None
+        self._build_id = None
+        if BUILD_CACHE_SIZE > 0:
+            self.cache = rvBuildCache(
+                out_base + "/.build_cache", BUILD_CACHE_SIZE << 20
+            )
+
+        # (template lines, bodies, number of data sections) of the last
+        # built test, used to patch its data without rebuilding
+        self.last_build = None
+
+    def template_artifact(self, args, sources, suffix):
+        """Build a file derived from template sources once, return its path
+
+        The artifact is shared by all workers of the campaign and only
+        rebuilt when the sources, the arguments or the compiler change.
+        """
+        stamps = []
+        for src in sources:
+            stat = os.stat(src)
+            stamps.append((src, stat.st_mtime_ns, stat.st_size))
+        memo = (tuple(args), tuple(stamps), suffix)
+        path = self.artifacts.get(memo)
+        if path is not None and os.path.isfile(path):
+            return path
+
+        if self._cc_digest is None:
+            self._cc_digest = file_digest(shutil.which(self.cc) or self.cc)
+        h = hashlib.sha256(self._cc_digest)
+        h.update("\0".join(args).encode())
+        for src in sources:
+            h.update(file_digest(src))
+
+        cache_dir = self.base + "/.template_cache"
+        name = os.path.splitext(os.path.basename(sources[0]))[0]
+        path = "{}/{}.{}{}".format(cache_dir, name, h.hexdigest()[:16], suffix)
+        if not os.path.isfile(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = "{}/{}.{}.tmp{}".format(cache_dir, name, os.getpid(), suffix)
+            if spawner.call(args + ["-o", tmp] + sources) != 0:
+                return None
+            os.replace(tmp, path)
+
+        self.artifacts[memo] = path
+        return path
 
+    def get_symbols(self, elf_name, sym_name):
+        return self.write_images(elf_name, None, None, sym_name)
+
+    def write_images(self, elf_name, bin_name, hex_name, sym_name):
+        """Flat binary, hex image and nm listing from one read of the ELF
+
+        Same output as objcopy -O binary, elf2hex --bit-width 64 and nm.
+        Returns the symbol table, a file name of None is not written.
+        """
+        elf = rvElf.load(elf_name)
+
+        binary = None
+        if bin_name is not None or hex_name is not None:
+            binary = elf.binary()
+        if bin_name is not None:
+            fd = open(bin_name, "wb")
+            fd.write(binary)
+            fd.close()
+        if hex_name is not None:
+            fd = open(hex_name, "w")
+            fd.writelines(elf.hex_lines(binary))
+            fd.close()
+        if sym_name is not None:
+            fd = open(sym_name, "w")
+            fd.writelines(elf.nm_lines())
+            fd.close()
+
+        return elf.symbol_table()
+
+    def read_symbols(self, sym_name):
         symbols = {}
         fd = open(sym_name, "r")
         lines = fd.readlines()
         fd.close()
 
         for line in lines:
-            symbol = line.split(" ")[2]
-            addr = line.split(" ")[0]
-            symbols[symbol[:-1]] = int(addr, 16)
+            # Undefined (weak) symbols have no address
+            fields = line.split()
+            if len(fields) == 3:
+                symbols[fields[2]] = int(fields[0], 16)
 
         return symbols
 
+    def build_id(self):
+        # Everything besides the assembly a build depends on, hashed once
+        if self._build_id is None:
+            tools = [self.cc, self.as_args[0], self.ld_args[0]]
+            self._build_id = self.cache.key(
+                *[file_digest(shutil.which(tool) or tool) for tool in tools],
+                " ".join(self.cc_args + self.pg_link + self.as_args + self.ld_args),
+                dir_digest("{}/include".format(self.template)),
+                file_digest(self.base + "/../rv64-pt/link.ld"),
+            )
+        return self._build_id
+
     def write_isa_intr(self, isa_input, rtl_input, epc):
         fd = open(rtl_input.intrfile, "r")
         tuples = [line.split(":") for line in fd.readlines()]
@@ -93,6 +219,464 @@ class rvPreProcessor:
         fd.write("{:016x}:{:04b}\n".format(epc, val))
         fd.close()
 
+    def render_data(self, n, data, num_data_sections):
+        section_size = len(data) // num_data_sections
+        start = n * section_size
+        end = start + section_size
+
+        lines = []
+        k = 0
+        for i in range(start, end, 2):
+            label = ""
+            if i > start + 2 and i < end - 4:
+                label = "d_{}_{}:".format(n, k)
+                k += 1
+
+            lines.append(
+                "{:<16}.dword 0x{:016x}, 0x{:016x}\n".format(
+                    label, data[i], data[i + 1]
+                )
+            )
+
+        return lines
+
+    def render_assembly(self, template_lines, bodies, data, num_data_sections):
+        assembly = []
+        for line in template_lines:
+            assembly.append(line)
+            for marker in FUZZ_MARKERS:
+                if marker + ":" in line:
+                    for inst in bodies.get(marker, []):
+                        assembly.append(inst + ";\n")
+
+            for n in range(num_data_sections):
+                if "_random_data{}".format(n) in line:
+                    assembly += self.render_data(n, data, num_data_sections)
+
+        return assembly
+
+    def compile(self, version, extra_args, asm_name, elf_name):
+        if version in [PT]:
+            pg_link = self.pg_link + [elf_name, asm_name]
+            return spawner.call(pg_link)
+
+        cc_args = self.cc_args + extra_args + [asm_name, "-o", elf_name]
+        while True:
+            cc_ret = spawner.call(cc_args)
+            # if cc_ret == -9: cc process is killed by OS due to memory usage
+            if cc_ret != -9:
+                return cc_ret
+
+    def pad_body(self, marker, insts, size, reserve):
+        # Fixed size, uncompressed and unrelaxed region, so the layout of
+        # the rest of the template does not depend on the fuzz body.  The
+        # body jumps over the padding, a gcc built test doesn't run it either
+        return (
+            [".option push", ".option norvc", ".option nopic", ".option norelax"]
+            + insts
+            + [
+                "j .L{}_end".format(marker),
+                ".fill {}, 4, 0x00000013".format((reserve - size) // 4 - 1),
+                ".L{}_end:".format(marker),
+                ".option pop",
+            ]
+        )
+
+    def get_skeleton(
+        self, version, intr, template_lines, extra_args, data_len, num_data_sections
+    ):
+        key = (version, intr, data_len, num_data_sections)
+        if key in self.skeletons:
+            return self.skeletons[key]
+
+        name = self.base + "/.skeleton_{}_{}{}".format(
+            self.proc_num, templates[version], "_intr" if intr else ""
+        )
+        asm_name = name + ".S"
+        elf_name = name + ".elf"
+        bin_name = name + ".bin"
+        sym_name = name + ".symbols"
+
+        markers = [
+            marker
+            for marker in FUZZ_MARKERS
+            if any(marker + ":" in line for line in template_lines)
+        ]
+        bodies = {
+            marker: self.pad_body(marker, [], 0, FAST_ENCODE_RESERVE[marker])
+            for marker in markers
+        }
+        assembly = self.render_assembly(
+            template_lines, bodies, [0] * data_len, num_data_sections
+        )
+        fd = open(asm_name, "w")
+        fd.writelines(assembly)
+        fd.close()
+
+        skeleton = None
+        if self.compile(version, extra_args, asm_name, elf_name) == 0:
+            symbols = self.write_images(elf_name, bin_name, None, sym_name)
+
+            fd = open(elf_name, "rb")
+            elf = fd.read()
+            fd.close()
+            fd = open(bin_name, "rb")
+            binary = fd.read()
+            fd.close()
+
+            skeleton = {
+                "markers": markers,
+                "template_lines": template_lines,
+                "symbols": symbols,
+                "elf": elf,
+                "bin": binary,
+                "layout": rvElf(elf),
+            }
+        else:
+            print(
+                "[DifuzzRTL] skeleton of rv64-{} can not be built, use gcc".format(
+                    templates[version]
+                )
+            )
+
+        self.skeletons[key] = skeleton
+        return skeleton
+
+    def data_patches(self, symbols, data, num_data_sections):
+        section_size = len(data) // num_data_sections
+
+        patches = []
+        for n in range(num_data_sections):
+            addr = symbols.get("_random_data{}".format(n))
+            if addr is None:
+                continue
+            values = data[n * section_size : (n + 1) * section_size]
+            chunk = b"".join(val.to_bytes(8, "little") for val in values)
+            patches.append((addr, chunk))
+
+        return patches
+
+    def splice(self, elf, binary, layout, patches):
+        bin_base = layout.bin_base()
+        for addr, chunk in patches:
+            offset = layout.vaddr_to_offset(addr, len(chunk))
+            elf[offset : offset + len(chunk)] = chunk
+            offset = layout.vaddr_to_lma(addr, len(chunk)) - bin_base
+            binary[offset : offset + len(chunk)] = chunk
+
+    def fast_build(self, skeleton, bodies, data, num_data_sections, names):
+        asm_name, elf_name, bin_name, hex_name, sym_name = names
+        template_symbols = skeleton["symbols"]
+
+        regions = []
+        for marker in skeleton["markers"]:
+            lines = []
+            for inst in bodies[marker]:
+                lines += inst.split(";")
+            regions.append((template_symbols[marker], lines))
+        codes, labels = self.encoder.assemble(regions, template_symbols)
+
+        patches = []
+        padded = {}
+        for marker, (addr, _), code in zip(skeleton["markers"], regions, codes):
+            reserve = FAST_ENCODE_RESERVE[marker]
+            # The jump over the padding needs a word too
+            size = len(code)
+            if size + 4 > reserve:
+                raise EncodeError("{} does not fit in {} bytes".format(marker, reserve))
+            patches.append(
+                (addr, code + enc_j(0, reserve - size).to_bytes(4, "little"))
+            )
+            padded[marker] = self.pad_body(marker, bodies[marker], size, reserve)
+
+        patches += self.data_patches(template_symbols, data, num_data_sections)
+
+        elf = bytearray(skeleton["elf"])
+        binary = bytearray(skeleton["bin"])
+        self.splice(elf, binary, skeleton["layout"], patches)
+
+        # The saved assembly reproduces exactly the same image with gcc
+        fd = open(asm_name, "w")
+        fd.writelines(
+            self.render_assembly(
+                skeleton["template_lines"], padded, data, num_data_sections
+            )
+        )
+        fd.close()
+        fd = open(elf_name, "wb")
+        fd.write(elf)
+        fd.close()
+        fd = open(bin_name, "wb")
+        fd.write(binary)
+        fd.close()
+        if hex_name is not None:
+            fd = open(hex_name, "w")
+            fd.writelines(skeleton["layout"].hex_lines(bytes(binary)))
+            fd.close()
+
+        self.last_build = (skeleton["template_lines"], padded, num_data_sections)
+        symbols = dict(template_symbols)
+        symbols.update(labels)
+        fd = open(sym_name, "w")
+        for symbol, addr in sorted(symbols.items()):
+            fd.write("{:016x} t {}\n".format(addr, symbol))
+        fd.close()
+
+        return symbols
+
+    def validate_fast_build(self, version, extra_args, asm_name, bin_name):
+        check_elf = asm_name + ".check.elf"
+        if self.compile(version, extra_args, asm_name, check_elf) != 0:
+            return False
+        expected = rvElf.load(check_elf).binary()
+
+        fd = open(bin_name, "rb")
+        actual = fd.read()
+        fd.close()
+        return expected == actual
+
+    def split_template(self, template_lines):
+        """Move everything behind a fuzz marker to its own section
+
+        Returns the template lines and, for every section holding a marker,
+        the input sections that have to follow it: the fuzz body coming
+        from the per-test object and the rest of the template.
+        """
+        lines = []
+        chains = {}
+        roots = {}
+        section = ".text"
+        for line in template_lines:
+            m = SECTION_RE.match(line) or SHORT_SECTION_RE.match(line)
+            if m:
+                section = m.group(1)
+                if not section.startswith("."):
+                    section = "." + section
+
+            # Random data is emitted together with the fuzz body, and
+            # `.size f, .-f` can not span the split sections
+            if END_DATA_RE.match(line) or SIZE_RE.match(line):
+                continue
+
+            # The body refers to the data labels of the template
+            m = DATA_LABEL_RE.match(line)
+            if m:
+                lines.append(".globl {}\n".format(m.group(1)))
+            lines.append(line)
+
+            for marker in FUZZ_MARKERS:
+                if marker + ":" not in line:
+                    continue
+                root = roots.get(section, section)
+                part = marker[len("_fuzz_") :]
+                body = ".text.fuzz_{}".format(part)
+                rest = ".text.after_{}".format(part)
+                chains.setdefault(root, []).extend([body, rest])
+                roots[rest] = root
+                section = rest
+                lines.append('.section {}, "ax", @progbits\n'.format(rest))
+
+        return (lines, chains)
+
+    def split_link_script(self, script, chains):
+        for root, sections in chains.items():
+            for m in re.finditer(r"\*\(([^)]*)\)", script):
+                if root in m.group(1).split():
+                    break
+            else:
+                return None
+
+            # c.nop between the body and a more aligned rest of the template
+            order = "*({}) FILL(0x0100) ".format(root) + " ".join(
+                "KEEP(*({}))".format(sec) for sec in sections
+            )
+            script = script[: m.start()] + order + " " + script[m.start() :]
+
+        return script
+
+    def get_template_object(self, version, intr, template_lines, extra_args):
+        key = (version, intr)
+        if key in self.objects:
+            return self.objects[key]
+
+        name = self.base + "/.template_{}_{}{}".format(
+            self.proc_num, templates[version], "_intr" if intr else ""
+        )
+        asm_name = name + ".S"
+        obj_name = name + ".o"
+        ld_name = name + ".ld"
+
+        if version in [PT]:
+            link_script = self.base + "/../rv64-pt/link.ld"
+            cc_args = [self.cc, "-c", CC_ARCH, "-mabi=lp64d", "-ffreestanding"]
+            ld_args = self.ld_args + ["--gc-sections"]
+        else:
+            link_script = "{}/include/link.ld".format(self.template)
+            cc_args = [
+                self.cc,
+                "-c",
+                CC_ARCH,
+                "-mabi=lp64d",
+                "-mcmodel=medany",
+                "-I",
+                "{}/include".format(self.template),
+            ] + extra_args
+            ld_args = self.ld_args
+
+        lines, chains = self.split_template(template_lines)
+        fd = open(link_script, "r")
+        script = self.split_link_script(fd.read(), chains)
+        fd.close()
+
+        template_object = None
+        if script is not None:
+            fd = open(asm_name, "w")
+            fd.writelines(lines)
+            fd.close()
+            fd = open(ld_name, "w")
+            fd.write(script)
+            fd.close()
+
+            if spawner.call(cc_args + [asm_name, "-o", obj_name]) == 0:
+                template_object = {
+                    "object": obj_name,
+                    "ld_args": ld_args + ["-T", ld_name],
+                    "markers": [
+                        marker
+                        for marker in FUZZ_MARKERS
+                        if any(marker + ":" in line for line in template_lines)
+                    ],
+                    "data_sections": set(
+                        int(m.group(1))
+                        for m in map(RANDOM_DATA_RE.match, template_lines)
+                        if m
+                    ),
+                }
+
+        if template_object is None:
+            print(
+                "[DifuzzRTL] rv64-{} can not be split into a template object, use gcc".format(
+                    templates[version]
+                )
+            )
+
+        self.objects[key] = template_object
+        return template_object
+
+    def object_build(self, template_object, bodies, data, num_data_sections, names):
+        fuzz_name, elf_name = names
+        obj_name = fuzz_name[: -len(".S")] + ".o"
+
+        lines = []
+        for marker in template_object["markers"]:
+            part = marker[len("_fuzz_") :]
+            lines.append('.section .text.fuzz_{}, "ax", @progbits\n'.format(part))
+            for inst in bodies[marker]:
+                lines.append(inst + ";\n")
+
+        for n in range(num_data_sections):
+            if n not in template_object["data_sections"]:
+                continue
+            lines.append(".section .data.random{}\n".format(n))
+            lines.append(".align 8\n")
+            lines += self.render_data(n, data, num_data_sections)
+            lines.append("_end_data{}:\n".format(n))
+
+        fd = open(fuzz_name, "w")
+        fd.writelines(lines)
+        fd.close()
+
+        as_args = self.as_args + [fuzz_name, "-o", obj_name]
+        if spawner.call(as_args) != 0:
+            return -1
+
+        ld_args = template_object["ld_args"] + [
+            template_object["object"],
+            obj_name,
+            "-o",
+            elf_name,
+        ]
+        return spawner.call(ld_args)
+
+    def patch_hex(self, hex_name, binary, layout, patches):
+        # One line per 64-bit word of the binary image
+        fd = open(hex_name, "r")
+        lines = fd.readlines()
+        fd.close()
+
+        if len(lines) != (len(binary) + 7) // 8:
+            fd = open(hex_name, "w")
+            fd.writelines(layout.hex_lines(bytes(binary)))
+            fd.close()
+            return
+
+        bin_base = layout.bin_base()
+        for addr, chunk in patches:
+            offset = layout.vaddr_to_lma(addr, len(chunk)) - bin_base
+            first = offset // 8
+            last = (offset + len(chunk) - 1) // 8
+            for i in range(first, last + 1):
+                word = bytes(binary[8 * i : 8 * i + 8]).ljust(8, b"\x00")
+                lines[i] = word[::-1].hex() + "\n"
+
+        fd = open(hex_name, "w")
+        fd.writelines(lines)
+        fd.close()
+
+    def patch_data(self, symbols, data):
+        """Rewrite the random data of the last built test in place
+
+        Returns False when the image has no _random_data sections (the PT
+        template keeps its data in C) and the test has to be rebuilt.
+        """
+        if self.last_build is None:
+            return False
+        template_lines, bodies, num_data_sections = self.last_build
+
+        patches = self.data_patches(symbols, data, num_data_sections)
+        if not patches:
+            return False
+
+        asm_name = self.base + "/.input_{}.S".format(self.proc_num)
+        elf_name = self.base + "/.input_{}.elf".format(self.proc_num)
+        bin_name = self.base + "/.input_{}.bin".format(self.proc_num)
+        hex_name = self.base + "/.input_{}.hex".format(self.proc_num)
+
+        fd = open(elf_name, "rb")
+        elf = bytearray(fd.read())
+        fd.close()
+        fd = open(bin_name, "rb")
+        binary = bytearray(fd.read())
+        fd.close()
+
+        layout = rvElf(bytes(elf))
+        self.splice(elf, binary, layout, patches)
+
+        fd = open(elf_name, "wb")
+        fd.write(elf)
+        fd.close()
+        fd = open(bin_name, "wb")
+        fd.write(binary)
+        fd.close()
+        if os.path.isfile(hex_name):
+            self.patch_hex(hex_name, binary, layout, patches)
+
+        fd = open(asm_name, "w")
+        fd.writelines(
+            self.render_assembly(template_lines, bodies, data, num_data_sections)
+        )
+        fd.close()
+
+        return True
+
+    def write_rtl_intr(self, symbols, ints, rtl_intr_name):
+        fuzz_main = symbols["_fuzz_main"]
+        fd = open(rtl_intr_name, "w")
+        for i, INT in enumerate(ints):
+            if INT:
+                fd.write("{:016x}:{:04b}\n".format(fuzz_main + 4 * i, INT))
+        fd.close()
+
     def process(self, sim_input: simInput, data: list, intr: bool, num_data_sections=6):
         section_size = len(data) // num_data_sections
 
@@ -101,8 +685,17 @@ class rvPreProcessor:
             section_size & (section_size - 1)
         ) == 0, "Number of memory blocks should be power of 2"
 
+        self.last_build = None
         version = sim_input.get_template()
-        test_template = self.template + "/rv64-{}.S".format(templates[version])
+        if version in [PT]:
+            # Built once into the private template cache of this campaign
+            pt_c_name = self.base + "/../rv64-pt/rv64-pt.c"
+            test_template = self.template_artifact(self.c2s_args, [pt_c_name], ".S")
+            if test_template is None:
+                print("compile fail.")
+                exit(1)
+        else:
+            test_template = self.template + "/rv64-{}.S".format(templates[version])
 
         if intr:
             DINTR = ["-DINTERRUPT"]
@@ -128,17 +721,9 @@ class rvPreProcessor:
         bin_name = self.base + "/.input_{}.bin".format(self.proc_num)
         hex_name = self.base + "/.input_{}.hex".format(self.proc_num)
         sym_name = self.base + "/.input_{}.symbols".format(self.proc_num)
-        pt_c_name = self.base + "/../rv64-pt/rv64-pt.c"
         rtl_intr_name = self.base + "/.input_{}.rtl.intr".format(self.proc_num)
         isa_intr_name = self.base + "/.input_{}.isa.intr".format(self.proc_num)
 
-        if version in [PT]:
-            c2s_args = self.c2s_args + ["-o", test_template, pt_c_name]
-            c2s_ret = subprocess.call(c2s_args)
-            if c2s_ret != 0:
-                print("compile fail.")
-                exit(1)
-
         prefix_insts = sim_input.get_prefix()
         insts = sim_input.get_insts()
         suffix_insts = sim_input.get_suffix()
@@ -159,80 +744,117 @@ class rvPreProcessor:
         template_lines = fd.readlines()
         fd.close()
 
-        assembly = []
-        for line in template_lines:
-            assembly.append(line)
-            if "_fuzz_prefix:" in line:
-                for inst in prefix_insts:
-                    assembly.append(inst + ";\n")
+        bodies = {
+            "_fuzz_prefix": prefix_insts,
+            "_fuzz_main": insts,
+            "_fuzz_suffix": suffix_insts,
+        }
+
+        skeleton = None
+        if self.fast_encode:
+            skeleton = self.get_skeleton(
+                version, intr, template_lines, extra_args, len(data), num_data_sections
+            )
+
+        if skeleton is not None:
+            names = (
+                asm_name,
+                elf_name,
+                bin_name,
+                hex_name if version not in [PT] else None,
+                sym_name,
+            )
+            try:
+                symbols = self.fast_build(
+                    skeleton, bodies, data, num_data_sections, names
+                )
+            except EncodeError:
+                # Something gcc knows better, e.g. vector or unknown CSRs
+                symbols = None
+                self.num_fallback += 1
+
+            if symbols is not None:
+                self.num_fast += 1
+                if FAST_ENCODE_VALIDATE and self.num_fast % FAST_ENCODE_VALIDATE == 0:
+                    if not self.validate_fast_build(
+                        version, extra_args, asm_name, bin_name
+                    ):
+                        print(
+                            "[DifuzzRTL] in-process encoding differs from gcc ({}), disable fast encoding".format(
+                                asm_name
+                            )
+                        )
+                        self.fast_encode = 0
+                        symbols = None
 
-            if "_fuzz_main:" in line:
-                for inst in insts:
-                    assembly.append(inst + ";\n")
+            if symbols is not None:
+                if intr:
+                    self.write_rtl_intr(symbols, ints, rtl_intr_name)
 
-            if "_fuzz_suffix:" in line:
-                for inst in suffix_insts:
-                    assembly.append(inst + ";\n")
+                return (symbols, version)
 
-            for n in range(num_data_sections):
-                start = n * section_size
-                end = start + section_size
-                if "_random_data{}".format(n) in line:
-                    k = 0
-                    for i in range(start, end, 2):
-                        label = ""
-                        if i > start + 2 and i < end - 4:
-                            label = "d_{}_{}:".format(n, k)
-                            k += 1
-
-                        assembly.append(
-                            "{:<16}.dword 0x{:016x}, 0x{:016x}\n".format(
-                                label, data[i], data[i + 1]
-                            )
-                        )
+        assembly = self.render_assembly(template_lines, bodies, data, num_data_sections)
 
         fd = open(asm_name, "w")
         fd.writelines(assembly)
         fd.close()
 
-        cc_args = self.cc_args + extra_args + [asm_name, "-o", elf_name]
-        objdump_args = self.objdump_args + [elf_name, bin_name]
-        cc_ret = -1
-        if version in [PT]:
-            pg_link = self.pg_link + [elf_name, asm_name]
-            cc_ret = subprocess.call(pg_link)
+        template_object = None
+        if self.template_objects:
+            template_object = self.get_template_object(
+                version, intr, template_lines, extra_args
+            )
+
+        files = {"elf": elf_name, "bin": bin_name, "symbols": sym_name}
         if version not in [PT]:
-            while True:
-                cc_ret = subprocess.call(cc_args)
-                # if cc_ret == -9: cc process is killed by OS due to memory usage
-                if cc_ret != -9:
-                    break
+            files["hex"] = hex_name
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                self.build_id(),
+                "objects" if template_object is not None else "cc",
+                " ".join(extra_args),
+                "".join(assembly),
+            )
+            if self.cache.lookup(key, files):
+                symbols = self.read_symbols(sym_name)
+                self.last_build = (template_lines, bodies, num_data_sections)
+                if intr:
+                    self.write_rtl_intr(symbols, ints, rtl_intr_name)
+                return (symbols, version)
+
+        if template_object is not None:
+            # The full assembly above is kept for saving mismatches, only the
+            # fuzz body and data are assembled
+            fuzz_name = self.base + "/.input_{}.fuzz.S".format(self.proc_num)
+            cc_ret = self.object_build(
+                template_object, bodies, data, num_data_sections, (fuzz_name, elf_name)
+            )
+            if cc_ret == 0:
+                self.num_objects += 1
+            else:
+                # as or ld refused the split build, gcc gets the full assembly
+                self.num_object_fallback += 1
+                cc_ret = self.compile(version, extra_args, asm_name, elf_name)
+        else:
+            cc_ret = self.compile(version, extra_args, asm_name, elf_name)
 
         if cc_ret == 0:
-            if version not in [PT]:
-                subprocess.call(cc_args)
-
-            if version not in [PT]:
-                elf2hex_args = self.elf2hex_args + [elf_name, "--output", hex_name]
-                subprocess.call(elf2hex_args)
-
-            subprocess.call(objdump_args)
-            symbols = self.get_symbols(elf_name, sym_name)
+            symbols = self.write_images(elf_name, bin_name, files.get("hex"), sym_name)
+            self.last_build = (template_lines, bodies, num_data_sections)
+            if key is not None:
+                self.cache.store(key, files)
 
             if intr:
-                fuzz_main = symbols["_fuzz_main"]
-                fd = open(rtl_intr_name, "w")
-                for i, INT in enumerate(ints):
-                    if INT:
-                        fd.write("{:016x}:{:04b}\n".format(fuzz_main + 4 * i, INT))
-                fd.close()
+                self.write_rtl_intr(symbols, ints, rtl_intr_name)
 
             max_cycles = 6000
             if version in [V_U]:
                 max_cycles = 200000
 
-
         else:
             symbols = None
+            self.last_build = None
 
         return (symbols, version)
@@ -0,0 +1,105 @@
+import os
+
+from coverage_map import popcount
+
+""" RTL coverage from the emu run
+
+The emu writes its coverage counters to a per-slot dump file after every
+run.  Two formats are accepted:
+  - a raw array of little-endian uint32 counters, one per cover point, in
+    the order of the emu build (what a custom dump of Verilator's counter
+    array gives)
+  - a Verilator coverage.dat, parsed line by line; the cover point keys
+    are numbered in order of appearance
+
+Either way a run becomes one big integer with a bit per hit cover point,
+so folding it into the campaign's map is a big-int and/or.  For the raw
+format that integer comes from bytes.translate and two shifts, without
+touching the counters one by one in Python.
+"""
+
+NONZERO = bytes([0] + [1] * 255)
+VERILATOR_MAGIC = b"# SystemC::Coverage"
+
+
+class rvRtlCoverage:
+    def __init__(self):
+        self.virgin = 0
+        self.masks = {}
+        # Verilator cover point key -> index
+        self.points = {}
+
+        self.runs = 0
+        self.novel_runs = 0
+        self.missing = 0
+
+    def reset(self, dump_name):
+        # A stale dump must not be credited to the next run
+        try:
+            os.remove(dump_name)
+        except FileNotFoundError:
+            pass
+
+    def counter_mask(self, num):
+        # Lowest bit of every 32-bit counter
+        mask = self.masks.get(num)
+        if mask is None:
+            mask = self.masks[num] = int.from_bytes(b"\x01\x00\x00\x00" * num, "little")
+        return mask
+
+    def raw_bits(self, raw):
+        raw = raw[: len(raw) & ~3]
+        bits = int.from_bytes(raw.translate(NONZERO), "little")
+        # Fold the four byte flags of a counter into its lowest byte
+        bits |= bits >> 16
+        bits |= bits >> 8
+        return bits & self.counter_mask(len(raw) // 4)
+
+    def verilator_bits(self, raw):
+        hit = bytearray(len(self.points))
+        for line in raw.decode(errors="replace").splitlines():
+            if not line.startswith("C '"):
+                continue
+            key, _, count = line[3:].rpartition("' ")
+            idx = self.points.get(key)
+            if idx is None:
+                idx = self.points[key] = len(self.points)
+                hit.append(0)
+            if count.strip() != "0":
+                hit[idx] = 1
+        return int.from_bytes(bytes(hit), "little")
+
+    def collect(self, dump_name):
+        """Merge the dump of the last run, (number of new points, hit bits)"""
+        try:
+            fd = open(dump_name, "rb")
+            raw = fd.read()
+            fd.close()
+        except FileNotFoundError:
+            self.missing += 1
+            return 0, 0
+
+        if raw.startswith(VERILATOR_MAGIC):
+            bits = self.verilator_bits(raw)
+        else:
+            bits = self.raw_bits(raw)
+
+        self.runs += 1
+        new = bits & ~self.virgin
+        if not new:
+            return 0, bits
+        self.novel_runs += 1
+        self.virgin |= new
+        return popcount(new), bits
+
+    def absorb(self, bits):
+        # Cover points another worker hit, runs that only hit those aren't new
+        self.virgin |= bits
+
+    def report(self):
+        return "RTL coverage {} points, {} of {} runs found new points{}".format(
+            popcount(self.virgin),
+            self.novel_runs,
+            self.runs,
+            ", {} runs without a dump".format(self.missing) if self.missing else "",
+        )
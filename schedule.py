@@ -0,0 +1,105 @@
+import math
+import random
+
+""" Power schedule of the corpus
+
+Every corpus entry gets an energy from its run time, its size, its age,
+how often it was already fuzzed and how many cover points it was the
+first to hit.  Seeds are drawn in proportion to their energy.
+
+The energy of a seed is computed when it is looked at, from per seed
+counters and running sums over the corpus, so admitting, evicting or
+fuzzing a seed is O(1).  Drawing is rejection sampling against the
+energy cap: pick a uniform entry, keep it with probability energy / cap,
+which is exact without keeping any cumulative table up to date.
+"""
+
+ENERGY_MIN = 1 / 8
+ENERGY_MAX = 16
+
+# Seed record fields
+EXEC_TIME = 0
+SIZE = 1
+ADMITTED = 2
+FUZZED = 3
+FOUND = 4
+
+
+def clamp(x, lo, hi):
+    return min(max(x, lo), hi)
+
+
+class rvSchedule:
+    def __init__(self, age_half_life):
+        self.seeds = []
+        self.age_half_life = age_half_life
+        # Number of seeds drawn so far, the clock of seed ages
+        self.clock = 0
+
+        self.sum_time = 0.0
+        self.num_timed = 0
+        self.sum_size = 0
+
+        self.draws = 0
+        self.tries = 0
+
+    def record(self, exec_time, size, found):
+        return [exec_time, size, self.clock, 0, found]
+
+    def account(self, seed, sign):
+        if seed[EXEC_TIME] is not None:
+            self.sum_time += sign * seed[EXEC_TIME]
+            self.num_timed += sign
+        self.sum_size += sign * seed[SIZE]
+
+    def add(self, exec_time, size, found=0):
+        seed = self.record(exec_time, size, found)
+        self.seeds.append(seed)
+        self.account(seed, 1)
+
+    def replace(self, i, exec_time, size, found=0):
+        self.account(self.seeds[i], -1)
+        self.seeds[i] = self.record(exec_time, size, found)
+        self.account(self.seeds[i], 1)
+
+    def keep(self, indices):
+        self.seeds = [self.seeds[i] for i in indices]
+        self.sum_time = sum(
+            s[EXEC_TIME] for s in self.seeds if s[EXEC_TIME] is not None
+        )
+        self.num_timed = sum(1 for s in self.seeds if s[EXEC_TIME] is not None)
+        self.sum_size = sum(s[SIZE] for s in self.seeds)
+
+    def energy(self, i):
+        exec_time, size, admitted, fuzzed, found = self.seeds[i]
+        energy = 1.0
+        # Fast and short seeds give more executions per second
+        if exec_time is not None and self.num_timed:
+            mean_time = self.sum_time / self.num_timed
+            energy *= clamp(mean_time / max(exec_time, 1e-6), 0.25, 4)
+        mean_size = self.sum_size / len(self.seeds)
+        energy *= clamp(mean_size / max(size, 1), 0.5, 2)
+        # Fresh seeds haven't had their share yet, fuzzed ones had it
+        age = self.clock - admitted
+        energy *= 1 + 2 * 0.5 ** (age / self.age_half_life)
+        energy /= math.sqrt(1 + fuzzed)
+        # Seeds that opened up rare coverage are worth more
+        energy *= 1 + math.log2(1 + found)
+        return clamp(energy, ENERGY_MIN, ENERGY_MAX)
+
+    def pick(self):
+        """Index of a seed drawn in proportion to its energy"""
+        n = len(self.seeds)
+        self.clock += 1
+        self.draws += 1
+        while True:
+            self.tries += 1
+            i = random.randrange(n)
+            if random.random() * ENERGY_MAX < self.energy(i):
+                self.seeds[i][FUZZED] += 1
+                return i
+
+    def report(self):
+        return "schedule {} seeds, {} draws, {:.1f} tries per draw".format(
+            len(self.seeds), self.draws, self.tries / max(self.draws, 1)
+        )
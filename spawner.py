@@ -0,0 +1,320 @@
+import argparse
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+""" Pre-forked process spawner
+
+Every toolchain and emulator call used to fork the fuzzer process itself,
+which keeps growing with the corpus, caches and generator tables.  start()
+forks a small helper while the worker is still small; afterwards run()
+sends the argument vector over a pipe and the helper launches the child
+with posix_spawn, waits for it and sends back the exit status, the child's
+rusage and any captured output.  Requests are served concurrently, so the
+pipeline stages don't queue behind each other.
+
+Without a helper (or after it died) run() spawns in-process the same way.
+
+stream() launches through the same path for a reader that consumes the
+output while the child runs (lock-step trace comparison): the child writes
+into a FIFO the caller reads, and closing the read end ends the child with
+SIGPIPE.
+
+`python spawner.py --bench` compares the spawn latency of subprocess (with
+and without its vfork path), an in-process posix_spawn and the helper from
+a parent of a given size.
+"""
+
+INHERIT = 0
+PIPE = 1
+DEVNULL = 2
+
+SpawnResult = namedtuple("SpawnResult", "returncode rusage stdout stderr timed_out")
+
+
+def spawn(args, timeout=None, stdout=INHERIT, stderr=INHERIT, env=None):
+    """posix_spawn args and wait for it, killing it after timeout seconds"""
+    actions = []
+    readers = {}
+    for fd, mode in [(1, stdout), (2, stderr)]:
+        if mode == PIPE:
+            r, w = os.pipe()
+            actions.append((os.POSIX_SPAWN_DUP2, w, fd))
+            readers[r] = (fd, w)
+        elif mode == DEVNULL:
+            actions.append((os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_WRONLY, 0))
+        elif isinstance(mode, str):
+            # A path, the FIFO of a stream()
+            actions.append((os.POSIX_SPAWN_OPEN, fd, mode, os.O_WRONLY, 0))
+
+    try:
+        # Python ignores SIGPIPE and SIGXFSZ, children get the defaults back
+        pid = os.posix_spawnp(
+            args[0],
+            args,
+            os.environ if env is None else env,
+            file_actions=actions,
+            setsigdef=[signal.SIGPIPE, signal.SIGXFSZ],
+        )
+    except OSError:
+        for r, (_, w) in readers.items():
+            os.close(r)
+            os.close(w)
+        raise
+    for _, w in readers.values():
+        os.close(w)
+
+    deadline = None if timeout is None else time.time() + timeout
+    output = {1: [], 2: []}
+    timed_out = False
+    while readers and not timed_out:
+        left = None if deadline is None else max(deadline - time.time(), 0)
+        ready = select.select(list(readers), [], [], left)[0]
+        if not ready:
+            timed_out = True
+        for r in ready:
+            chunk = os.read(r, 1 << 16)
+            if chunk:
+                output[readers[r][0]].append(chunk)
+            else:
+                os.close(r)
+                del readers[r]
+
+    # Poll like subprocess does when there is a timeout
+    delay = 0.0005
+    while not timed_out:
+        wpid, status, rusage = os.wait4(pid, 0 if deadline is None else os.WNOHANG)
+        if wpid:
+            break
+        left = deadline - time.time()
+        if left <= 0:
+            timed_out = True
+            break
+        time.sleep(min(delay, left))
+        delay = min(delay * 2, 0.05)
+
+    if timed_out:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        for r in readers:
+            os.close(r)
+        _, status, rusage = os.wait4(pid, 0)
+
+    return SpawnResult(
+        os.waitstatus_to_exitcode(status),
+        rusage,
+        b"".join(output[1]),
+        b"".join(output[2]),
+        timed_out,
+    )
+
+
+def serve(conn):
+    # Helper side: one thread per request, replies tagged with the request id
+    lock = threading.Lock()
+
+    def handle(req_id, args, kwargs):
+        try:
+            result = spawn(args, **kwargs)
+        except OSError as e:
+            result = e
+        with lock:
+            conn.send((req_id, result))
+
+    while True:
+        try:
+            req = conn.recv()
+        except EOFError:
+            break
+        threading.Thread(target=handle, args=req, daemon=True).start()
+
+
+class rvSpawner:
+    def __init__(self):
+        ctx = multiprocessing.get_context("fork")
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=serve, args=(child,), name="spawner")
+        self.proc.daemon = True
+        self.proc.start()
+        child.close()
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_id = 0
+        self.dead = False
+        self.spawns = 0
+
+        self.reader = threading.Thread(target=self.dispatch, daemon=True)
+        self.reader.start()
+
+    def dispatch(self):
+        while True:
+            try:
+                req_id, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                slot = self.pending.pop(req_id)
+            slot[1] = result
+            slot[0].set()
+
+        # Wake up everyone still waiting, they retry in-process
+        with self.lock:
+            self.dead = True
+            for slot in self.pending.values():
+                slot[0].set()
+            self.pending.clear()
+
+    def run(self, args, **kwargs):
+        slot = [threading.Event(), None]
+        sent = False
+        with self.lock:
+            if not self.dead:
+                req_id = self.next_id
+                self.next_id += 1
+                self.pending[req_id] = slot
+                try:
+                    self.conn.send((req_id, list(args), kwargs))
+                    sent = True
+                except OSError:
+                    del self.pending[req_id]
+                    self.dead = True
+        if not sent:
+            return spawn(args, **kwargs)
+
+        slot[0].wait()
+        result = slot[1]
+        if result is None:
+            return spawn(args, **kwargs)
+        if isinstance(result, OSError):
+            raise result
+        self.spawns += 1
+        return result
+
+    def stop(self):
+        self.conn.close()
+        self.proc.join(timeout=1)
+
+
+_spawner = None
+
+
+def start():
+    """Fork the helper, call this before the process grows or starts threads"""
+    global _spawner
+    if _spawner is None:
+        _spawner = rvSpawner()
+    return _spawner
+
+
+def run(args, timeout=None, stdout=INHERIT, stderr=INHERIT, env=None):
+    if _spawner is None:
+        return spawn(args, timeout, stdout, stderr, env)
+    return _spawner.run(args, timeout=timeout, stdout=stdout, stderr=stderr, env=env)
+
+
+def call(args, **kwargs):
+    # Drop-in for subprocess.call
+    return run(args, **kwargs).returncode
+
+
+class rvStream:
+    """A child whose stdout or stderr can be read from self.pipe while it runs"""
+
+    def __init__(self, args, stream, timeout=None, env=None):
+        self.dir = tempfile.mkdtemp(prefix="difuzz_stream")
+        path = os.path.join(self.dir, "fifo")
+        os.mkfifo(path)
+        rfd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Our own write end keeps the reader from seeing EOF before the
+        # child has opened the FIFO, it is closed once the child is gone
+        self.wfd = os.open(path, os.O_WRONLY)
+        os.set_blocking(rfd, True)
+        self.pipe = os.fdopen(rfd, "rb")
+
+        modes = {"stdout": DEVNULL, "stderr": DEVNULL}
+        modes[stream] = path
+        self.result = None
+        self.thread = threading.Thread(
+            target=self.launch,
+            args=(args, timeout, modes["stdout"], modes["stderr"], env),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def launch(self, args, timeout, stdout, stderr, env):
+        try:
+            self.result = run(args, timeout, stdout, stderr, env)
+        except OSError as e:
+            self.result = e
+        finally:
+            os.close(self.wfd)
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+    def close(self):
+        # A child still writing gets SIGPIPE
+        self.pipe.close()
+
+    def wait(self):
+        """SpawnResult of the child once it exited"""
+        self.thread.join()
+        if isinstance(self.result, OSError):
+            raise self.result
+        return self.result
+
+
+def stream(args, stream, timeout=None, env=None):
+    """Start args with stream ("stdout" or "stderr") going to a pipe, the other to /dev/null"""
+    return rvStream(args, stream, timeout, env)
+
+
+def bench(n, ballast, args):
+    import subprocess
+
+    def measure(func):
+        start = time.perf_counter()
+        for _ in range(n):
+            func()
+        return (time.perf_counter() - start) / n * 1e6
+
+    helper = rvSpawner()
+    # Grow the parent after the helper is forked, like a long campaign does
+    pages = bytearray(ballast << 20)
+    for i in range(0, len(pages), 4096):
+        pages[i] = 1
+
+    results = [("subprocess.call", measure(lambda: subprocess.call(args)))]
+    # Python < 3.10 has no vfork path and always copies the parent's page tables
+    if getattr(subprocess, "_USE_VFORK", False):
+        subprocess._USE_VFORK = False
+        results.append(("  (fork)", measure(lambda: subprocess.call(args))))
+        subprocess._USE_VFORK = True
+    results += [
+        ("posix_spawn", measure(lambda: spawn(args))),
+        ("helper", measure(lambda: helper.run(args))),
+    ]
+    helper.stop()
+
+    print("{} x {!r} from a {}MB parent".format(n, " ".join(args), ballast))
+    for name, usec in results:
+        print("  {:<16} {:9.1f} us/spawn".format(name, usec))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("-n", type=int, default=500)
+    parser.add_argument("--ballast", type=int, default=1024, help="MB")
+    parser.add_argument("cmd", nargs="*", default=["true"])
+    opts = parser.parse_args()
+    if not opts.bench:
+        parser.error("nothing to do, use --bench")
+    bench(opts.n, opts.ballast, opts.cmd)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The fuzzer modules live at the top of the repository
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def root():
+    return ROOT
+
+
+@pytest.fixture(scope="session")
+def nemu_stub():
+    """Command line of the NEMU stand-in"""
+    return [sys.executable, f"{ROOT}/nemu_stub.py"]
+
+
+@pytest.fixture
+def write_image(tmp_path):
+    """write_image(name, words) -> path of a raw image of 32-bit words"""
+
+    def write(name, words):
+        path = tmp_path / name
+        fd = open(path, "wb")
+        for word in words:
+            fd.write(word.to_bytes(4, "little"))
+        fd.close()
+        return str(path)
+
+    return write
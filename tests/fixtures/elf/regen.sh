@@ -0,0 +1,17 @@
+#!/bin/sh
+# Rebuild image.elf and its golden outputs.  The expected files come from
+# binutils: objcopy -O binary, nm in the C locale, and the 64-bit wide hex
+# that elf2hex --bit-width 64 writes (one little-endian word per line, most
+# significant byte first, the last word zero padded), produced here with od.
+set -e
+cd "$(dirname "$0")"
+llvm-mc -triple=riscv64 -mattr=+m,+a,+f,+d -filetype=obj image.S -o image.o
+ld.lld -m elf64lriscv -T link.ld image.o -o image.elf
+rm image.o
+objcopy -I elf64-little -O binary image.elf image.bin
+LC_ALL=C nm image.elf > image.nm
+size=$(wc -c < image.bin)
+cp image.bin image.pad
+truncate -s $(( (size + 7) / 8 * 8 )) image.pad
+od -An -v -tx8 -w8 image.pad | tr -d ' ' > image.hex
+rm image.pad
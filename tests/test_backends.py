@@ -0,0 +1,29 @@
+import os
+
+import spawner
+from backends import rvEmuBackend, rvNemuBackend
+from coverage_map import ENV
+
+
+def run_env(backend, monkeypatch):
+    seen = {}
+
+    def run(args, timeout=None, stdout=None, stderr=None, env=None):
+        seen["env"] = env
+        return spawner.SpawnResult(0, None, b"", b"", False)
+
+    monkeypatch.setattr(spawner, "run", run)
+    monkeypatch.setitem(os.environ, ENV, "/dev/shm/difuzz_coverage_test")
+    backend.execute("test.bin", 1)
+    return seen["env"]
+
+
+def test_emu_does_not_see_the_coverage_map(monkeypatch):
+    env = run_env(rvEmuBackend(), monkeypatch)
+    assert env is not None and ENV not in env
+
+
+def test_nemu_reports_into_the_coverage_map(monkeypatch):
+    backend = rvNemuBackend()
+    backend.server = None
+    assert run_env(backend, monkeypatch) is None
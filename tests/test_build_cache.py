@@ -0,0 +1,53 @@
+import os
+
+from build_cache import rvBuildCache
+
+
+def build(tmp_path, tag):
+    files = {}
+    for kind in ["elf", "bin", "hex", "symbols"]:
+        path = str(tmp_path / "out.{}".format(kind))
+        fd = open(path, "w")
+        fd.write("{} {}\n".format(tag, kind))
+        fd.close()
+        files[kind] = path
+    return files
+
+
+def read(path):
+    fd = open(path)
+    data = fd.read()
+    fd.close()
+    return data
+
+
+def test_hit_restores_every_file(tmp_path):
+    cache = rvBuildCache(str(tmp_path / "cache"), 1 << 20)
+    files = build(tmp_path, "first")
+    cache.store("k", files)
+    build(tmp_path, "second")
+
+    assert cache.lookup("k", files)
+    assert all(read(path) == "first {}\n".format(k) for k, path in files.items())
+    assert cache.hits == 1
+
+
+def test_partly_evicted_entry_is_a_miss(tmp_path):
+    cache = rvBuildCache(str(tmp_path / "cache"), 1 << 20)
+    files = build(tmp_path, "first")
+    cache.store("k", files)
+    # Another worker removed the image but not the elf yet
+    os.remove(cache.entry("k", "bin"))
+
+    assert not cache.lookup("k", files)
+    assert cache.misses == 1
+
+
+def test_incomplete_build_is_not_stored(tmp_path):
+    cache = rvBuildCache(str(tmp_path / "cache"), 1 << 20)
+    files = build(tmp_path, "first")
+    os.remove(files["hex"])
+    cache.store("k", files)
+
+    assert not os.path.exists(cache.entry("k", "elf"))
+    assert not cache.lookup("k", build(tmp_path, "second"))
@@ -0,0 +1,31 @@
+import os
+
+from elf_reader import rvElf
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "elf")
+
+
+def golden(name, mode="r"):
+    fd = open(os.path.join(FIXTURES, name), mode)
+    data = fd.read()
+    fd.close()
+    return data
+
+
+def test_binary():
+    elf = rvElf.load(os.path.join(FIXTURES, "image.elf"))
+    assert elf.binary() == golden("image.bin", "rb")
+    assert elf.bin_base() == 0x80000000
+
+
+def test_hex_lines():
+    elf = rvElf.load(os.path.join(FIXTURES, "image.elf"))
+    assert "".join(elf.hex_lines()) == golden("image.hex")
+
+
+def test_nm_lines():
+    elf = rvElf.load(os.path.join(FIXTURES, "image.elf"))
+    assert "".join(elf.nm_lines()) == golden("image.nm")
+    symbols = elf.symbol_table()
+    assert symbols["_good_exit"] == 0x80000024
+    assert "_missing_hook" not in symbols
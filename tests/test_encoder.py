@@ -0,0 +1,198 @@
+import random
+
+import pytest
+
+from config import CC, ELF2HEX, OBJCOPY
+from encoder import EncodeError, rvEncoder
+from mutator import P_M, rvMutator
+from preprocessor import rvPreProcessor
+
+# Expected words come from llvm-mc -triple=riscv64 -mattr=+m,+a,+f,+d.  For
+# li and the relaxed branches the expansion gas emits is written out as
+# plain instructions and assembled the same way.
+FIXED = [
+    ("addi a0, a1, -7", [0xFF958513]),
+    ("sub s2, t3, a5", [0x40FE0933]),
+    ("slli t0, t1, 63", [0x03F31293]),
+    ("sraiw a2, a3, 31", [0x41F6D61B]),
+    ("ld a0, -8(sp)", [0xFF813503]),
+    ("sw t6, 2044(s11)", [0x7FFDAE23]),
+    ("fld fa0, 16(a0)", [0x01053507]),
+    ("fsd fs1, -16(sp)", [0xFE913827]),
+    ("lui a0, 0xfffff", [0xFFFFF537]),
+    ("auipc t0, 0x12345", [0x12345297]),
+    ("jalr ra, 12(t0)", [0x00C280E7]),
+    ("ret", [0x00008067]),
+    ("ecall", [0x00000073]),
+    ("mret", [0x30200073]),
+    ("wfi", [0x10500073]),
+]
+
+LI = [
+    # addi a0, zero, imm
+    ("li a0, 5", [0x00500513]),
+    ("li a0, 0", [0x00000513]),
+    ("li a0, -2048", [0x80000513]),
+    ("li a0, -1", [0xFFF00513]),
+    # lui [+ addiw]
+    ("li a0, 0x800", [0x00001537, 0x8005051B]),
+    ("li a0, 0x12345000", [0x12345537]),
+    ("li a0, 0x12345678", [0x12345537, 0x6785051B]),
+    ("li a0, 0x7ffff800", [0x80000537, 0x8005051B]),
+    ("li a0, -0x12345678", [0xEDCBB537, 0x9885051B]),
+    # addi a0, zero, 1; slli a0, a0, 32 [; addi a0, a0, -1]
+    ("li a0, 0x100000000", [0x00100513, 0x02051513]),
+    ("li a0, 0xffffffff", [0x00100513, 0x02051513, 0xFFF50513]),
+    ("li a0, 0x8000000000000000", [0xFFF00513, 0x03F51513]),
+    # lui 0x247; addiw -1875; slli 14; addi -947; slli 12; addi 1511;
+    # slli 13; addi -272
+    (
+        "li t0, 0x123456789abcdef0",
+        [
+            0x002472B7,
+            0x8AD2829B,
+            0x00E29293,
+            0xC4D28293,
+            0x00C29293,
+            0x5E728293,
+            0x00D29293,
+            0xEF028293,
+        ],
+    ),
+]
+
+CSR = [
+    ("csrrw a0, mstatus, a1", [0x30059573]),
+    ("csrrsi zero, mie, 8", [0x30446073]),
+    ("csrr t0, mcause", [0x342022F3]),
+    ("csrw mtvec, t0", [0x30529073]),
+    ("csrrc a0, 0x7c0, a1", [0x7C05B573]),
+]
+
+FP = [
+    ("fadd.d fa0, fa1, fa2", [0x02C5F553]),
+    ("fadd.s fa0, fa1, fa2, rtz", [0x00C59553]),
+    ("fmadd.d fa0, fa1, fa2, fa3", [0x6AC5F543]),
+    ("fmv.x.d a0, fa0", [0xE2050553]),
+    ("fmv.w.x ft0, a1", [0xF0058053]),
+    ("fcvt.l.d a0, fa0, rtz", [0xC2251553]),
+    ("fcvt.s.d fa0, fa1", [0x4015F553]),
+    ("fcvt.s.w fa0, a0", [0xD0057553]),
+    # Exact conversions, gas leaves the rounding mode at 0
+    ("fcvt.d.w fa0, a0", [0xD2050553]),
+    ("fcvt.d.s fa0, fa1", [0x42058553]),
+    ("fsgnj.d fa0, fa1, fa2", [0x22C58553]),
+    ("feq.d a0, fa1, fa2", [0xA2C5A553]),
+    ("fclass.d a0, fa1", [0xE2059553]),
+    ("fsqrt.d fa0, fa1", [0x5A05F553]),
+]
+
+AMO = [
+    ("amoadd.w a0, a1, (a2)", [0x00B6252F]),
+    ("amoswap.d.aqrl t0, t1, (t2)", [0x0E63B2AF]),
+    ("amomaxu.d a0, a1, (a2)", [0xE0B6352F]),
+    ("lr.d.aq a0, (a1)", [0x1405B52F]),
+    ("sc.w.rl a2, a3, (a4)", [0x1AD7262F]),
+]
+
+FENCE = [
+    ("fence", [0x0FF0000F]),
+    ("fence rw, w", [0x0310000F]),
+    ("fence.i", [0x0000100F]),
+    ("sfence.vma", [0x12000073]),
+    ("sfence.vma a0", [0x12050073]),
+    ("sfence.vma a0, a1", [0x12B50073]),
+]
+
+
+def words(code):
+    return [int.from_bytes(code[i : i + 4], "little") for i in range(0, len(code), 4)]
+
+
+@pytest.mark.parametrize("inst, expected", FIXED + LI + CSR + FP + AMO + FENCE)
+def test_encoding(inst, expected):
+    codes, _ = rvEncoder().assemble([(0x80001000, [inst])], {})
+    assert words(codes[0]) == expected
+
+
+def test_symbols_and_relaxation():
+    symbols = {"d_3_7": 0x80020038, "_good_exit": 0x80000100}
+    lines = [
+        "_l0:   beq a0, a1, _l2",
+        "_l1:   la t1, d_3_7",
+        # _l3 is more than 4KB away
+        "_l2:   bnez t0, _l3",
+        "j _l0",
+        # gas can't tell the distance to a symbol outside of the body
+        "bltu a0, a1, _good_exit",
+        "jal ra, _l1",
+    ]
+    lines += [".word 0x13"] * 1024
+    lines += ["_l3:   bgt a0, a1, _l0", "_l4:"]
+    codes, labels = rvEncoder().assemble([(0x80001000, lines)], symbols)
+
+    assert labels["_l3"] == 0x80002024
+    assert labels["_l4"] == 0x8000202C
+    code = words(codes[0])
+    assert code[:9] == [
+        0x00B50663,  # beq a0, a1, 12
+        0x0001F317,  # auipc t1, 0x1f
+        0x03430313,  # addi t1, t1, 0x34
+        0x00028463,  # beq t0, zero, 8
+        0x0140106F,  # jal zero, 0x1014
+        0xFEDFF06F,  # jal zero, -20
+        0x00B57463,  # bgeu a0, a1, 8
+        0x8E4FF06F,  # jal zero, -3868
+        0xFE5FF0EF,  # jal ra, -28
+    ]
+    assert code[-2:] == [
+        0x00A5D463,  # bge a1, a0, 8
+        0xFD9FE06F,  # jal zero, -0x1028
+    ]
+
+
+def test_unknown_instruction():
+    with pytest.raises(EncodeError):
+        rvEncoder().assemble([(0x80001000, ["vsetvli t0, a0, e64"])], {})
+    with pytest.raises(EncodeError):
+        rvEncoder().assemble([(0x80001000, ["la t1, d_9_9"])], {})
+
+
+def test_unknown_instruction_falls_back_to_gcc(tmp_path, root, monkeypatch):
+    random.seed(7)
+    mutator = rvMutator()
+    mutator.num_words = 5
+    preprocessor = rvPreProcessor(
+        CC, ELF2HEX, OBJCOPY, f"{root}/Template", str(tmp_path), 0
+    )
+    preprocessor.fast_encode = 1
+    # A skeleton without an image, the encoder fails before it is touched
+    skeleton = {"symbols": {"_fuzz_main": 0x80001000}, "markers": ["_fuzz_main"]}
+    monkeypatch.setattr(preprocessor, "get_skeleton", lambda *args: skeleton)
+    compiled = []
+    monkeypatch.setattr(
+        preprocessor, "compile", lambda *args: compiled.append(args) or 1
+    )
+    rejected = []
+    parse = preprocessor.encoder.parse
+
+    def checked_parse(inst):
+        try:
+            return parse(inst)
+        except EncodeError:
+            rejected.append(inst.strip())
+            raise
+
+    monkeypatch.setattr(preprocessor.encoder, "parse", checked_parse)
+
+    sim_input, data, _ = mutator.get()
+    sim_input.template = P_M
+    # Vector instructions are left to gcc
+    word = sim_input.words[0]
+    word.lines, word.refs, word.ret_insts = ["vsetvli t0, a0, e64"], [], None
+    symbols, _ = preprocessor.process(sim_input, data, False)
+
+    assert symbols is None
+    assert rejected == ["vsetvli t0, a0, e64"]
+    assert preprocessor.num_fallback == 1 and preprocessor.num_fast == 0
+    assert len(compiled) == 1
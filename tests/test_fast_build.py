@@ -0,0 +1,56 @@
+import random
+import shutil
+
+import pytest
+
+from config import CC, ELF2HEX, FAST_ENCODE_RESERVE, OBJCOPY
+from mutator import P_M, P_S, P_U, rvMutator
+from preprocessor import rvPreProcessor
+
+needs_gcc = pytest.mark.skipif(
+    shutil.which(CC) is None, reason="RISC-V gcc from config.CC not found"
+)
+
+
+def test_padding_fills_reserve():
+    preprocessor = rvPreProcessor.__new__(rvPreProcessor)
+    reserve = FAST_ENCODE_RESERVE["_fuzz_main"]
+    insts = ["_l0:   addi x1, x1, 1", "_l1:   addi x2, x2, 2", "_l2:"]
+    lines = preprocessor.pad_body("_fuzz_main", insts, 8, reserve)
+
+    assert lines[4 : 4 + len(insts)] == insts
+    jump, fill, label = lines[4 + len(insts) : 7 + len(insts)]
+    # The body jumps to the end of its reserved region, over the NOPs
+    assert jump == "j .L_fuzz_main_end"
+    assert label == ".L_fuzz_main_end:"
+    nops = int(fill.split()[1].rstrip(","))
+    assert 8 + 4 + 4 * nops == reserve
+
+
+@needs_gcc
+def test_fast_build_matches_gcc(tmp_path, root):
+    """Images patched by the encoder are byte for byte those gcc builds"""
+    random.seed(4)
+    mutator = rvMutator()
+    mutator.num_words = 200
+    preprocessor = rvPreProcessor(
+        CC, ELF2HEX, OBJCOPY, f"{root}/Template", str(tmp_path), 0
+    )
+    preprocessor.fast_encode = 1
+    extra_args = ["-I", f"{root}/Template/include/p"]
+    asm_name = f"{tmp_path}/.input_0.S"
+    bin_name = f"{tmp_path}/.input_0.bin"
+
+    for version in [P_M, P_S, P_U]:
+        for _ in range(5):
+            sim_input, data, _ = mutator.get()
+            sim_input.template = version
+            fast = preprocessor.num_fast
+            preprocessor.process(sim_input, data, False)
+            if preprocessor.num_fast == fast:
+                # Fell back to gcc, nothing to compare
+                continue
+            assert preprocessor.validate_fast_build(
+                version, extra_args, asm_name, bin_name
+            ), asm_name
+    assert preprocessor.num_fast > 0
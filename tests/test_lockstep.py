@@ -0,0 +1,63 @@
+import pytest
+
+import spawner
+from lockstep import rvLockstep
+
+
+@pytest.fixture(params=["in-process", "helper"])
+def launch(request, monkeypatch):
+    if request.param == "helper":
+        helper = spawner.rvSpawner()
+        monkeypatch.setattr(spawner, "_spawner", helper)
+        yield
+        helper.stop()
+    else:
+        yield
+
+
+@pytest.fixture
+def commands(nemu_stub):
+    def commands(bin_name, *extra):
+        stub = nemu_stub + ["--log-commits"]
+        return [
+            stub + ["-b", bin_name],
+            stub + ["--log-stderr", "--boot", "-b", bin_name] + list(extra),
+        ]
+
+    return commands
+
+
+def test_traces_agree(launch, commands, write_image):
+    bin_name = write_image("t.bin", [0x00100093] * 50)
+    lockstep = rvLockstep(0x80000000)
+    divergence, results = lockstep.run(
+        ["a", "b"], commands(bin_name), ["stdout", "stderr"], 10
+    )
+    assert divergence is None
+    assert [r.returncode for r in results] == [0, 0]
+    assert lockstep.commits == 50
+
+
+def test_divergence_ends_both(launch, commands, write_image):
+    # Both models would commit `j .` forever after the divergence
+    bin_name = write_image("t.bin", [0x00100093] * 10 + [0x0000006F])
+    lockstep = rvLockstep(0x80000000)
+    divergence, results = lockstep.run(
+        ["a", "b"],
+        commands(bin_name, "--diverge", "4"),
+        ["stdout", "stderr"],
+        30,
+    )
+    assert divergence.startswith("lock-step divergence at commit 4")
+    assert all(r.killed and not r.timed_out for r in results)
+    assert all(r.elapsed < 30 for r in results)
+
+
+def test_timeout_is_no_divergence(launch, nemu_stub, write_image):
+    # Without a commit log the hang word just sleeps
+    bin_name = write_image("t.bin", [0x00100093, 0x0000006F])
+    cmds = [nemu_stub + ["-b", bin_name]] * 2
+    lockstep = rvLockstep(0x80000000)
+    divergence, results = lockstep.run(["a", "b"], cmds, ["stdout", "stderr"], 1)
+    assert divergence is None
+    assert all(r.timed_out and not r.killed for r in results)
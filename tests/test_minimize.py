@@ -0,0 +1,83 @@
+import threading
+
+import minimize
+from backends import MISMATCH, PASS
+from minimize import rvMinimizer
+
+NEEDED = {3, 17}
+
+
+class Candidate:
+    def __init__(self, keep):
+        self.keep = tuple(sorted(keep))
+        self.num_words = len(self.keep)
+
+
+def stub_minimizer(monkeypatch, workers, needed=NEEDED):
+    """A diff minimizer whose candidates reproduce iff they keep `needed`"""
+    minimizer = rvMinimizer("diff", workers=workers)
+    runs = []
+    lock = threading.Lock()
+
+    def run(slot, out, sim_input):
+        with lock:
+            runs.append((slot, sim_input.keep))
+        status = MISMATCH if needed <= set(sim_input.keep) else PASS
+        return status, [], None
+
+    monkeypatch.setattr(
+        minimize, "program_hash", lambda sim_input, data: sim_input.keep
+    )
+    monkeypatch.setattr(minimizer, "candidate", lambda sim_input, keep: Candidate(keep))
+    for slot in minimizer.slots:
+        monkeypatch.setattr(
+            minimizer.preprocessors[slot], "process", lambda *args: None
+        )
+        monkeypatch.setattr(minimizer.runners[slot], "run", run)
+    return minimizer, runs
+
+
+def test_ddmin_finds_needed_words(monkeypatch):
+    minimizer, runs = stub_minimizer(monkeypatch, 4)
+    keep = minimizer.ddmin(Candidate(range(32)), [], False)
+
+    assert keep == sorted(NEEDED)
+    assert minimizer.runs == len(runs)
+    # Every run went to a distinct scratch slot of its batch
+    assert {slot for slot, _ in runs} <= set(minimizer.slots)
+
+
+def test_ddmin_single_word(monkeypatch):
+    minimizer, _ = stub_minimizer(monkeypatch, 3, {5})
+    assert minimizer.ddmin(Candidate(range(9)), [], False) == [5]
+
+
+def test_batches_follow_workers(monkeypatch):
+    minimizer, runs = stub_minimizer(monkeypatch, 3)
+    subsets = [[0], [3, 17], [1], [2], [3, 17, 4], [5]]
+
+    found = minimizer.first_reproducing(Candidate(range(32)), [], False, subsets)
+    # The first batch already reproduces, the second one is never run
+    assert found == [3, 17]
+    assert sorted(runs) == [("min_0", (0,)), ("min_1", (3, 17)), ("min_2", (1,))]
+
+    runs.clear()
+    subsets = [[0], [1], [2], [4], [3, 17, 4], [3, 17]]
+    found = minimizer.first_reproducing(Candidate(range(32)), [], False, subsets)
+    # The earliest reproducing subset wins, not the first one to finish
+    assert found == [3, 17, 4]
+    # [0], [1] and [3, 17] have verdicts from the first call
+    assert sorted(runs) == [("min_0", (4,)), ("min_1", (3, 4, 17)), ("min_2", (2,))]
+
+
+def test_verdict_cache(monkeypatch):
+    minimizer, runs = stub_minimizer(monkeypatch, 2)
+    assert minimizer.reproduces("min_0", Candidate([3, 4]), [], False) is False
+    assert minimizer.reproduces("min_1", Candidate([3, 4]), [], False) is False
+    assert (minimizer.runs, minimizer.hits) == (1, 1)
+
+    assert minimizer.ddmin(Candidate(range(24)), [], False) == [3, 17]
+    keeps = [keep for _, keep in runs]
+    # ddmin retries subsets when its granularity changes, each is run once
+    assert len(keeps) == len(set(keeps))
+    assert minimizer.hits > 1
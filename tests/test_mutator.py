@@ -0,0 +1,121 @@
+import random
+import re
+
+from mutator import GENERATION, MAIN, MERGE, MUTATION, PREFIX, SUFFIX, rvMutator
+
+LABEL_REF_RE = re.compile(r", (_[pls])(\d+)\b")
+
+
+def defined_labels(sim_input):
+    labels = set()
+    for line in sim_input.get_prefix() + sim_input.get_insts() + sim_input.get_suffix():
+        label = line[:8].split(":")[0]
+        if ":" in line[:8]:
+            labels.add(label)
+    return labels
+
+
+def check_labels(sim_input):
+    labels = defined_labels(sim_input)
+    for part, words in [
+        (PREFIX, sim_input.prefix),
+        (MAIN, sim_input.words),
+        (SUFFIX, sim_input.suffix),
+    ]:
+        for n, word in enumerate(words):
+            assert word.label == n
+            for line in word.get_insts():
+                for m in LABEL_REF_RE.finditer(line):
+                    if m.group(1) == part:
+                        assert m.group(1) + m.group(2) in labels, line
+
+
+def test_campaign_mutates_corpus():
+    """update_phase/get/add_corpus/credit as the fuzz loop drives them"""
+    random.seed(1)
+    mutator = rvMutator()
+    mutator.num_words = 20
+    phases = {GENERATION: 0, MUTATION: 0, MERGE: 0}
+    for it in range(1, 201):
+        mutator.update_phase(it)
+        phases[mutator.phase] += 1
+        sim_input, data, generator_name = mutator.get()
+        check_labels(sim_input)
+        if mutator.phase != GENERATION:
+            assert sim_input.ops is not None
+        if random.random() < 0.3:
+            mutator.add_corpus(sim_input, random.randint(0, 3), 0.01, it)
+        mutator.credit(generator_name, sim_input, 0.01, random.randint(0, 1))
+
+    assert phases[MUTATION] > 0 and phases[MERGE] > 0
+    assert mutator.schedule.draws >= phases[MUTATION] + 2 * phases[MERGE]
+
+
+def test_no_mutation_without_corpus():
+    mutator = rvMutator()
+    for it in range(100):
+        mutator.update_phase(it)
+        assert mutator.phase == GENERATION
+
+
+def test_save_read_round_trip(tmp_path):
+    random.seed(2)
+    mutator = rvMutator()
+    mutator.num_words = 30
+    for _ in range(5):
+        mutator.add_corpus(mutator.get()[0])
+    mutator.phase = MUTATION
+    sim_input, data, _ = mutator.get()
+    name = str(tmp_path / "x.si")
+    sim_input.save(name, data)
+    read, read_data, _ = mutator.read_siminput(name)
+    assert read.get_insts() == sim_input.get_insts()
+    assert read.ints == sim_input.ints
+    assert read_data == data
+    check_labels(read)
+
+
+def test_delete_nop_keeps_interrupts_aligned():
+    random.seed(3)
+    mutator = rvMutator()
+    mutator.num_words = 30
+    sim_input, _, _ = mutator.get()
+    sim_input.ints = [i % 16 for i in range(len(sim_input.ints))]
+    mask = [n % 3 == 0 for n in range(sim_input.num_words)]
+
+    expected = []
+    k = 0
+    for word, nop in zip(sim_input.words, mask):
+        if not nop:
+            expected += sim_input.ints[k : k + word.len_insts]
+        k += word.len_insts
+
+    nop_input, _ = mutator.make_nop(sim_input, mask, MAIN)
+    assert len(nop_input.ints) == sum(w.len_insts for w in nop_input.words)
+    del_input, _ = mutator.delete_nop(nop_input)
+    assert del_input.ints == expected
+    assert del_input.num_words == mask.count(False)
+
+
+def test_sync_corpus_keeps_length_and_data(tmp_path):
+    random.seed(5)
+    other = rvMutator()
+    other.num_words = 10
+    si_dir = tmp_path / "corpus"
+    si_dir.mkdir()
+    for n in range(5):
+        sim_input, data, _ = other.get()
+        sim_input.save(str(si_dir / "id_{}.si".format(n)), data)
+
+    mutator = rvMutator(max_data_seeds=4)
+    num_words = mutator.num_words
+    mutator.sync_corpus(str(si_dir))
+    assert len(mutator.corpus) == 5
+    # Imported seeds don't grow the program length
+    assert mutator.num_words == num_words
+
+    datas = [list(mutator.random_data[si.get_seed()]) for si in mutator.corpus]
+    for _ in range(20):
+        mutator.get()
+    # The data seeds of corpus entries are never handed out again
+    assert [mutator.random_data[si.get_seed()] for si in mutator.corpus] == datas
@@ -0,0 +1,55 @@
+import pytest
+
+from nemu_server import rvNemuServer
+
+
+@pytest.fixture
+def stub(nemu_stub):
+    return " ".join(nemu_stub + ["--server"])
+
+
+def test_run_ok(stub, write_image):
+    server = rvNemuServer(stub)
+    ok = write_image("ok.bin", [0x00000013, 0x00100093])
+    try:
+        assert server.run(ok, 10) == 0
+        assert server.run(ok, 10) == 0
+    finally:
+        server.stop()
+    assert server.runs == 2
+    assert server.starts == 1
+
+
+def test_hang_restarts(stub, write_image):
+    server = rvNemuServer(stub)
+    hang = write_image("hang.bin", [0x00000013, 0x0000006F])
+    ok = write_image("ok.bin", [0x00000013])
+    try:
+        assert server.run(hang, 0.5) == -1
+        # The hung server was killed, the next test starts a new one
+        assert server.run(ok, 10) == 0
+    finally:
+        server.stop()
+    assert server.timeouts == 1
+    assert server.starts == 2
+    assert not server.disabled
+
+
+def test_missing_file(tmp_path, stub):
+    server = rvNemuServer(stub)
+    try:
+        assert server.run(str(tmp_path / "missing.bin"), 10) == 1
+    finally:
+        server.stop()
+
+
+def test_bad_reply_falls_back(write_image):
+    cmd = "sh -c 'echo READY; read line; echo EXIT garbage'"
+    server = rvNemuServer(cmd, max_restarts=2)
+    ok = write_image("ok.bin", [0x00000013])
+    assert server.run(ok, 10) is None
+    assert server.run(ok, 10) is None
+    # The caller spawns NEMU from now on
+    assert server.disabled
+    assert server.run(ok, 10) is None
+    assert server.starts == 2
@@ -0,0 +1,39 @@
+import json
+
+from operators import OPERATORS, rvOperatorSchedule
+
+
+def test_credit_counts_uses():
+    schedule = rvOperatorSchedule(period=10)
+    for _ in range(25):
+        schedule.credit([1, 0, 2, 0, 0], 1)
+    assert schedule.updates == 2
+    assert schedule.total_uses[0] == 20 and schedule.total_uses[2] == 40
+    assert schedule.uses[0] == 5
+
+
+def test_workers_merge_totals(tmp_path):
+    name = str(tmp_path / "ops.json")
+    first = rvOperatorSchedule(period=100)
+    second = rvOperatorSchedule(period=100)
+    assert not first.load(name) and not second.load(name)
+
+    for _ in range(10):
+        first.credit([1, 0, 0, 0, 0], 1)
+    for _ in range(4):
+        second.credit([0, 1, 0, 0, 1], 0)
+    first.save(name)
+    second.save(name)
+
+    state = json.load(open(name))
+    assert state["operators"] == OPERATORS
+    assert state["total_uses"] == [10, 4, 0, 0, 4]
+    assert state["total_finds"][0] == 10
+
+    # A later campaign starts from the merged totals and adds to them
+    third = rvOperatorSchedule(period=100)
+    assert third.load(name)
+    third.credit([0, 0, 1, 0, 0], 1)
+    third.save(name)
+    assert json.load(open(name))["total_uses"] == [10, 4, 1, 0, 4]
+    assert list(tmp_path.glob("*.tmp")) == []
@@ -0,0 +1,41 @@
+import os
+import random
+
+from coverage_map import rvCoverageMap
+from distill import write_meta
+from Fuzzer import RTL_SHIFT, nemu_feedback, sync_corpus
+from mutator import rvMutator
+from rtl_coverage import rvRtlCoverage
+
+
+def test_imported_bits_are_not_novel(tmp_path):
+    random.seed(6)
+    # Another worker admitted a seed with NEMU and RTL coverage
+    si_dir = tmp_path / "corpus" / "sim_input"
+    cov_dir = tmp_path / "corpus" / "coverage"
+    si_dir.mkdir(parents=True)
+    cov_dir.mkdir()
+    other = rvMutator()
+    other.num_words = 10
+    sim_input, data, _ = other.get()
+    sim_input.save(str(si_dir / "gen_0.si"), data)
+    # One bucket bit in each of the first two map bytes
+    nemu_bits = 0b10_0000_0001
+    rtl_bits = 0b110
+    write_meta(str(cov_dir / "gen_0.cov"), 0.01, 10, nemu_bits | rtl_bits << RTL_SHIFT)
+
+    coverage = rvCoverageMap(64, "difuzz_test_{}".format(os.getpid()))
+    rtl = rvRtlCoverage()
+    try:
+        sync_corpus(rvMutator(), str(si_dir), coverage, rtl)
+        assert coverage.virgin == nemu_bits
+        assert rtl.virgin == rtl_bits
+
+        # A run hitting only what the other worker found is no new test
+        coverage.reset()
+        coverage.map[0] = 1
+        coverage.map[1] = 2
+        assert coverage.collect() == nemu_bits
+        assert not nemu_feedback(coverage, 0.01)["novel"]
+    finally:
+        coverage.close()
@@ -0,0 +1,51 @@
+from timeouts import rvTimeouts
+
+
+def test_limit_follows_run_times():
+    timeouts = rvTimeouts(1.0, min_timeout=0.01, window=64, min_samples=32)
+    for _ in range(31):
+        timeouts.record("k", 0.02, False)
+    assert timeouts.timeout("k") == 1.0
+    timeouts.record("k", 0.02, False)
+    assert timeouts.timeout("k") == 0.02 * timeouts.factor
+
+
+def test_full_window_recomputes_every_few_samples():
+    timeouts = rvTimeouts(10.0, min_timeout=0.01, window=32, min_samples=32)
+    for _ in range(32):
+        timeouts.record("k", 0.02, False)
+    limit = timeouts.timeout("k")
+
+    # The window stays full, the limit is only re-derived every 8th sample
+    for _ in range(7):
+        timeouts.record("k", 1.0, False)
+        assert timeouts.timeout("k") == limit
+    timeouts.record("k", 1.0, False)
+    assert timeouts.timeout("k") == 1.0 * timeouts.factor
+
+
+def run(timeouts, key, seconds):
+    # A run that takes `seconds`, cut off at the class limit
+    limit = timeouts.timeout(key)
+    timed_out = seconds > limit
+    timeouts.record(key, limit if timed_out else seconds, timed_out)
+    return timed_out
+
+
+def test_limit_recovers_when_runs_get_slower():
+    timeouts = rvTimeouts(2.0, min_timeout=0.01, window=64, min_samples=32)
+    for _ in range(32):
+        run(timeouts, "k", 0.02)
+    assert timeouts.timeout("k") < 0.5
+
+    results = [run(timeouts, "k", 0.5) for _ in range(100)]
+    # Relaxed until the slower runs fit again, then they are samples
+    assert not any(results[-50:])
+    assert timeouts.timeout("k") >= 0.5
+
+
+def test_occasional_hangs_keep_the_limit():
+    timeouts = rvTimeouts(2.0, min_timeout=0.01, window=64, min_samples=32)
+    for i in range(200):
+        run(timeouts, "k", 100.0 if i % 4 == 3 else 0.02)
+    assert timeouts.timeout("k") == 0.02 * timeouts.factor
@@ -0,0 +1,97 @@
+import os
+import random
+
+import pytest
+
+from triage import rvTriage, signature
+
+ELF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "elf", "image.elf"
+)
+
+# Trimmed difftest output, the image is tests/fixtures/elf/image.S
+REG_DIFF = """\
+Core 0: ABORT at pc = 0x80000008
+     a0 different at pc = 0x0080000008, right= 0x0000000000000005, wrong = 0x0000000000000004
+"""
+PC_DIFF = """\
+Core 0: ABORT at pc = 0x80000018
+this_pc different at pc = 0x0080000018, right= 0x000000008000001c, wrong = 0x0000000080000020
+"""
+BAD_TRAP = """\
+Core 0: HIT BAD TRAP at pc = 0x80000024
+total guest instructions = 1,024
+"""
+MCAUSE_DIFF = """\
+ mcause different at pc = 0x0080000000, right= 0x0000000000000002, wrong = 0x0000000000000005
+"""
+TRAP_CAUSE = """\
+Core 0: ABORT at pc = 0x80000008
+exception cause = 0xd
+"""
+
+SIGNATURES = [
+    (REG_DIFF, ELF, "a0 differs, load"),
+    (PC_DIFF, ELF, "this_pc differs, op-imm"),
+    (BAD_TRAP, ELF, "Core #: HIT BAD TRAP at pc = #, jal"),
+    (MCAUSE_DIFF, ELF, "mcause differs, auipc"),
+    (TRAP_CAUSE, None, "Core #: ABORT at pc = #, cause 13"),
+    (
+        REG_DIFF.replace("0x0080000008", "0x0090000000"),
+        ELF,
+        "a0 differs, outside-image",
+    ),
+    ("", None, "exit -6"),
+    ("\n  \n", None, "exit -6"),
+]
+
+
+@pytest.mark.parametrize("output, elf_name, expected", SIGNATURES)
+def test_signature(output, elf_name, expected):
+    assert signature(output.encode(), elf_name, -6) == expected
+
+
+def test_signature_ignores_values():
+    other = REG_DIFF.replace("0x0000000000000005", "0x00000000deadbeef")
+    assert signature(other, ELF) == signature(REG_DIFF, ELF)
+
+
+def test_mcause_is_not_a_cause():
+    text = "Core 0: ABORT at pc = 0x80000008\nmcause = 0x2, mepc = 0x80000008\n"
+    assert "cause" not in signature(text)
+
+
+def test_unrecognized_output():
+    assert (
+        signature("Segmentation fault at step 1234\n") == "Segmentation fault at step #"
+    )
+
+
+def test_record_keeps_exemplars(tmp_path):
+    triage = rvTriage(str(tmp_path), 2, 0.1)
+    kept = [triage.record("a0 differs, load", f"id_{k}") for k in range(5)]
+    assert kept == [True, True, False, False, False]
+    assert triage.record("this_pc differs, jal", "id_5")
+
+    # The index is shared, a second worker sees the full bucket
+    other = rvTriage(str(tmp_path), 2, 0.1)
+    assert not other.record("a0 differs, load", "id_6")
+    index = other.load()
+    assert index["a0 differs, load"] == {"count": 6, "exemplars": ["id_0", "id_1"]}
+    assert index["this_pc differs, jal"]["count"] == 1
+    assert (triage.failures, triage.duplicates) == (6, 3)
+
+
+def test_should_run_keeps_min_rate(tmp_path):
+    random.seed(3)
+    triage = rvTriage(str(tmp_path), 2, 0.25)
+    key = ("rand", "P_M")
+    for _ in range(2000):
+        triage.ran(key, True)
+    assert triage.dup_share[key] > 0.99
+
+    runs = sum(triage.should_run(key) for _ in range(4000))
+    assert 0.22 < runs / 4000 < 0.28
+    assert triage.skipped == 4000 - runs
+    # Pairs without duplicates always run
+    assert all(triage.should_run(("rand", "U")) for _ in range(100))
@@ -0,0 +1,100 @@
+from collections import deque
+
+""" Adaptive emulator timeouts
+
+Passing tests finish in milliseconds, but a random jump into a loop keeps
+NEMU busy until the timeout.  Run times are recorded per (template, program
+size) class; once a class has enough samples its timeout is a high
+percentile of the recent run times times a safety factor, clamped to
+[min_timeout, max_timeout].  Classes without enough history use
+max_timeout, the old fixed NEMU_TIMEOUT.
+
+A timed-out run gives no sample, so a class whose runs got slower would
+keep timing out under its old limit.  After relax_after timeouts in a row
+the limit is doubled (up to max_timeout) until runs complete again.
+"""
+
+
+def size_class(sim_input):
+    # Programs within a factor of two of each other share a class
+    num = sim_input.num_prefix + sim_input.num_words + sim_input.num_suffix
+    return (sim_input.get_template(), num.bit_length())
+
+
+class rvTimeouts:
+    def __init__(
+        self,
+        max_timeout,
+        min_timeout=0.05,
+        percentile=0.99,
+        factor=4.0,
+        window=256,
+        min_samples=32,
+        relax_after=8,
+    ):
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.percentile = percentile
+        self.factor = factor
+        self.window = window
+        self.min_samples = min_samples
+        self.relax_after = relax_after
+
+        self.samples = {}
+        # Samples ever recorded per class, the window stops growing when full
+        self.counts = {}
+        self.limits = {}
+        # Timeouts in a row per class
+        self.streaks = {}
+
+        self.runs = 0
+        self.run_time = 0.0
+        self.timeouts = 0
+        self.timeout_time = 0.0
+
+    def timeout(self, key):
+        return self.limits.get(key, self.max_timeout)
+
+    def record(self, key, elapsed, timed_out):
+        self.runs += 1
+        self.run_time += elapsed
+        if timed_out:
+            self.timeouts += 1
+            self.timeout_time += elapsed
+            streak = self.streaks[key] = self.streaks.get(key, 0) + 1
+            if streak >= self.relax_after and key in self.limits:
+                self.limits[key] = min(self.limits[key] * 2, self.max_timeout)
+                self.streaks[key] = 0
+            return
+        self.streaks[key] = 0
+
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.window)
+        samples.append(elapsed)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+
+        # Re-derive the limit every few samples, a sort of the window is cheap
+        if count >= self.min_samples and count % 8 == 0:
+            ordered = sorted(samples)
+            pct = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+            self.limits[key] = min(
+                max(pct * self.factor, self.min_timeout), self.max_timeout
+            )
+
+    def report(self):
+        limits = ", ".join(
+            "t{}/{}w {:.3f}s".format(template, (1 << bits) - 1, limit)
+            for (template, bits), limit in sorted(self.limits.items())
+        )
+        return (
+            "{} runs, {} timeouts ({:.1f}%), {:.1f}s of {:.1f}s spent in timeouts, "
+            "limits: {}".format(
+                self.runs,
+                self.timeouts,
+                100 * self.timeouts / max(self.runs, 1),
+                self.timeout_time,
+                self.run_time,
+                limits or "none yet",
+            )
+        )
@@ -0,0 +1,176 @@
+import fcntl
+import json
+import os
+import random
+import re
+import struct
+
+from elf_reader import rvElf
+
+""" Mismatch triage
+
+An EMU failure is classified by a signature taken from the difftest
+output: which state differs (a register, the PC, a CSR), the class of the
+instruction at the divergent PC, and the trap cause if one is reported.
+Addresses and values are left out, they differ between random programs
+that hit the same bug.  When nothing is recognized the last output line
+with its numbers masked is the signature.
+
+Only the first TRIAGE_EXEMPLARS failures of a signature are saved; the
+index (<mismatch dir>/index.json) counts all of them.  It is shared by
+the workers of a campaign and kept across campaigns, under a file lock.
+
+EMU runs that only hit buckets already full are wasted, so the share of
+such runs is tracked per generator and template, and the EMU runs of a
+test from a (generator, template) pair are skipped with that share, down
+to a run rate of TRIAGE_MIN_EMU_RATE.
+"""
+
+DIFF_RE = re.compile(r"(\S+) different at pc = (0x[0-9a-fA-F]+)")
+PC_RE = re.compile(r"\bpc\s*[=:]\s*(0x[0-9a-fA-F]+)")
+CAUSE_RE = re.compile(r"\bcause\s*[=:]?\s*(0x[0-9a-fA-F]+|\d+)", re.IGNORECASE)
+NUMBER_RE = re.compile(r"0x[0-9a-fA-F]+|\d+")
+
+OPCODE_CLASSES = {
+    0x03: "load",
+    0x07: "fp-load",
+    0x0F: "fence",
+    0x13: "op-imm",
+    0x17: "auipc",
+    0x1B: "op-imm-32",
+    0x23: "store",
+    0x27: "fp-store",
+    0x2F: "amo",
+    0x33: "op",
+    0x37: "lui",
+    0x3B: "op-32",
+    0x43: "fmadd",
+    0x47: "fmsub",
+    0x4B: "fnmsub",
+    0x4F: "fnmadd",
+    0x53: "op-fp",
+    0x57: "vector",
+    0x63: "branch",
+    0x67: "jalr",
+    0x6F: "jal",
+    0x73: "system",
+}
+
+# Decay of the duplicate share, per EMU run of a (generator, template)
+DUP_DECAY = 0.98
+
+
+def inst_class(elf, pc):
+    try:
+        offset = elf.vaddr_to_offset(pc, 2)
+    except KeyError:
+        return "outside-image"
+    (half,) = struct.unpack_from("<H", elf.data, offset)
+    if half & 0x3 != 0x3:
+        return "compressed"
+    try:
+        (inst,) = struct.unpack_from("<I", elf.data, elf.vaddr_to_offset(pc, 4))
+    except KeyError:
+        return "outside-image"
+    return OPCODE_CLASSES.get(inst & 0x7F, "opcode-0x{:02x}".format(inst & 0x7F))
+
+
+def signature(output, elf_name=None, returncode=None):
+    """Bucket of an EMU failure from its output"""
+    text = output.decode(errors="replace") if isinstance(output, bytes) else output
+    parts = []
+    pc = None
+    m = DIFF_RE.search(text)
+    if m is not None:
+        parts.append("{} differs".format(m.group(1)))
+        pc = int(m.group(2), 16)
+    else:
+        m = PC_RE.search(text)
+        if m is not None:
+            pc = int(m.group(1), 16)
+            # The message around the PC, e.g. "HIT BAD TRAP at pc = #"
+            start = text.rfind("\n", 0, m.start()) + 1
+            end = text.find("\n", m.end())
+            line = text[start : end if end >= 0 else len(text)].strip()
+            parts.append(NUMBER_RE.sub("#", line)[:120])
+    m = CAUSE_RE.search(text)
+    if m is not None:
+        parts.append("cause {}".format(int(m.group(1), 0)))
+
+    if pc is not None and elf_name is not None:
+        try:
+            parts.append(inst_class(rvElf.load(elf_name), pc))
+        except (OSError, ValueError, struct.error):
+            pass
+
+    if not parts:
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if lines:
+            parts.append(NUMBER_RE.sub("#", lines[-1])[:120])
+        else:
+            parts.append("exit {}".format(returncode))
+    return ", ".join(parts)
+
+
+class rvTriage:
+    def __init__(self, mismatch_dir, exemplars, min_emu_rate):
+        self.index_name = f"{mismatch_dir}/index.json"
+        self.lock_name = f"{mismatch_dir}/.index.lock"
+        self.exemplars = exemplars
+        self.min_emu_rate = min_emu_rate
+
+        # (generator, template) -> decayed share of EMU runs hitting a full bucket
+        self.dup_share = {}
+        self.skipped = 0
+        self.failures = 0
+        self.duplicates = 0
+
+    def load(self):
+        try:
+            fd = open(self.index_name)
+            index = json.load(fd)
+            fd.close()
+        except (FileNotFoundError, ValueError):
+            index = {}
+        return index
+
+    def record(self, sig, name):
+        """Count a failure, True if it is one of the first exemplars of its bucket"""
+        lock = open(self.lock_name, "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index = self.load()
+            bucket = index.setdefault(sig, {"count": 0, "exemplars": []})
+            bucket["count"] += 1
+            keep = len(bucket["exemplars"]) < self.exemplars
+            if keep:
+                bucket["exemplars"].append(name)
+            tmp_name = self.index_name + ".tmp"
+            fd = open(tmp_name, "w")
+            json.dump(index, fd, indent=1, sort_keys=True)
+            fd.close()
+            os.replace(tmp_name, self.index_name)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+        self.failures += 1
+        if not keep:
+            self.duplicates += 1
+        return keep
+
+    def should_run(self, key):
+        rate = max(1.0 - self.dup_share.get(key, 0.0), self.min_emu_rate)
+        if random.random() < rate:
+            return True
+        self.skipped += 1
+        return False
+
+    def ran(self, key, duplicate):
+        share = self.dup_share.get(key, 0.0)
+        self.dup_share[key] = share * DUP_DECAY + (1 - DUP_DECAY) * duplicate
+
+    def report(self):
+        return "triage {} EMU failures, {} in full buckets, {} EMU runs skipped".format(
+            self.failures, self.duplicates, self.skipped
+        )
@@ -1,5 +1,7 @@
+import itertools
 import os
 import random
+import re
 
 from riscv_definitions import *
 
@@ -16,7 +18,22 @@ MAIN = "_l"
 SUFFIX = "_s"
 
 
+# Target of a label reference to the label after the last word of a part
+END = -1
+
+
 class Word:
+    """A word and its instructions
+
+    A populated word keeps its instructions as text with the jump and
+    symbol targets in its own part cut out, and a reference per target:
+    (instruction, position in the text, uid of the target word, label of
+    the target).  Words are renumbered by updating the labels of the
+    references, the text is only rendered when the instructions are read.
+    """
+
+    uids = itertools.count()
+
     def __init__(
         self,
         label: int,
@@ -30,6 +47,7 @@ class Word:
         label_prefix: str = "",
     ):
         self.label = label
+        self.uid = next(Word.uids)
         self.tpe = tpe
         self.insts = insts
         self.len_insts = len(insts)
@@ -42,7 +60,10 @@ class Word:
         self.operands = xregs + fregs + [imm[0] for imm in imms] + symbols
 
         self.populated = populated
-        self.ret_insts = []
+        self.part = None
+        self.lines = []
+        self.refs = []
+        self.ret_insts = None
 
     def pop_inst(self, inst, opvals):
         for op, val in opvals.items():
@@ -56,63 +77,70 @@ class Word:
                 op, self.label
             )
 
-        pop_insts = []
-        for inst in self.insts:
+        label_re = re.compile(", " + re.escape(part + self.label_prefix) + r"(\d+)")
+        self.part = part
+        self.lines = []
+        self.refs = []
+        for i, inst in enumerate(self.insts):
             p_inst = self.pop_inst(inst, opvals)
-            pop_insts.append(p_inst)
-
-        ret_insts = [
-            "{:<8}{:<42}".format(
-                part + self.label_prefix + str(self.label) + ":", pop_insts.pop(0)
-            )
-        ]
-
-        for i in range(len(pop_insts)):
-            ret_insts.append("{:8}{:<42}".format("", pop_insts.pop(0)))
+            m = label_re.search(p_inst)
+            if m is not None:
+                pos = m.start() + len(", ")
+                # Linked to the target word by link_labels
+                self.refs.append((i, pos, None, int(m.group(1))))
+                p_inst = p_inst[:pos] + p_inst[m.end() :]
+            self.lines.append(p_inst)
 
         self.populated = True
-        self.ret_insts = ret_insts
+        self.ret_insts = None
 
-    def reset_label(self, new_label, part):
-        old_label = self.label
-        self.label = new_label
+    def copy(self):
+        """Copy to relabel, everything but the labels is shared"""
+        word = Word.__new__(Word)
+        word.__dict__.update(self.__dict__)
+        return word
 
-        if self.populated:
-            self.ret_insts[0] = "{:8}{:<42}".format(
-                part + self.label_prefix + str(self.label) + ":", self.ret_insts[0][8:]
-            )
-            return (old_label, new_label)
-        else:
-            return None
-
-    def repop_label(self, label_map, max_label, part):
-        if self.populated:
-            for i in range(len(self.ret_insts)):
-                inst = self.ret_insts[i]
-                tmps = inst.split(", " + part)
+    def relabel(self, label, refs):
+        self.label = label
+        self.refs = refs
+        self.ret_insts = None
 
-                if len(tmps) > 1:
-                    label = tmps[1].split(" ")[0]
+    def render(self):
+        name = self.part + self.label_prefix
+        lines = self.lines
+        if self.refs:
+            lines = list(lines)
+            for i, pos, _, label in self.refs:
+                lines[i] = lines[i][:pos] + name + str(label) + lines[i][pos:]
 
-                    old = int(label)
-                    new = label_map.get(old, random.randint(self.label + 1, max_label))
+        ret_insts = ["{:<8}{:<42}".format(name + str(self.label) + ":", lines[0])]
+        ret_insts += ["{:8}{:<42}".format("", line) for line in lines[1:]]
 
-                    new_inst = inst[8:].replace(
-                        part + self.label_prefix + "{}".format(old),
-                        part + self.label_prefix + "{}".format(new),
-                    )
-                    inst = "{:<8}{:<50}".format(inst[0:8], new_inst)
-
-                    self.ret_insts[i] = inst
-        else:
-            return
+        return ret_insts
 
     def get_insts(self):
         assert self.populated, "Word is not populated"
 
+        if self.ret_insts is None:
+            self.ret_insts = self.render()
         return self.ret_insts
 
 
+def link_labels(words):
+    """Point the references of newly populated words, given by label, at
+    the words with those labels"""
+    uids = None
+    for word in words:
+        if not any(uid is None for _, _, uid, _ in word.refs):
+            continue
+        if uids is None:
+            uids = {w.label: w.uid for w in words}
+        word.refs = [
+            (i, pos, uids.get(label, END) if uid is None else uid, label)
+            for i, pos, uid, label in word.refs
+        ]
+
+
 def word_jal(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = CF_J
     insts = [syntax]